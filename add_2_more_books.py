@@ -4,7 +4,10 @@
 添加2本额外图书以达到20本的目标
 """
 
-from app import app, db, Book, Category
+from database import create_db_app
+from models import db, Book, Category
+
+app = create_db_app()
 from datetime import date
 
 def add_2_more_books():
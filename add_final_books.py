@@ -4,7 +4,10 @@
 添加最终的示例图书数据
 """
 
-from app import app, db, Book, Category
+from database import create_db_app
+from models import db, Book, Category
+
+app = create_db_app()
 from datetime import date
 
 def add_final_books():
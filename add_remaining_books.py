@@ -4,7 +4,10 @@
 添加剩余的示例图书数据（自然科学和心理学分类）
 """
 
-from app import app, db, Book, Category
+from database import create_db_app
+from models import db, Book, Category
+
+app = create_db_app()
 from datetime import date
 
 def add_remaining_books():
@@ -4,7 +4,10 @@
 为图书管理系统添加示例图书数据的脚本
 """
 
-from app import app, db, Book, Category
+from database import create_db_app
+from models import db, Book, Category
+
+app = create_db_app()
 from datetime import datetime, date
 
 def add_sample_books():
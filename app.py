@@ -1,94 +1,69 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
+from flask import current_app, render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, EmailField, IntegerField, DateField, TextAreaField, SelectField, BooleanField
-from wtforms.validators import DataRequired, Length, Email, EqualTo, NumberRange
-from datetime import datetime, timedelta
-import os
+from datetime import datetime
+from sqlalchemy.orm import joinedload, with_expression
+
+from database import create_db_app
+from forms import LoginForm, UserRegistrationForm, BookForm, BookImportForm, CategoryForm
+from models import db, Admin, User, Category, Book, BookCopy, BorrowRecord
+from pagination import SortKey, paginate, cursor_url, invalidate_counts_on_commit
+from stats import get_library_stats
+from identity import load_principal
+from cli import init_database
+from db_routing import init_read_routing, stick_to_primary, use_primary
+from circulation import (lend_book, return_record, return_records, release_user_loans, resolve_user, resolve_item,
+                         scan_item, SCAN_ACTIONS, OutOfStock, CopyUnavailable, AlreadyBorrowed, AlreadyReturned,
+                         NotBorrowed, UnknownUser, UnknownItem)
+from instrumentation import init_request_profiling, sql_report
+from metrics import init_metrics
+from search import apply_book_search, isbn_filter, substring_filter
+from record_filters import filter_borrow_records
+from exports import EXPORT_FORMATS, export_response
+from catalog_import import detect_format, import_books
+from copies import CopiesOnLoan, set_copy_count
+from isbn import normalize_isbn
 
-from config import Config
-from models import db, Admin, User, Category, Book, BorrowRecord
-
-app = Flask(__name__)
-app.config.from_object(Config)
-
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# 用户加载器
+# 视图函数先登记在这里，由 create_app() 注册到应用上，endpoint 名称即函数名
+_routes = []
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+# 借阅记录有写入时清除缓存的记录总数
+invalidate_counts_on_commit(BorrowRecord, 'borrow_records')
+
+# 用户加载器：会话 id 带类型前缀，只查询一张表，并可命中进程内身份缓存
 @login_manager.user_loader
 def load_user(user_id):
-    try:
-        user_id = int(user_id)
-        # 首先在管理员表中查找
-        admin = Admin.query.get(user_id)
-        if admin:
-            return admin
-
-        # 如果管理员表中没有，则在普通用户表中查找
-        user = User.query.get(user_id)
-        return user
-    except (ValueError, TypeError):
-        return None
-
-# 表单类定义
-class LoginForm(FlaskForm):
-    username = StringField('用户名', validators=[DataRequired()])
-    password = PasswordField('密码', validators=[DataRequired()])
-    remember = BooleanField('记住我')
-
-class UserRegistrationForm(FlaskForm):
-    username = StringField('用户名', validators=[DataRequired(), Length(min=4, max=20)])
-    email = EmailField('邮箱', validators=[DataRequired(), Email()])
-    full_name = StringField('姓名', validators=[DataRequired(), Length(max=100)])
-    phone = StringField('手机号', validators=[Length(max=20)])
-    address = TextAreaField('地址')
-    password = PasswordField('密码', validators=[DataRequired(), Length(min=6)])
-    password2 = PasswordField('确认密码', validators=[DataRequired(), EqualTo('password')])
-
-class BookForm(FlaskForm):
-    title = StringField('书名', validators=[DataRequired(), Length(max=200)])
-    author = StringField('作者', validators=[DataRequired(), Length(max=100)])
-    isbn = StringField('ISBN', validators=[DataRequired(), Length(max=20)])
-    publisher = StringField('出版社', validators=[Length(max=100)])
-    publication_date = DateField('出版日期')
-    quantity = IntegerField('数量', validators=[DataRequired(), NumberRange(min=1)])
-    description = TextAreaField('描述')
-    category_id = SelectField('分类', coerce=int, validators=[DataRequired()])
-
-class CategoryForm(FlaskForm):
-    name = StringField('分类名称', validators=[DataRequired(), Length(max=100)])
-    description = TextAreaField('描述')
-
-# 初始化数据库
-def initialize_database():
-    with app.app_context():
-        try:
-            db.create_all()
-            print("数据库表创建成功")
+    return load_principal(user_id)
 
-            # 创建默认管理员账户（ID为1）
-            if not Admin.query.filter_by(username='admin').first():
-                admin = Admin(username='admin', email='admin@library.com')
-                admin.set_password('admin123')
-                db.session.add(admin)
-                db.session.commit()
-                print("创建默认管理员: admin/admin123")
+# 模板中生成游标翻页链接
+def inject_pagination_helpers():
+    return {'cursor_url': cursor_url}
 
+# 初始化数据库（命令行：flask --app wsgi init-db）
+def initialize_database(flask_app=None):
+    with (flask_app or app).app_context():
+        try:
+            init_database()
             return True
         except Exception as e:
             print(f"数据库初始化失败: {e}")
             return False
 
 # 路由定义
-@app.route('/')
+@route('/')
 def index():
     return render_template('index.html')
 
 # 登录路由
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -114,7 +89,7 @@ def login():
     return render_template('login.html', form=form)
 
 # 用户注册路由
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     form = UserRegistrationForm()
     if form.validate_on_submit():
@@ -143,7 +118,7 @@ def register():
     return render_template('register.html', form=form)
 
 # 登出路由
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
@@ -151,24 +126,32 @@ def logout():
     return redirect(url_for('index'))
 
 # 管理员仪表板
-@app.route('/admin/dashboard')
+@route('/admin/dashboard')
 @login_required
 def admin_dashboard():
     if not isinstance(current_user, Admin):
         abort(403)
 
-    stats = {
-        'total_users': User.query.count(),
-        'total_books': Book.query.count(),
-        'total_categories': Category.query.count(),
-        'active_borrows': BorrowRecord.query.filter_by(status='borrowed').count(),
-        'overdue_records': BorrowRecord.query.filter(BorrowRecord.status == 'borrowed').filter(BorrowRecord.due_date < datetime.utcnow()).count()
-    }
+    # 统计数据由 library_stats 计数表维护，按主键读取一行
+    stats = get_library_stats()
 
     return render_template('admin/dashboard.html', stats=stats)
 
+# 慢查询报告：按 SQL 文本汇总本进程启动以来的语句耗时
+@route('/admin/sql-report')
+@login_required
+def admin_sql_report():
+    if not isinstance(current_user, Admin):
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    sort = request.args.get('sort', 'total')
+    if sort not in ('total', 'max', 'calls'):
+        sort = 'total'
+    return jsonify({'sort': sort, 'statements': sql_report.top(limit, sort)})
+
 # 用户仪表板
-@app.route('/user/dashboard')
+@route('/user/dashboard')
 @login_required
 def user_dashboard():
     # 如果是管理员但访问了用户仪表板，重定向到管理员仪表板
@@ -176,7 +159,9 @@ def user_dashboard():
         flash('您是管理员，已跳转到管理员页面', 'info')
         return redirect(url_for('admin_dashboard'))
 
-    user_borrows = BorrowRecord.query.filter_by(user_id=current_user.id, status='borrowed').limit(5).all()
+    user_borrows = BorrowRecord.query.options(joinedload(BorrowRecord.book)).filter_by(
+        user_id=current_user.id, status='borrowed'
+    ).limit(5).all()
     overdue_records = BorrowRecord.query.filter_by(user_id=current_user.id, status='borrowed').filter(BorrowRecord.due_date < datetime.utcnow()).count()
     total_borrows = BorrowRecord.query.filter_by(user_id=current_user.id, status='borrowed').count()
 
@@ -186,7 +171,7 @@ def user_dashboard():
                          total_borrows=total_borrows)
 
 # 管理员路由 - 用户管理
-@app.route('/admin/users')
+@route('/admin/users')
 @login_required
 def admin_users():
     if not isinstance(current_user, Admin):
@@ -194,6 +179,8 @@ def admin_users():
 
     # 获取搜索和分页参数
     page = request.args.get('page', 1, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '').strip()
     status = request.args.get('status', '')  # all, active, inactive
     sort_by = request.args.get('sort', 'created_date')  # created_date, username, email
@@ -203,15 +190,7 @@ def admin_users():
 
     # 搜索功能
     if search:
-        search_filter = f'%{search}%'
-        query = query.filter(
-            db.or_(
-                User.username.like(search_filter),
-                User.email.like(search_filter),
-                User.full_name.like(search_filter),
-                User.phone.like(search_filter)
-            )
-        )
+        query = query.filter(substring_filter(User, ('username', 'email', 'full_name', 'phone'), search))
 
     # 状态筛选 - 由于User模型没有is_active字段，暂时移除此功能
     # 如果需要，可以添加is_active字段到User模型
@@ -220,20 +199,18 @@ def admin_users():
     # elif status == 'inactive':
     #     query = query.filter(User.is_active == False)
 
-    # 排序
+    # 排序（以 id 作为最后的排序键，保证游标翻页位置唯一）
     if sort_by == 'username':
-        query = query.order_by(User.username)
+        sort_keys = [SortKey(User.username), SortKey(User.id)]
     elif sort_by == 'email':
-        query = query.order_by(User.email)
+        sort_keys = [SortKey(User.email), SortKey(User.id)]
     elif sort_by == 'created_date':
-        query = query.order_by(User.created_at.asc())
+        sort_keys = [SortKey(User.created_at), SortKey(User.id)]
     else:
-        query = query.order_by(User.id)
+        sort_keys = [SortKey(User.id)]
 
     # 分页查询
-    users = query.paginate(
-        page=page, per_page=10, error_out=False
-    )
+    users = paginate(query, sort_keys, page=page, per_page=10, after=after, before=before)
 
     # 保存搜索参数用于模板显示
     return render_template('admin/users.html',
@@ -242,7 +219,7 @@ def admin_users():
                          status=status,
                          sort_by=sort_by)
 
-@app.route('/admin/users/<int:user_id>/details')
+@route('/admin/users/<int:user_id>/details')
 @login_required
 def get_user_details(user_id):
     if not isinstance(current_user, Admin):
@@ -268,14 +245,16 @@ def get_user_details(user_id):
 
     return jsonify(user_details)
 
-@app.route('/admin/users/delete/<int:user_id>')
+@route('/admin/users/delete/<int:user_id>')
 @login_required
+@use_primary
 def delete_user(user_id):
     if not isinstance(current_user, Admin):
         abort(403)
 
     user = User.query.get_or_404(user_id)
-    # 删除用户相关的借阅记录
+    # 未归还的图书先放回库存，再删除用户相关的借阅记录
+    release_user_loans(user_id)
     BorrowRecord.query.filter_by(user_id=user_id).delete()
     db.session.delete(user)
     db.session.commit()
@@ -283,7 +262,7 @@ def delete_user(user_id):
     return redirect(url_for('admin_users'))
 
 # 图书管理路由
-@app.route('/admin/books')
+@route('/admin/books')
 @login_required
 def admin_books():
     if not isinstance(current_user, Admin):
@@ -291,25 +270,18 @@ def admin_books():
 
     # 获取搜索和筛选参数
     page = request.args.get('page', 1, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '').strip()
     category_id = request.args.get('category', '')
     status = request.args.get('status', '')  # all, available, borrowed
-    sort_by = request.args.get('sort', 'id')  # id, title, author, added_date
+    sort_by = request.args.get('sort', 'relevance')  # relevance, id, title, author, added_date
 
     # 构建基础查询
     query = Book.query
 
-    # 应用搜索筛选
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            db.or_(
-                Book.title.like(search_term),
-                Book.author.like(search_term),
-                Book.isbn.like(search_term),
-                Book.description.like(search_term)
-            )
-        )
+    # 应用搜索筛选（优先使用全文索引）
+    query, rank = apply_book_search(query, search)
 
     # 应用分类筛选
     if category_id and category_id != '':
@@ -326,23 +298,21 @@ def admin_books():
         query = query.filter(Book.quantity > Book.available_quantity)
 
     # 应用排序
-    if sort_by == 'id':
-        query = query.order_by(Book.id)
+    if sort_by == 'relevance' and rank is not None:
+        sort_keys = [SortKey(rank), SortKey(Book.id)]
     elif sort_by == 'title':
-        query = query.order_by(Book.title)
+        sort_keys = [SortKey(Book.title), SortKey(Book.id)]
     elif sort_by == 'author':
-        query = query.order_by(Book.author)
+        sort_keys = [SortKey(Book.author), SortKey(Book.id)]
     elif sort_by == 'added_date':
-        query = query.order_by(Book.id.desc())
+        sort_keys = [SortKey(Book.id, descending=True)]
     elif sort_by == 'isbn':
-        query = query.order_by(Book.isbn)
+        sort_keys = [SortKey(Book.isbn), SortKey(Book.id)]
     else:
-        query = query.order_by(Book.id)
+        sort_keys = [SortKey(Book.id)]
 
     # 执行分页查询
-    books = query.paginate(
-        page=page, per_page=10, error_out=False
-    )
+    books = paginate(query, sort_keys, page=page, per_page=10, after=after, before=before)
 
     # 获取所有分类用于筛选器（排除Ubuntu和Ubuntu-22.04分类）
     categories = Category.query.filter(Category.name.notin_(['Ubuntu', 'Ubuntu-22.04'])).order_by(Category.name).all()
@@ -355,7 +325,7 @@ def admin_books():
                          current_status=status,
                          current_sort=sort_by)
 
-@app.route('/admin/books/add', methods=['GET', 'POST'])
+@route('/admin/books/add', methods=['GET', 'POST'])
 @login_required
 def add_book():
     if not isinstance(current_user, Admin):
@@ -365,7 +335,8 @@ def add_book():
     form.category_id.choices = [(c.id, c.name) for c in Category.query.filter(Category.name.notin_(['Ubuntu', 'Ubuntu-22.04'])).all()]
 
     if form.validate_on_submit():
-        if Book.query.filter_by(isbn=form.isbn.data).first():
+        # 按规范化的 ISBN 查重，978-7-... 和不带连字符的写法视为同一本书
+        if Book.query.filter_by(isbn13=normalize_isbn(form.isbn.data)).first():
             flash('ISBN已存在！', 'danger')
             return render_template('admin/add_book.html', form=form)
 
@@ -387,7 +358,26 @@ def add_book():
 
     return render_template('admin/add_book.html', form=form)
 
-@app.route('/admin/books/edit/<int:book_id>', methods=['GET', 'POST'])
+# 上传 CSV / JSONL 文件批量导入图书，页面上显示导入结果和错误行
+@route('/admin/books/import', methods=['GET', 'POST'])
+@login_required
+def import_books_upload():
+    if not isinstance(current_user, Admin):
+        abort(403)
+
+    form = BookImportForm()
+    report = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        report = import_books(upload.stream, detect_format(upload.filename))
+        if report.inserted:
+            stick_to_primary()
+        current_app.logger.info(f'管理员 {current_user.username} 导入图书 {upload.filename}：{report.summary()}')
+        flash(report.summary(), 'success' if report.inserted and not report.error_count else 'warning')
+
+    return render_template('admin/import_books.html', form=form, report=report)
+
+@route('/admin/books/edit/<int:book_id>', methods=['GET', 'POST'])
 @login_required
 def edit_book(book_id):
     if not isinstance(current_user, Admin):
@@ -398,30 +388,41 @@ def edit_book(book_id):
     form.category_id.choices = [(c.id, c.name) for c in Category.query.filter(Category.name.notin_(['Ubuntu', 'Ubuntu-22.04'])).all()]
 
     if form.validate_on_submit():
+        duplicate = Book.query.filter(Book.isbn13 == normalize_isbn(form.isbn.data), Book.id != book.id).first()
+        if duplicate:
+            flash(f'ISBN已被《{duplicate.title}》使用！', 'danger')
+            return render_template('admin/edit_book.html', form=form, book=book)
+        # 册数的增减落实到副本：新增可借副本或注销可借副本，可借数量随之调整
+        try:
+            set_copy_count(book, form.quantity.data)
+        except CopiesOnLoan as e:
+            flash(f'当前有 {e.borrowed} 册借出，数量不能少于 {e.borrowed}！', 'danger')
+            return render_template('admin/edit_book.html', form=form, book=book)
         form.populate_obj(book)
-        book.available_quantity = book.quantity - (book.quantity - book.available_quantity)
         db.session.commit()
         flash('图书更新成功！', 'success')
         return redirect(url_for('admin_books'))
 
     return render_template('admin/edit_book.html', form=form, book=book)
 
-@app.route('/admin/books/delete/<int:book_id>')
+@route('/admin/books/delete/<int:book_id>')
 @login_required
+@use_primary
 def delete_book(book_id):
     if not isinstance(current_user, Admin):
         abort(403)
 
     book = Book.query.get_or_404(book_id)
-    # 删除相关的借阅记录
+    # 删除相关的借阅记录和副本
     BorrowRecord.query.filter_by(book_id=book_id).delete()
+    BookCopy.query.filter_by(book_id=book_id).delete()
     db.session.delete(book)
     db.session.commit()
     flash('图书删除成功！', 'success')
     return redirect(url_for('admin_books'))
 
 # 分类管理路由
-@app.route('/admin/categories')
+@route('/admin/categories')
 @login_required
 def admin_categories():
     if not isinstance(current_user, Admin):
@@ -430,31 +431,31 @@ def admin_categories():
     # 获取搜索参数
     search = request.args.get('search', '').strip()
 
-    # 构建基础查询
-    query = Category.query
+    # 一次 GROUP BY 查询取出所有分类及其图书数量，不加载图书对象
+    categories = (Category.query
+                  .outerjoin(Book, Book.category_id == Category.id)
+                  .group_by(Category.id)
+                  .options(with_expression(Category.book_count, db.func.count(Book.id)))
+                  .all())
 
     # 搜索功能
+    filtered_categories = None
     if search:
         search_filter = f'%{search}%'
-        query = query.filter(
+        matched_ids = {category_id for (category_id,) in db.session.query(Category.id).filter(
             db.or_(
                 Category.name.like(search_filter),
                 Category.description.like(search_filter)
             )
-        )
-
-    # 执行查询
-    categories = query.all()
-
-    # 过滤后的分类（用于搜索结果显示）
-    filtered_categories = categories if search else None
+        )}
+        filtered_categories = [category for category in categories if category.id in matched_ids]
 
     return render_template('admin/categories.html',
-                         categories=Category.query.all(),  # 所有分类用于统计
-                         filtered_categories=filtered_categories if search else None,
+                         categories=categories,  # 所有分类用于统计
+                         filtered_categories=filtered_categories,
                          search=search)
 
-@app.route('/admin/categories/add', methods=['GET', 'POST'])
+@route('/admin/categories/add', methods=['GET', 'POST'])
 @login_required
 def add_category():
     if not isinstance(current_user, Admin):
@@ -477,13 +478,18 @@ def add_category():
 
     return render_template('admin/add_category.html', form=form)
 
-@app.route('/admin/categories/edit/<int:category_id>', methods=['GET', 'POST'])
+@route('/admin/categories/edit/<int:category_id>', methods=['GET', 'POST'])
 @login_required
 def edit_category(category_id):
     if not isinstance(current_user, Admin):
         abort(403)
 
-    category = Category.query.get_or_404(category_id)
+    category = (Category.query
+                .outerjoin(Book, Book.category_id == Category.id)
+                .filter(Category.id == category_id)
+                .group_by(Category.id)
+                .options(with_expression(Category.book_count, db.func.count(Book.id)))
+                .first_or_404())
     form = CategoryForm(obj=category)
 
     if form.validate_on_submit():
@@ -492,18 +498,23 @@ def edit_category(category_id):
         flash('分类更新成功！', 'success')
         return redirect(url_for('admin_categories'))
 
-    return render_template('admin/edit_category.html', form=form, category=category)
+    # 侧栏只展示最新添加的 5 本
+    recent_books = (Book.query.filter_by(category_id=category_id)
+                    .order_by(Book.created_at.desc(), Book.id.desc())
+                    .limit(5).all())
+    return render_template('admin/edit_category.html', form=form, category=category, recent_books=recent_books)
 
-@app.route('/admin/categories/delete/<int:category_id>')
+@route('/admin/categories/delete/<int:category_id>')
 @login_required
+@use_primary
 def delete_category(category_id):
     if not isinstance(current_user, Admin):
         abort(403)
 
     category = Category.query.get_or_404(category_id)
     # 检查是否有关联的图书
-    if category.books:
-        book_count = len(category.books)
+    book_count = Book.query.filter_by(category_id=category_id).count()
+    if book_count:
         flash(f'该分类下还有 {book_count} 本图书，无法删除！请先删除或移动这些图书。', 'danger')
         return redirect(url_for('admin_categories'))
 
@@ -512,25 +523,26 @@ def delete_category(category_id):
     flash('分类删除成功！', 'success')
     return redirect(url_for('admin_categories'))
 
-@app.route('/admin/categories/force-delete/<int:category_id>')
+@route('/admin/categories/force-delete/<int:category_id>')
 @login_required
+@use_primary
 def force_delete_category(category_id):
     if not isinstance(current_user, Admin):
         abort(403)
 
     category = Category.query.get_or_404(category_id)
 
-    if category.books:
+    book_count = Book.query.filter_by(category_id=category_id).count()
+    if book_count:
         # 找一个默认分类（通常是第一个分类）
         default_category = Category.query.filter(Category.id != category_id).first()
         if not default_category:
             flash('没有其他分类可以接收这些图书，请先创建一个新分类！', 'danger')
             return redirect(url_for('admin_categories'))
 
-        # 将所有关联的图书移动到默认分类
-        book_count = len(category.books)
-        for book in category.books:
-            book.category_id = default_category.id
+        # 将所有关联的图书移动到默认分类（单条 UPDATE）
+        Book.query.filter_by(category_id=category_id).update(
+            {Book.category_id: default_category.id}, synchronize_session=False)
 
         flash(f'已将 {book_count} 本图书移动到分类 "{default_category.name}"。', 'warning')
 
@@ -541,129 +553,26 @@ def force_delete_category(category_id):
     return redirect(url_for('admin_categories'))
 
 # 借阅记录管理路由
-@app.route('/admin/records')
+@route('/admin/records')
 @login_required
 def admin_borrow_records():
     if not isinstance(current_user, Admin):
         abort(403)
 
-    # 获取搜索和筛选参数
     page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '').strip()
-    status = request.args.get('status', '')
-    search_type = request.args.get('search_type', 'all')
-    days = request.args.get('days', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
-    sort_by = request.args.get('sort_by', 'borrow_date')
-    due_filter = request.args.get('due_filter', '')  # 新增：到期日期筛选参数
-
-    # 构建基础查询
-    query = BorrowRecord.query
-
-    # 应用搜索筛选
-    if search:
-        search_term = f"%{search}%"
-        if search_type == 'book':
-            query = query.join(Book, BorrowRecord.book_id == Book.id).filter(Book.title.like(search_term))
-        elif search_type == 'user':
-            query = query.join(User, BorrowRecord.user_id == User.id).filter(
-                db.or_(
-                    User.username.like(search_term),
-                    User.full_name.like(search_term),
-                    User.email.like(search_term)
-                )
-            )
-        elif search_type == 'isbn':
-            query = query.join(Book).filter(Book.isbn.like(search_term))
-        elif search_type == 'id':
-            try:
-                record_id = int(search)
-                query = query.filter(BorrowRecord.id == record_id)
-            except ValueError:
-                pass
-        else:  # all
-            query = query.join(Book, BorrowRecord.book_id == Book.id).join(User, BorrowRecord.user_id == User.id).filter(
-                db.or_(
-                    Book.title.like(search_term),
-                    Book.author.like(search_term),
-                    Book.isbn.like(search_term),
-                    User.username.like(search_term),
-                    User.full_name.like(search_term),
-                    User.email.like(search_term)
-                )
-            )
-
-    # 应用状态筛选
-    if status == 'borrowed':
-        query = query.filter(BorrowRecord.status == 'borrowed')
-    elif status == 'returned':
-        query = query.filter(BorrowRecord.status == 'returned')
-    elif status == 'overdue':
-        query = query.filter(
-            BorrowRecord.status == 'borrowed',
-            BorrowRecord.due_date < datetime.utcnow()
-        )
-
-    # 应用时间筛选
-    if days:
-        try:
-            days_num = int(days)
-            start_date = datetime.utcnow() - timedelta(days=days_num)
-            query = query.filter(BorrowRecord.borrow_date >= start_date)
-        except ValueError:
-            pass
-    elif date_from:
-        try:
-            start_date = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(BorrowRecord.borrow_date >= start_date)
-        except ValueError:
-            pass
+    after = request.args.get('after')
+    before = request.args.get('before')
 
-    if date_to:
-        try:
-            end_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(BorrowRecord.borrow_date < end_date)
-        except ValueError:
-            pass
-
-    # 应用到期日期筛选
-    if due_filter == 'today':
-        # 今日到期：从今天开始到明天结束
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = today_start + timedelta(days=1)
-        query = query.filter(
-            BorrowRecord.status == 'borrowed',
-            BorrowRecord.due_date >= today_start,
-            BorrowRecord.due_date < today_end
-        )
-    elif due_filter == 'this_week':
-        # 本周到期：从本周一开始到本周日结束
-        now = datetime.utcnow()
-        days_since_monday = now.weekday()
-        week_start = (now - timedelta(days=days_since_monday)).replace(hour=0, minute=0, second=0, microsecond=0)
-        week_end = week_start + timedelta(days=7)
-        query = query.filter(
-            BorrowRecord.status == 'borrowed',
-            BorrowRecord.due_date >= week_start,
-            BorrowRecord.due_date < week_end
-        )
-
-
-    # 应用排序
-    if sort_by == 'borrow_date':
-        query = query.order_by(BorrowRecord.borrow_date.desc())
-    elif sort_by == 'due_date':
-        query = query.order_by(BorrowRecord.due_date.desc())
-    elif sort_by == 'return_date':
-        query = query.order_by(BorrowRecord.return_date.desc())
-    elif sort_by == 'user_name':
-        query = query.join(User, BorrowRecord.user_id == User.id).order_by(User.full_name)
-    else:
-        query = query.order_by(BorrowRecord.borrow_date.desc())
+    # 构建基础查询，一次性加载每行用到的图书、分类和用户，避免逐行懒加载
+    query = BorrowRecord.query.options(
+        joinedload(BorrowRecord.book).joinedload(Book.category),
+        joinedload(BorrowRecord.user)
+    )
+    query, sort_keys, count_key = filter_borrow_records(query, request.args)
 
     # 执行分页查询
-    records = query.paginate(page=page, per_page=10, error_out=False)
+    records = paginate(query, sort_keys, page=page, per_page=10, after=after, before=before,
+                       count_key=count_key, estimate=True)
 
     # 计算统计数据
     all_records = records.items
@@ -683,14 +592,31 @@ def admin_borrow_records():
         elif record.status == 'returned':
             returned_count += 1
 
+    # 导出链接沿用当前筛选条件
+    export_args = {key: value for key, value in request.args.items() if key not in ('page', 'after', 'before')}
+
     return render_template('admin/borrow_records.html',
                          records=records,
                          datetime=datetime,
                          overdue_count=overdue_count,
                          borrowed_count=borrowed_count,
-                         returned_count=returned_count)
+                         returned_count=returned_count,
+                         export_args=export_args)
 
-@app.route('/admin/records/return/<int:record_id>', methods=['POST'])
+# 按借阅记录页面的筛选条件流式导出全部匹配记录：format=csv|jsonl，gzip=1 时压缩
+@route('/admin/records/export')
+@login_required
+def export_borrow_records():
+    if not isinstance(current_user, Admin):
+        abort(403)
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    query, sort_keys, _ = filter_borrow_records(BorrowRecord.query, request.args)
+    return export_response(query, sort_keys, export_format, compress=request.args.get('gzip') == '1')
+
+@route('/admin/records/return/<int:record_id>', methods=['POST'])
 @login_required
 def admin_return_book(record_id):
     """管理员标记图书归还"""
@@ -701,27 +627,19 @@ def admin_return_book(record_id):
         # 获取借阅记录
         record = BorrowRecord.query.get_or_404(record_id)
 
-        # 检查是否已经归还
-        if record.return_date is not None:
+        # 更新借阅记录和可借数量；已经归还（包括被其他请求抢先归还）时返回 400
+        try:
+            return_record(record)
+        except AlreadyReturned:
+            return_date = record.return_date
             return jsonify({
                 'success': False,
-                'message': f'该图书已于{record.return_date.strftime("%Y-%m-%d %H:%M")}归还'
+                'message': f'该图书已于{return_date.strftime("%Y-%m-%d %H:%M")}归还' if return_date else '该图书已归还'
             }), 400
-
-        # 获取图书并更新可借数量
         book = record.book
-        if book.available_quantity < book.quantity:
-            book.available_quantity += 1
-
-        # 更新借阅记录
-        record.return_date = datetime.utcnow()
-        record.status = 'returned'
-
-        # 提交到数据库
-        db.session.commit()
 
         # 记录操作日志
-        app.logger.info(f'管理员 {current_user.username} 标记归还：用户 {record.user.username} 归还图书 {book.title}')
+        current_app.logger.info(f'管理员 {current_user.username} 标记归还：用户 {record.user.username} 归还图书 {book.title}')
 
         return jsonify({
             'success': True,
@@ -733,10 +651,10 @@ def admin_return_book(record_id):
 
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'标记归还失败: {str(e)}')
+        current_app.logger.error(f'标记归还失败: {str(e)}')
         return jsonify({'success': False, 'message': '操作失败，请重试'}), 500
 
-@app.route('/admin/records/batch-return', methods=['POST'])
+@route('/admin/records/batch-return', methods=['POST'])
 @login_required
 def admin_batch_return_books():
     """管理员批量标记图书归还"""
@@ -750,38 +668,15 @@ def admin_batch_return_books():
         if not record_ids:
             return jsonify({'success': False, 'message': '请选择要归还的记录'}), 400
 
-        success_count = 0
-        error_messages = []
-
-        for record_id in record_ids:
-            try:
-                record = BorrowRecord.query.get(record_id)
-                if not record:
-                    error_messages.append(f'记录ID {record_id} 不存在')
-                    continue
-
-                if record.return_date is not None:
-                    error_messages.append(f'《{record.book.title}》已归还，跳过')
-                    continue
-
-                # 更新图书数量
-                if record.book.available_quantity < record.book.quantity:
-                    record.book.available_quantity += 1
-
-                # 更新借阅记录
-                record.return_date = datetime.utcnow()
-                record.status = 'returned'
-
-                success_count += 1
-
-            except Exception as e:
-                error_messages.append(f'处理记录ID {record_id} 时出错: {str(e)}')
-
-        # 提交所有更改
-        db.session.commit()
+        # 一次 IN 查询取出记录和图书，批量 UPDATE 归还，按图书分组恢复库存
+        success_count, failures = return_records(record_ids)
+        error_messages = [
+            f'记录ID {record_id} 不存在' if title is None else f'《{title}》已归还，跳过'
+            for record_id, title in failures
+        ]
 
         # 记录批量操作日志
-        app.logger.info(f'管理员 {current_user.username} 批量归还：成功 {success_count} 条记录')
+        current_app.logger.info(f'管理员 {current_user.username} 批量归还：成功 {success_count} 条记录')
 
         return jsonify({
             'success': True,
@@ -792,26 +687,73 @@ def admin_batch_return_books():
 
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'批量归还失败: {str(e)}')
+        current_app.logger.error(f'批量归还失败: {str(e)}')
         return jsonify({'success': False, 'message': '批量操作失败，请重试'}), 500
 
+@route('/admin/circulation/scan', methods=['POST'])
+@login_required
+@use_primary
+def admin_circulation_scan():
+    """借还台扫码借还：{"user": 读者 id/用户名/邮箱, "item": ISBN 或副本条码, "action": "auto"/"checkout"/"return"}"""
+    if not isinstance(current_user, Admin):
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('user') or not data.get('item'):
+        return jsonify({'success': False, 'message': '请求应包含 user 和 item'}), 400
+    action = data.get('action') or 'auto'
+    if action not in SCAN_ACTIONS:
+        return jsonify({'success': False, 'message': f'未知的操作：{action}'}), 400
+
+    # 提交后 current_user 会过期，先取出用户名，避免写日志时再查一次
+    operator = current_user.username
+    # 读者和图书都按唯一索引解析，借还本身是带条件的 UPDATE
+    try:
+        user = resolve_user(str(data['user']))
+        book = resolve_item(str(data['item']))
+        action, record = scan_item(user.id, book.id, action, copy_id=book.copy_id)
+    except UnknownUser:
+        return jsonify({'success': False, 'message': '读者不存在'}), 404
+    except UnknownItem:
+        return jsonify({'success': False, 'message': '图书不存在'}), 404
+    except CopyUnavailable:
+        return jsonify({'success': False, 'message': f'这一册《{book.title}》已借出或已注销'}), 409
+    except OutOfStock:
+        return jsonify({'success': False, 'message': f'《{book.title}》暂无库存'}), 409
+    except AlreadyBorrowed:
+        return jsonify({'success': False, 'message': f'{user.full_name} 已借阅《{book.title}》'}), 409
+    except (NotBorrowed, AlreadyReturned):
+        return jsonify({'success': False, 'message': f'{user.full_name} 没有在借《{book.title}》'}), 409
+
+    current_app.logger.info(f'管理员 {operator} 扫码{"借出" if action == "checkout" else "归还"}：'
+                            f'用户 {user.id} 图书 {book.id}')
+    return jsonify({
+        'success': True,
+        'action': action,
+        'message': f'{user.full_name}{"借出" if action == "checkout" else "归还"}《{book.title}》',
+        'record_id': record.id,
+        'copy_id': record.copy_id,
+        'due_date': record.due_date.strftime('%Y-%m-%d'),
+    })
+
 # 用户图书浏览
-@app.route('/books')
+@route('/books')
 @login_required
 def browse_books():
     category_id = request.args.get('category_id', type=int)
     page = request.args.get('page', 1, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '')
 
     query = Book.query
     if category_id:
         query = query.filter_by(category_id=category_id)
-    if search:
-        query = query.filter(Book.title.contains(search) | Book.author.contains(search))
+    query, rank = apply_book_search(query, search, columns=('title', 'author'))
+    sort_keys = [SortKey(rank), SortKey(Book.id)] if rank is not None else [SortKey(Book.id)]
 
-    books = query.filter(Book.available_quantity > 0).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    books = paginate(query.filter(Book.available_quantity > 0), sort_keys,
+                     page=page, per_page=10, after=after, before=before)
     categories = Category.query.all()
 
     return render_template('user/browse_books.html',
@@ -821,46 +763,32 @@ def browse_books():
                          search=search)
 
 # 用户借阅图书
-@app.route('/books/borrow/<int:book_id>')
+@route('/books/borrow/<int:book_id>')
 @login_required
+@use_primary
 def borrow_book(book_id):
     if isinstance(current_user, Admin):
         abort(403)
 
-    book = Book.query.get_or_404(book_id)
+    Book.query.get_or_404(book_id)
 
-    if book.available_quantity <= 0:
+    # 库存检查和扣减由一条带条件的 UPDATE 完成，并发借阅不会超借
+    try:
+        lend_book(current_user.id, book_id)
+    except OutOfStock:
         flash('该图书暂无库存！', 'danger')
         return redirect(url_for('browse_books'))
-
-    # 检查用户是否已经借阅了这本书且还未归还
-    existing_record = BorrowRecord.query.filter_by(
-        user_id=current_user.id,
-        book_id=book_id,
-        status='borrowed'
-    ).first()
-
-    if existing_record:
+    except AlreadyBorrowed:
         flash('您已经借阅了这本书！', 'warning')
         return redirect(url_for('browse_books'))
 
-    # 创建借阅记录
-    borrow_record = BorrowRecord(
-        user_id=current_user.id,
-        book_id=book_id,
-        due_date=datetime.utcnow() + timedelta(days=30)  # 30天归还期限
-    )
-
-    book.available_quantity -= 1
-    db.session.add(borrow_record)
-    db.session.commit()
-
     flash('图书借阅成功！请按时归还。', 'success')
     return redirect(url_for('browse_books'))
 
 # 用户归还图书
-@app.route('/books/return/<int:record_id>')
+@route('/books/return/<int:record_id>')
 @login_required
+@use_primary
 def return_book(record_id):
     if isinstance(current_user, Admin):
         abort(403)
@@ -870,23 +798,17 @@ def return_book(record_id):
     if record.user_id != current_user.id:
         abort(403)
 
-    if record.status == 'returned':
+    try:
+        return_record(record)
+    except AlreadyReturned:
         flash('该图书已经归还！', 'warning')
         return redirect(url_for('browse_books'))
 
-    # 更新借阅记录
-    record.return_date = datetime.utcnow()
-    record.status = 'returned'
-
-    # 增加图书库存
-    record.book.available_quantity += 1
-    db.session.commit()
-
     flash('图书归还成功！', 'success')
     return redirect(url_for('browse_books'))
 
 # 用户借阅历史
-@app.route('/user/borrow-history')
+@route('/user/borrow-history')
 @login_required
 def borrow_history():
     if isinstance(current_user, Admin):
@@ -894,22 +816,19 @@ def borrow_history():
 
     # 获取查询参数
     page = request.args.get('page', 1, type=int)
+    after = request.args.get('after')
+    before = request.args.get('before')
     search = request.args.get('search', '')
     status = request.args.get('status', '')
 
     # 构建查询
-    query = BorrowRecord.query.filter_by(user_id=current_user.id)
+    query = BorrowRecord.query.options(joinedload(BorrowRecord.book)).filter_by(user_id=current_user.id)
 
     # 搜索条件
     if search:
-        search_filter = f'%{search}%'
+        condition = isbn_filter(search)
         query = query.join(Book).filter(
-            db.or_(
-                Book.title.like(search_filter),
-                Book.author.like(search_filter),
-                Book.isbn.like(search_filter)
-            )
-        )
+            condition if condition is not None else substring_filter(Book, ('title', 'author', 'isbn'), search))
 
     # 状态筛选
     if status == 'borrowed':
@@ -924,9 +843,8 @@ def borrow_history():
         )
 
     # 分页查询
-    records = query.order_by(BorrowRecord.created_at.desc()).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    sort_keys = [SortKey(BorrowRecord.created_at, descending=True), SortKey(BorrowRecord.id, descending=True)]
+    records = paginate(query, sort_keys, page=page, per_page=10, after=after, before=before)
 
     return render_template('user/borrow_history.html',
                          records=records,
@@ -934,7 +852,7 @@ def borrow_history():
                          status=status)
 
 # 用户个人资料
-@app.route('/user/profile', methods=['GET', 'POST'])
+@route('/user/profile', methods=['GET', 'POST'])
 @login_required
 def user_profile():
     if isinstance(current_user, Admin):
@@ -957,5 +875,26 @@ def user_profile():
 
     return render_template('user/profile.html', borrow_records=borrow_records)
 
+def create_app(config=None):
+    """创建应用；config 为覆盖 Config 的配置字典。只构建应用对象，不连接数据库"""
+    app = create_db_app(config, __name__)
+
+    # GET 请求的查询走只读 engine
+    init_read_routing(app, db)
+
+    # 记录每个请求的 SQL 语句数和耗时，慢请求写日志
+    init_request_profiling(app)
+
+    # /metrics：请求延迟、SQL 语句数、连接池和借阅指标
+    init_metrics(app)
+
+    login_manager.init_app(app)
+    app.context_processor(inject_pagination_helpers)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+借还台扫码吞吐量测试
+
+生成一份测试数据库并启动 gunicorn，模拟多个借还台同时扫码：每个借还台每隔 --interval 秒
+（默认 0.2 秒）向 /admin/circulation/scan 提交一次 (读者, ISBN)，借出一本随机的书，
+下一次扫码归还上一次借出的书。请求按固定节拍发出，不等上一个响应，服务器跟不上时延迟会持续上升。
+比较不同借还台数量下实际完成的扫码数、延迟分位数和被拒绝（409，无库存等）的扫码数。
+
+    python benchmark_circulation.py --desks 10 50 100 --workers 2 --seconds 10
+
+需要安装 gunicorn（仅支持 Linux / macOS）。
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark_workers import ROOT, free_port, wait_for_port, login
+from isbn import isbn13_check_digit
+
+SCAN_URL = '/admin/circulation/scan'
+USERS = 1000
+BOOKS = 2000
+
+
+def book_isbn(book_id):
+    """与 generate_dataset.py 生成的 ISBN 相同"""
+    isbn = f'978{book_id:09d}'
+    return isbn + isbn13_check_digit(isbn)
+
+
+def desk(port, cookie, interval, seconds, desk_id, results):
+    """一个借还台：按固定节拍扫码，结果 (状态码, 延迟秒数, 落后节拍秒数) 追加到 results"""
+    rng = random.Random(desk_id)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Cookie': cookie, 'Content-Type': 'application/json'}
+    started = time.perf_counter() + rng.random() * interval  # 错开各借还台的节拍
+    pending = None
+    scans = int(seconds / interval)
+    for i in range(scans):
+        scheduled = started + i * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if pending is None:
+            pending = (f'reader{rng.randint(1, USERS)}', book_isbn(rng.randint(1, BOOKS)))
+            payload = {'user': pending[0], 'item': pending[1], 'action': 'checkout'}
+        else:
+            payload = {'user': pending[0], 'item': pending[1], 'action': 'return'}
+            pending = None
+        sent = time.perf_counter()
+        try:
+            connection.request('POST', SCAN_URL, body=json.dumps(payload), headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = 0
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        if status != 200 and payload['action'] == 'checkout':
+            pending = None  # 没借出就不用归还，下一次继续借
+        results.append((status, time.perf_counter() - sent, sent - scheduled))
+    connection.close()
+
+
+def desk_group(port, cookie, interval, seconds, desk_ids):
+    """一个客户端进程用线程模拟多个借还台"""
+    results = []
+    threads = [threading.Thread(target=desk, args=(port, cookie, interval, seconds, desk_id, results))
+               for desk_id in desk_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_desks(port, cookie, desks, interval, seconds):
+    processes = min(desks, os.cpu_count() or 1)
+    groups = [list(range(desks))[i::processes] for i in range(processes)]
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = [result for group in pool.starmap(
+            desk_group, [(port, cookie, interval, seconds, group) for group in groups]) for result in group]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for status, latency, _ in results if status in (200, 409))
+
+    def percentile(q):
+        return latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000 if latencies else 0
+
+    return {
+        'scans': len(results) / elapsed,  # 服务器跟不上时用时会超过 seconds
+        'ok': sum(status == 200 for status, _, _ in results),
+        'rejected': sum(status == 409 for status, _, _ in results),
+        'errors': sum(status not in (200, 409) for status, _, _ in results),
+        'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+        'late': sum(lag > interval for _, _, lag in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟多个借还台扫码借还的吞吐量和延迟')
+    parser.add_argument('--desks', type=int, nargs='+', default=[10, 50, 100], help='借还台数量')
+    parser.add_argument('--interval', type=float, default=0.2, help='每个借还台的扫码间隔（秒）')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn 工作进程数')
+    parser.add_argument('--threads', type=int, default=4, help='每个工作进程的线程数')
+    parser.add_argument('--seconds', type=float, default=10, help='每种配置的压测秒数')
+    parser.add_argument('--database-url', help='使用已有的数据库（需为 generate_dataset.py 生成），默认临时生成')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='library-bench-') as directory:
+        url = args.database_url
+        if not url:
+            url = 'sqlite:///' + os.path.join(directory, 'library.db')
+            subprocess.run([sys.executable, os.path.join(ROOT, 'generate_dataset.py'), '--database-url', url,
+                            '--users', str(USERS), '--books', str(BOOKS), '--records', '50000'],
+                           check=True, stdout=subprocess.DEVNULL)
+
+        port = free_port()
+        env = dict(os.environ, DATABASE_URL=url, BIND=f'127.0.0.1:{port}',
+                   WEB_CONCURRENCY=str(args.workers), WEB_THREADS=str(args.threads))
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning',
+             'wsgi:application'], cwd=ROOT, env=env)
+        try:
+            wait_for_port(port, server)
+            cookie = login(port, 'admin', 'admin123')
+            print(f"{args.workers} 个工作进程 × {args.threads} 线程，每个借还台每 {args.interval:g} 秒扫码一次")
+            print(f"{'借还台':<8}{'目标/秒':>9}{'扫码/秒':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                  f"{'成功':>8}{'拒绝':>6}{'错误':>6}{'落后':>6}")
+            for desks in args.desks:
+                result = run_desks(port, cookie, desks, args.interval, args.seconds)
+                print(f"{desks:<8}{desks / args.interval:>9.0f}{result['scans']:>9.1f}{result['p50']:>9.1f}"
+                      f"{result['p95']:>9.1f}{result['p99']:>9.1f}{result['ok']:>8}{result['rejected']:>6}"
+                      f"{result['errors']:>6}{result['late']:>6}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
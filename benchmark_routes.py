@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路由基准测试
+
+用 generate_dataset.py 生成（或使用 --database-url 指定的）数据库，通过 Flask 测试客户端
+逐个请求 app.py 中的页面和操作：仪表板、图书列表的各种筛选、借阅记录按每种 search_type 搜索、
+借书、还书、批量归还等。每个路由先预热，再统计 p50 / p95 延迟和单次请求的最大 SQL 语句数，
+与 benchmark_baselines.json 中的基线比较：
+
+- SQL 语句数超过基线即失败
+- p95 延迟超过基线乘以 --tolerance 即失败
+
+有路由失败时退出码为 1。修改了查询或换了机器后，用 --update 重新写入基线。
+
+    python benchmark_routes.py                       # 与基线比较
+    python benchmark_routes.py --update              # 重新生成基线
+    python benchmark_routes.py --only records        # 只跑名称包含 records 的路由
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines.json')
+
+# 基线对应的数据规模，换用其他规模时延迟没有可比性
+DATASET = {'users': 2000, 'books': 5000, 'categories': 20, 'records': 100000, 'seed': 42}
+
+ADMIN = ('admin', 'admin123')
+READER = ('reader1', 'test123')
+
+# (名称, 身份, 地址)
+PAGES = [
+    ('admin_dashboard', 'admin', '/admin/dashboard'),
+    ('admin_users', 'admin', '/admin/users'),
+    ('admin_users_search', 'admin', '/admin/users?search=王'),
+    ('admin_categories', 'admin', '/admin/categories'),
+    ('admin_books', 'admin', '/admin/books'),
+    ('admin_books_search_cjk', 'admin', '/admin/books?search=数据'),
+    ('admin_books_search_latin', 'admin', '/admin/books?search=Python'),
+    ('admin_books_search_isbn', 'admin', '/admin/books?search=978-0-00-000500-7'),
+    ('admin_books_category', 'admin', '/admin/books?category=1'),
+    ('admin_books_available', 'admin', '/admin/books?status=available'),
+    ('admin_books_borrowed', 'admin', '/admin/books?status=borrowed'),
+    ('admin_books_sort_title', 'admin', '/admin/books?sort=title'),
+    ('admin_records', 'admin', '/admin/records'),
+    ('admin_records_search_all', 'admin', '/admin/records?search=数据&search_type=all'),
+    ('admin_records_search_book', 'admin', '/admin/records?search=数据&search_type=book'),
+    ('admin_records_search_user', 'admin', '/admin/records?search=reader1&search_type=user'),
+    ('admin_records_search_isbn', 'admin', '/admin/records?search=9780000000&search_type=isbn'),
+    ('admin_records_search_isbn_exact', 'admin', '/admin/records?search=978-0-00-000500-7&search_type=isbn'),
+    ('admin_records_search_id', 'admin', '/admin/records?search=500&search_type=id'),
+    ('admin_records_borrowed', 'admin', '/admin/records?status=borrowed'),
+    ('admin_records_overdue', 'admin', '/admin/records?status=overdue'),
+    ('admin_records_due_this_week', 'admin', '/admin/records?due_filter=this_week'),
+    ('admin_records_sort_due_date', 'admin', '/admin/records?sort_by=due_date'),
+    ('admin_records_sort_return_date', 'admin', '/admin/records?sort_by=return_date'),
+    ('admin_records_sort_user_name', 'admin', '/admin/records?sort_by=user_name'),
+    ('admin_records_last_7_days', 'admin', '/admin/records?days=7'),
+    ('user_dashboard', 'user', '/user/dashboard'),
+    ('browse_books', 'user', '/books'),
+    ('browse_books_search', 'user', '/books?search=数据'),
+    ('browse_books_category', 'user', '/books?category_id=1'),
+    ('borrow_history', 'user', '/user/borrow-history'),
+    ('borrow_history_overdue', 'user', '/user/borrow-history?status=overdue'),
+]
+
+BATCH_RETURN_SIZE = 20
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def login(app, credentials):
+    client = app.test_client()
+    response = client.post('/login', data={'username': credentials[0], 'password': credentials[1]})
+    if response.status_code != 302:
+        raise RuntimeError(f'登录失败：{credentials[0]}')
+    return client
+
+
+def page_requests(url):
+    return lambda count: [('GET', url, None)] * count
+
+
+def borrow_requests(app, reader_id):
+    """每次借一本该读者当前没有借的、有库存的书"""
+    from models import db, Book, BorrowRecord
+
+    def build(count):
+        with app.app_context():
+            borrowed = db.session.query(BorrowRecord.book_id).filter_by(user_id=reader_id, status='borrowed')
+            book_ids = [book_id for (book_id,) in db.session.query(Book.id).filter(
+                Book.available_quantity > 0, Book.id.notin_(borrowed)).order_by(Book.id).limit(count)]
+        return [('GET', f'/books/borrow/{book_id}', None) for book_id in book_ids]
+    return build
+
+
+def return_requests(app, reader_id):
+    """归还该读者最近借的书（借书基准测试借出的那些）"""
+    from models import db, BorrowRecord
+
+    def build(count):
+        with app.app_context():
+            record_ids = [record_id for (record_id,) in db.session.query(BorrowRecord.id).filter_by(
+                user_id=reader_id, status='borrowed').order_by(BorrowRecord.id.desc()).limit(count)]
+        return [('GET', f'/books/return/{record_id}', None) for record_id in record_ids]
+    return build
+
+
+def batch_return_requests(app):
+    from models import db, BorrowRecord
+
+    def build(count):
+        with app.app_context():
+            record_ids = [record_id for (record_id,) in db.session.query(BorrowRecord.id).filter_by(
+                status='borrowed').order_by(BorrowRecord.id).limit(count * BATCH_RETURN_SIZE)]
+        return [('POST', '/admin/records/batch-return',
+                 {'record_ids': record_ids[i:i + BATCH_RETURN_SIZE]})
+                for i in range(0, len(record_ids), BATCH_RETURN_SIZE)]
+    return build
+
+
+def measure(client, requests, warmup):
+    """依次发出请求，返回 (延迟毫秒列表, 最大语句数)；前 warmup 个请求不计入"""
+    from instrumentation import count_queries
+
+    latencies = []
+    max_queries = 0
+    for i, (method, url, payload) in enumerate(requests):
+        with count_queries() as counter:
+            started = time.perf_counter()
+            response = client.open(url, method=method, json=payload)
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} 返回 {response.status_code}')
+        if i >= warmup:
+            latencies.append(elapsed)
+            max_queries = max(max_queries, counter.count)
+    return latencies, max_queries
+
+
+def run_benchmarks(app, iterations, warmup, only=None):
+    from models import User
+    from stats import advance_overdue_count
+
+    with app.app_context():
+        reader_id = User.query.filter_by(username=READER[0]).one().id
+        # 已有数据库可能很久没有借还，先推进逾期计数，仪表板与持续借还时一样只读一行
+        advance_overdue_count()
+    clients = {'admin': login(app, ADMIN), 'user': login(app, READER)}
+
+    routes = [(name, role, page_requests(url)) for name, role, url in PAGES]
+    routes += [
+        ('borrow_book', 'user', borrow_requests(app, reader_id)),
+        ('return_book', 'user', return_requests(app, reader_id)),
+        ('admin_batch_return', 'admin', batch_return_requests(app)),
+    ]
+
+    results = {}
+    for name, role, build in routes:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        requests = build(warmup + iterations)
+        if len(requests) <= warmup:
+            print(f'{name}: 数据不足，跳过', file=sys.stderr)
+            continue
+        latencies, queries = measure(clients[role], requests, warmup)
+        results[name] = {
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'queries': queries,
+        }
+    return results
+
+
+def compare(results, baselines, tolerance):
+    """打印结果表，返回超出预算的路由名称列表"""
+    failures = []
+    print(f"{'路由':<32}{'p50 ms':>9}{'p95 ms':>9}{'基线 p95':>10}{'语句':>6}{'基线':>6}  结果")
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            verdict = '无基线'
+        else:
+            problems = []
+            if result['queries'] > baseline['queries']:
+                problems.append('语句数超出')
+            if result['p95_ms'] > baseline['p95_ms'] * tolerance:
+                problems.append('延迟超出')
+            verdict = '，'.join(problems) or 'OK'
+            if problems:
+                failures.append(name)
+        print(f"{name:<32}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+              f"{baseline['p95_ms'] if baseline else '-':>10}{result['queries']:>6}"
+              f"{baseline['queries'] if baseline else '-':>6}  {verdict}")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='路由延迟和 SQL 语句数基准测试')
+    parser.add_argument('--database-url', help='使用已有的数据库（例如 generate_dataset.py 生成的），默认临时生成')
+    parser.add_argument('--iterations', type=int, default=30, help='每个路由计入统计的请求数')
+    parser.add_argument('--warmup', type=int, default=3, help='每个路由预热的请求数')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='p95 延迟允许超出基线的倍数')
+    parser.add_argument('--baselines', default=BASELINE_FILE)
+    parser.add_argument('--update', action='store_true', help='把本次结果写入基线文件')
+    parser.add_argument('--only', nargs='+', help='只运行名称包含这些字符串的路由')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='library-bench-') as directory:
+        if args.database_url:
+            os.environ['DATABASE_URL'] = args.database_url
+        else:
+            from generate_dataset import main as generate
+            url = 'sqlite:///' + os.path.join(directory, 'library.db')
+            generate(['--database-url', url] + [f'--{key}={value}' for key, value in DATASET.items()])
+
+        from app import app
+        app.config.update(WTF_CSRF_ENABLED=False)
+        results = run_benchmarks(app, args.iterations, args.warmup, args.only)
+
+        with app.app_context():
+            from models import db
+            db.engine.dispose()
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding='utf-8') as f:
+            baselines = json.load(f)
+    failures = compare(results, baselines.get('routes', {}), args.tolerance)
+
+    if args.update:
+        routes = dict(baselines.get('routes', {}))
+        routes.update(results)
+        with open(args.baselines, 'w', encoding='utf-8') as f:
+            json.dump({'dataset': DATASET, 'routes': routes}, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f'基线已写入 {args.baselines}')
+        return 0
+
+    if failures:
+        print(f"超出预算：{', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
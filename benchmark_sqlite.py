@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 运行参数基准测试
+
+分别用 default 和 production 两种 SQLITE_PROFILE 新建临时数据库，多个线程同时反复借阅、
+归还图书（circulation.lend_book / return_record），另有线程不断查询借阅记录列表，
+比较每秒完成的借还次数、读查询次数和 database is locked 错误数。
+
+    python benchmark_sqlite.py --writers 8 --readers 4 --seconds 5
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from circulation import CirculationError, lend_book, return_record
+from config import Config
+from models import db, Book, BorrowRecord, Category, User
+from sqlite_tuning import SQLITE_PROFILES, apply_sqlite_profile, sqlite_pragmas
+from stats import ensure_library_stats
+
+
+def make_app(path, profile):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + path, SQLITE_PROFILE=profile)
+    db.init_app(app)
+    with app.app_context():
+        apply_sqlite_profile(db.engine, profile)
+    return app
+
+
+def seed(app, num_books, num_users):
+    with app.app_context():
+        db.create_all()
+        category = Category(name='基准测试')
+        db.session.add(category)
+        db.session.flush()
+        db.session.add_all(Book(title=f'基准图书{i}', author='测试', isbn=f'B{i:08d}', quantity=3,
+                                available_quantity=3, category_id=category.id) for i in range(num_books))
+        db.session.add_all(User(username=f'bench{i}', email=f'bench{i}@example.com', full_name='基准读者',
+                                password_hash='-') for i in range(num_users))
+        db.session.commit()
+        ensure_library_stats()
+        return [book.id for book in Book.query], [user.id for user in User.query]
+
+
+def run(app, book_ids, user_ids, writers, readers, seconds):
+    deadline = time.perf_counter() + seconds
+    counts = {'writes': 0, 'reads': 0, 'locked': 0, 'rejected': 0}
+    lock = threading.Lock()
+
+    def add(name, value=1):
+        with lock:
+            counts[name] += value
+
+    def writer(index):
+        rng = random.Random(index)
+        # 每个写线程使用自己的一组读者，避免同一读者重复借阅同一本书
+        own_users = user_ids[index::writers]
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                try:
+                    record = lend_book(rng.choice(own_users), rng.choice(book_ids))
+                    return_record(record)
+                    add('writes', 2)
+                except CirculationError:
+                    add('rejected')
+                except OperationalError:
+                    db.session.rollback()
+                    add('locked')
+
+    def reader():
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                try:
+                    (BorrowRecord.query.filter_by(status='borrowed')
+                     .order_by(BorrowRecord.borrow_date.desc()).limit(10).all())
+                    db.session.rollback()
+                    add('reads')
+                except OperationalError:
+                    db.session.rollback()
+                    add('locked')
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {name: value / elapsed if name in ('writes', 'reads') else value for name, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较不同 SQLITE_PROFILE 下的借还吞吐量')
+    parser.add_argument('--writers', type=int, default=8, help='借还线程数')
+    parser.add_argument('--readers', type=int, default=4, help='列表查询线程数')
+    parser.add_argument('--seconds', type=float, default=5, help='每种配置运行的秒数')
+    parser.add_argument('--books', type=int, default=200)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--profiles', nargs='+', default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{'配置':<12}{'借还/秒':>10}{'查询/秒':>10}{'锁冲突':>8}{'拒绝':>6}  PRAGMA")
+    with tempfile.TemporaryDirectory(prefix='library-bench-') as directory:
+        for profile in args.profiles:
+            app = make_app(os.path.join(directory, f'{profile}.db'), profile)
+            book_ids, user_ids = seed(app, args.books, args.users)
+            result = run(app, book_ids, user_ids, args.writers, args.readers, args.seconds)
+            with app.app_context():
+                with db.engine.connect() as connection:
+                    pragmas = sqlite_pragmas(connection, ('journal_mode', 'synchronous'))
+                db.engine.dispose()
+            print(f"{profile:<12}{result['writes']:>10.1f}{result['reads']:>10.1f}"
+                  f"{result['locked']:>8}{result['rejected']:>6}  {pragmas}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+冷启动基准测试
+
+每轮启动一个全新的 Python 进程，分别计时：
+- import：导入 app 模块（包括 create_app() 构建应用对象）
+- 首个请求：GET /login，只渲染模板
+- 首个数据库请求：以管理员会话打开仪表板，包括建立数据库连接（直接写入会话，不计密码哈希的耗时）
+
+数据库事先用 `flask --app wsgi init-db` 在临时目录中创建，不计入启动时间。
+
+    python benchmark_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r'''
+import json, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+app.config.update(WTF_CSRF_ENABLED=False)
+client = app.test_client()
+assert client.get('/login').status_code == 200
+first_request = time.perf_counter()
+with client.session_transaction() as session:
+    session['_user_id'] = 'admin:1'
+assert client.get('/admin/dashboard').status_code == 200
+first_db_request = time.perf_counter()
+print(json.dumps({
+    'import': (imported - started) * 1000,
+    'first_request': (first_request - imported) * 1000,
+    'first_db_request': (first_db_request - first_request) * 1000,
+}))
+'''
+
+PHASES = [('import', 'import'), ('first_request', '首个请求'), ('first_db_request', '首个数据库请求')]
+
+
+def measure(env):
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量导入应用和首个请求的耗时')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--database-url', help='使用已初始化的数据库，默认在临时目录中创建')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='library-bench-') as directory:
+        url = args.database_url or 'sqlite:///' + os.path.join(directory, 'library.db')
+        env = dict(os.environ, DATABASE_URL=url)
+        if not args.database_url:
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'init-db'], cwd=ROOT, env=env,
+                           check=True, stdout=subprocess.DEVNULL)
+
+        runs = [measure(env) for _ in range(args.runs)]
+
+    print(f"{'阶段':<16}{'中位数 ms':>10}{'最小 ms':>10}{'最大 ms':>10}")
+    for key, label in PHASES:
+        values = [run[key] for run in runs]
+        print(f"{label:<16}{statistics.median(values):>10.1f}{min(values):>10.1f}{max(values):>10.1f}")
+    total = [sum(run[key] for key, _ in PHASES) for run in runs]
+    print(f"{'合计':<16}{statistics.median(total):>10.1f}{min(total):>10.1f}{max(total):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程部署的吞吐量测试
+
+生成一份测试数据库，依次用不同的工作进程数启动 gunicorn（gunicorn.conf.py + wsgi:application），
+由多个客户端进程通过 HTTP 长连接持续请求图书列表、借阅记录等页面，
+比较每秒完成的请求数和延迟，查看吞吐量是否随进程数（CPU 核数）增长。
+
+    python benchmark_workers.py --workers 1 2 4 --threads 4 --clients 16 --seconds 10
+
+需要安装 gunicorn（仅支持 Linux / macOS）。
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+READER_URLS = ['/books', '/books?' + urlencode({'search': '数据'}), '/user/dashboard', '/user/borrow-history']
+ADMIN_URLS = ['/admin/records', '/admin/books?status=available', '/admin/dashboard']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn 启动失败')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('等待 gunicorn 启动超时')
+
+
+def login(port, username, password):
+    """走一遍带 CSRF 令牌的登录表单，返回会话 Cookie"""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', '/login')
+    response = connection.getresponse()
+    page = response.read().decode('utf-8')
+    cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+    token = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page).group(1)
+    body = urlencode({'csrf_token': token, 'username': username, 'password': password})
+    connection.request('POST', '/login', body=body, headers={
+        'Cookie': cookie, 'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    if response.status != 302:
+        raise RuntimeError(f'登录失败：{username}')
+    return response.getheader('Set-Cookie').split(';', 1)[0]
+
+
+def client(port, cookie, urls, seconds, index):
+    """在一条长连接上循环请求 urls，返回 (完成数, 错误数, 延迟列表)"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Cookie': cookie}
+    deadline = time.perf_counter() + seconds
+    done, errors, latencies = 0, 0, []
+    i = index
+    while time.perf_counter() < deadline:
+        url = urls[i % len(urls)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            connection.request('GET', url, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+        done += 1
+    connection.close()
+    return done, errors, latencies
+
+
+def run_load(port, clients, seconds):
+    jobs = []
+    reader_cookie = login(port, 'reader1', 'test123')
+    admin_cookie = login(port, 'admin', 'admin123')
+    for index in range(clients):
+        if index % 2:
+            jobs.append((port, admin_cookie, ADMIN_URLS, seconds, index))
+        else:
+            jobs.append((port, reader_cookie, READER_URLS, seconds, index))
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.starmap(client, jobs)
+    done = sum(result[0] for result in results)
+    errors = sum(result[1] for result in results)
+    latencies = sorted(latency for result in results for latency in result[2])
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    return done / seconds, errors, p50, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较不同 gunicorn 工作进程数下的吞吐量')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='每个工作进程的线程数')
+    parser.add_argument('--clients', type=int, default=16, help='并发客户端进程数')
+    parser.add_argument('--seconds', type=float, default=10, help='每种配置的压测秒数')
+    parser.add_argument('--database-url', help='使用已有的数据库，默认临时生成')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='library-bench-') as directory:
+        url = args.database_url
+        if not url:
+            url = 'sqlite:///' + os.path.join(directory, 'library.db')
+            subprocess.run([sys.executable, os.path.join(ROOT, 'generate_dataset.py'), '--database-url', url,
+                            '--users', '1000', '--books', '2000', '--records', '50000'],
+                           check=True, stdout=subprocess.DEVNULL)
+
+        print(f"CPU 核数 {os.cpu_count()}，每进程 {args.threads} 线程，{args.clients} 个客户端")
+        print(f"{'进程数':<8}{'请求/秒':>10}{'p50 ms':>9}{'p95 ms':>9}{'错误':>6}")
+        for workers in args.workers:
+            port = free_port()
+            env = dict(os.environ, DATABASE_URL=url, BIND=f'127.0.0.1:{port}',
+                       WEB_CONCURRENCY=str(workers), WEB_THREADS=str(args.threads))
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning',
+                 'wsgi:application'], cwd=ROOT, env=env)
+            try:
+                wait_for_port(port, server)
+                throughput, errors, p50, p95 = run_load(port, args.clients, args.seconds)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{workers:<8}{throughput:>10.1f}{p50:>9.1f}{p95:>9.1f}{errors:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图书目录批量导入
+
+从 CSV（首行为列名）或 JSONL（每行一个对象）文件导入图书，逐行读取，不把整个文件载入内存：
+- 校验并规范化每一行：去除首尾空白，ISBN 去掉连字符和空格并检查校验位，数量缺省为 1，出版日期为 YYYY-MM-DD
+- 分类按名称解析，导入开始时一次性读出全部分类放在字典中；找不到的分类记为错误行
+- 每批只用一条 IN 查询按规范化的 isbn13 检查哪些图书已存在，批内重复的 ISBN 只导入第一行
+- 每批在一个事务中用 executemany 写入，同时建立馆藏副本、补建 n-gram 索引并调整仪表板计数
+
+    flask --app wsgi import-books books.csv
+"""
+
+import csv
+import io
+import itertools
+import json
+import re
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from bulk import bulk_insert
+from copies import add_copies
+from isbn import InvalidISBN, normalize_isbn
+from models import db, Book, Category
+from search import index_new_rows
+from stats import adjust_counters
+
+IMPORT_BATCH_SIZE = 1000
+# 报告中最多列出的错误行数，其余只计数
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_COLUMNS = ('title', 'author', 'isbn', 'isbn13', 'publisher', 'publication_date', 'quantity',
+                  'available_quantity', 'description', 'category_id', 'created_at', 'updated_at')
+
+# 列名别名，统一为英文字段名
+COLUMN_ALIASES = {
+    '书名': 'title', '作者': 'author', '出版社': 'publisher', '出版日期': 'publication_date',
+    '数量': 'quantity', '简介': 'description', '描述': 'description', '分类': 'category',
+}
+
+_MAX_LENGTHS = {'title': 200, 'author': 100, 'isbn': 20, 'publisher': 100}
+_WHITESPACE_RE = re.compile(r'\s+')
+_ISBN_SEPARATORS_RE = re.compile(r'[\s-]+')
+
+
+class ImportRowError(ValueError):
+    """数据行不合法"""
+
+
+class ImportReport:
+    """导入结果：写入、跳过的行数和错误明细"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []  # [(行号, 原因)]，最多 MAX_REPORTED_ERRORS 条；文件无法解析时行号为 None
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f'共 {self.rows} 行：导入 {self.inserted} 本，ISBN 重复 {self.duplicates} 行，'
+                f'错误 {self.error_count} 行；用时 {self.elapsed:.2f}s，{self.rows_per_second:.0f} 行/秒')
+
+
+def detect_format(filename):
+    """按扩展名判断文件格式，无法判断时返回 None"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension)
+
+
+def read_rows(stream, file_format):
+    """从二进制流逐行产生 (行号, 字段字典)；JSON 解析失败的行产生 (行号, ImportRowError)"""
+    # utf-8-sig 兼容 Excel 导出时带的 BOM
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, ImportRowError('不是合法的 JSON')
+            continue
+        yield line_number, row if isinstance(row, dict) else ImportRowError('每行应为一个 JSON 对象')
+
+
+def normalize_row(raw):
+    """校验一行数据，返回规范化后的字段字典（category 为分类名称）"""
+    row = {}
+    for key, value in raw.items():
+        if key is None:
+            raise ImportRowError('列数多于表头')
+        key = key.strip()
+        key = COLUMN_ALIASES.get(key, key.lower())
+        if isinstance(value, str):
+            value = _WHITESPACE_RE.sub(' ', value).strip() if key != 'description' else value.strip()
+        row[key] = None if value in ('', None) else value
+
+    for field in ('title', 'author', 'isbn'):
+        if not row.get(field):
+            raise ImportRowError(f'缺少 {field}')
+    row['isbn'] = _ISBN_SEPARATORS_RE.sub('', str(row['isbn'])).upper()
+    try:
+        row['isbn13'] = normalize_isbn(row['isbn'])
+    except InvalidISBN as e:
+        raise ImportRowError(str(e))
+    for field, max_length in _MAX_LENGTHS.items():
+        if row.get(field) and len(str(row[field])) > max_length:
+            raise ImportRowError(f'{field} 超过 {max_length} 个字符')
+
+    quantity = row.get('quantity')
+    try:
+        quantity = 1 if quantity is None else int(quantity)
+    except (TypeError, ValueError):
+        raise ImportRowError(f'数量不是整数：{quantity}')
+    if not 1 <= quantity <= 1000:
+        raise ImportRowError('数量应在 1 到 1000 之间')
+
+    publication_date = row.get('publication_date')
+    if publication_date is not None:
+        try:
+            publication_date = datetime.strptime(str(publication_date), '%Y-%m-%d').date()
+        except ValueError:
+            raise ImportRowError(f'出版日期格式应为 YYYY-MM-DD：{publication_date}')
+
+    if not row.get('category'):
+        raise ImportRowError('缺少 category')
+
+    return {
+        'title': str(row['title']),
+        'author': str(row['author']),
+        'isbn': row['isbn'],
+        'isbn13': row['isbn13'],
+        'publisher': row.get('publisher'),
+        'publication_date': publication_date,
+        'quantity': quantity,
+        'description': row.get('description'),
+        'category': str(row['category']),
+    }
+
+
+def _insert_batch(batch):
+    """batch 为已解析出 category_id 的规范化行，返回 (写入行数, ISBN 重复行数)"""
+    isbns = [row['isbn13'] for row in batch]
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        existing = set(connection.execute(select(Book.isbn13).where(Book.isbn13.in_(isbns))).scalars())
+        values = []
+        for row in batch:
+            if row['isbn13'] in existing:
+                continue
+            existing.add(row['isbn13'])
+            values.append((row['title'], row['author'], row['isbn'], row['isbn13'], row['publisher'],
+                           row['publication_date'], row['quantity'], row['quantity'], row['description'],
+                           row['category_id'], now, now))
+        if values:
+            bulk_insert(connection, Book.__table__, IMPORT_COLUMNS, values, len(values))
+            # executemany 不返回各行的 id，按 ISBN 取回新行建立 n-gram
+            inserted = connection.execute(
+                select(Book.id, Book.title, Book.author, Book.description, Book.quantity)
+                .where(Book.isbn13.in_([value[3] for value in values]))
+            ).all()
+            index_new_rows(connection, Book.__tablename__, inserted)
+            add_copies(connection, [(row.id, 0, row.quantity) for row in inserted])
+            adjust_counters(connection, total_books=len(values))
+    return len(values), len(batch) - len(values)
+
+
+def import_books(stream, file_format, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """从二进制流导入图书，返回 ImportReport；progress(report) 在每批写入后调用"""
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f'不支持的文件格式：{file_format}')
+    report = ImportReport()
+    with db.engine.connect() as connection:
+        categories = dict(connection.execute(select(Category.name, Category.id)).all())
+
+    rows = read_rows(stream, file_format)
+    finished = False
+    while not finished:
+        chunk = []
+        try:
+            chunk.extend(itertools.islice(rows, batch_size))
+        except (UnicodeDecodeError, csv.Error) as e:
+            # 编码错误或 CSV 格式损坏时无法继续定位后面的行，只导入已读出的部分
+            report.add_error(None, f'文件无法解析（需为 UTF-8 编码）：{e}')
+            finished = True
+        if len(chunk) < batch_size:
+            finished = True
+        batch = []
+        for line_number, raw in chunk:
+            report.rows += 1
+            try:
+                if isinstance(raw, ImportRowError):
+                    raise raw
+                row = normalize_row(raw)
+                row['category_id'] = categories.get(row['category'])
+                if row['category_id'] is None:
+                    raise ImportRowError(f"分类不存在：{row['category']}")
+            except ImportRowError as e:
+                report.add_error(line_number, str(e))
+                continue
+            batch.append((line_number, row))
+
+        if batch:
+            try:
+                inserted, duplicates = _insert_batch([row for _, row in batch])
+            except IntegrityError:
+                # 检查与写入之间其他请求写入了相同的 ISBN，整批回滚
+                for line_number, _ in batch:
+                    report.add_error(line_number, 'ISBN 与同时写入的图书冲突，未导入')
+            else:
+                report.inserted += inserted
+                report.duplicates += duplicates
+        if progress:
+            progress(report)
+    return report.finish()
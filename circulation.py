@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+借阅与归还
+
+可借数量和借阅状态都用带条件的单条 UPDATE 修改，并检查影响的行数，
+不再“先读出来判断、再在 Python 里加减”。并发借阅同一本书时，数据库保证
+只有库存允许的请求能扣减成功，available_quantity 不会变成负数；
+同一条记录被重复归还时只有一次生效。
+
+每个操作的第一条 SQL 就是写语句：SQLite 下事务一开始就持有写锁，
+其他数据库下会锁住对应的图书或记录行，之后的检查都在这把锁之后进行。
+
+借出时在同一事务中把一册可借副本标为借出，借阅记录指向这一册；归还时副本恢复可借，
+见 copies.py。
+
+借还台扫码（scan_item）先按唯一索引把读者标识和 ISBN 或副本条码解析为 id，再调用同样的借出、归还操作。
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, null
+from sqlalchemy.orm import joinedload
+
+from isbn import to_isbn13
+from models import db, Book, BookCopy, BorrowRecord, User
+from stats import adjust_counters
+
+LOAN_DAYS = 30
+
+# 批量归还时每个事务处理的记录数，IN 列表不超过数据库的参数个数上限
+RETURN_CHUNK_SIZE = 500
+
+
+class CirculationError(Exception):
+    """借还操作未执行，事务已回滚"""
+
+
+class OutOfStock(CirculationError):
+    pass
+
+
+class CopyUnavailable(OutOfStock):
+    """指定的那一册已借出或已注销"""
+
+
+class AlreadyBorrowed(CirculationError):
+    pass
+
+
+class AlreadyReturned(CirculationError):
+    def __init__(self, record):
+        super().__init__(record.id)
+        self.record = record
+
+
+class UnknownUser(CirculationError):
+    pass
+
+
+class UnknownItem(CirculationError):
+    pass
+
+
+class NotBorrowed(CirculationError):
+    """读者没有在借这本书，无法归还"""
+
+
+def lend_book(user_id, book_id, loan_days=LOAN_DAYS, copy_id=None):
+    """为用户借出一本书并提交，返回新建的借阅记录
+
+    库存不足时抛出 OutOfStock，用户已借阅同一本书且未归还时抛出 AlreadyBorrowed。
+    copy_id 指定借出哪一册（扫码借出），这一册不可借时抛出 CopyUnavailable；
+    不指定时借出编号最小的可借副本。
+    """
+    taken = Book.query.filter(
+        Book.id == book_id,
+        Book.available_quantity > 0
+    ).update({Book.available_quantity: Book.available_quantity - 1}, synchronize_session=False)
+    if not taken:
+        db.session.rollback()
+        raise OutOfStock(book_id)
+
+    # 图书行已被锁定，同一用户对这本书的并发借阅在这里排队
+    existing = db.session.query(BorrowRecord.id).filter_by(
+        user_id=user_id,
+        book_id=book_id,
+        status='borrowed'
+    ).first()
+    if existing:
+        db.session.rollback()
+        raise AlreadyBorrowed(book_id)
+
+    wanted = copy_id
+    if copy_id is None:
+        copy_id = db.session.query(BookCopy.id).filter_by(
+            book_id=book_id,
+            status='available'
+        ).order_by(BookCopy.id).limit(1).scalar()
+    taken = copy_id is not None and BookCopy.query.filter(
+        BookCopy.id == copy_id,
+        BookCopy.book_id == book_id,
+        BookCopy.status == 'available'
+    ).update({BookCopy.status: 'borrowed'}, synchronize_session=False)
+    if not taken:
+        db.session.rollback()
+        raise CopyUnavailable(copy_id) if wanted is not None else OutOfStock(book_id)
+
+    record = BorrowRecord(
+        user_id=user_id,
+        book_id=book_id,
+        copy_id=copy_id,
+        due_date=datetime.utcnow() + timedelta(days=loan_days)
+    )
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def return_record(record):
+    """归还借阅记录并提交；记录已被（其他请求）归还时抛出 AlreadyReturned
+
+    record 为已加载的 BorrowRecord，提交后其属性会重新从数据库读取。
+    """
+    previous_status = record.status
+    if previous_status == 'returned' or record.return_date is not None:
+        raise AlreadyReturned(record)
+
+    # 以读到的状态为条件，并发归还同一条记录时只有一个请求能改到这一行
+    returned = BorrowRecord.query.filter(
+        BorrowRecord.id == record.id,
+        BorrowRecord.status == previous_status,
+        BorrowRecord.return_date.is_(None)
+    ).update({BorrowRecord.status: 'returned', BorrowRecord.return_date: datetime.utcnow()},
+             synchronize_session=False)
+    if not returned:
+        # 回滚会让 record 过期，访问属性时读到其他请求写入的归还时间
+        db.session.rollback()
+        raise AlreadyReturned(record)
+
+    # 批量 UPDATE 不经过 flush，在借计数需要手动调整
+    if previous_status == 'borrowed':
+        adjust_counters(db.session.connection(), overdue_due_dates=[record.due_date], advance_overdue=True,
+                        active_borrows=-1)
+
+    Book.query.filter(
+        Book.id == record.book_id,
+        Book.available_quantity < Book.quantity
+    ).update({Book.available_quantity: Book.available_quantity + 1}, synchronize_session=False)
+    if record.copy_id is not None:
+        BookCopy.query.filter(
+            BookCopy.id == record.copy_id,
+            BookCopy.status == 'borrowed'
+        ).update({BookCopy.status: 'available'}, synchronize_session=False)
+    db.session.commit()
+    return record
+
+
+SCAN_ACTIONS = ('auto', 'checkout', 'return')
+
+
+def resolve_user(identifier):
+    """读者标识：纯数字为读者 id（借书证号），含 @ 为邮箱，否则为用户名；返回 (id, 姓名)"""
+    identifier = (identifier or '').strip()
+    if identifier.isdigit():
+        condition = User.id == int(identifier)
+    elif '@' in identifier:
+        condition = User.email == identifier
+    else:
+        condition = User.username == identifier
+    user = db.session.query(User.id, User.full_name).filter(condition).first() if identifier else None
+    if user is None:
+        raise UnknownUser(identifier)
+    return user
+
+
+def resolve_item(code):
+    """条码为 ISBN 时按 isbn13 查找，否则依次按副本条码、录入的 isbn 原样查找
+
+    返回 (图书 id, 书名, 副本 id)，按 ISBN 找到时副本 id 为 None。
+    """
+    code = (code or '').strip()
+    if not code:
+        raise UnknownItem(code)
+    isbn13 = to_isbn13(code)
+    if isbn13:
+        item = db.session.query(Book.id, Book.title, null().label('copy_id')).filter(Book.isbn13 == isbn13).first()
+    else:
+        item = (db.session.query(Book.id, Book.title, BookCopy.id.label('copy_id'))
+                .join(BookCopy, BookCopy.book_id == Book.id)
+                .filter(BookCopy.barcode == code.upper())
+                .first())
+        if item is None:
+            item = db.session.query(Book.id, Book.title, null().label('copy_id')).filter(Book.isbn == code).first()
+    if item is None:
+        raise UnknownItem(code)
+    return item
+
+
+def scan_item(user_id, book_id, action='auto', copy_id=None):
+    """借还台扫码：借出或归还并提交，返回 (执行的操作, 借阅记录)
+
+    action 为 auto 时，读者正在借这本书则归还，否则借出。扫的是副本条码时只借出、归还这一册。
+    """
+    if action != 'checkout':
+        # 与 lend_book 的重复借阅检查相同，走 (user_id, status, due_date) 索引
+        record = BorrowRecord.query.filter_by(user_id=user_id, book_id=book_id, status='borrowed').first()
+        if record is not None and copy_id is not None and record.copy_id != copy_id:
+            # 读者借的是同一本书的另一册
+            record = None
+        if record is not None:
+            return 'return', return_record(record)
+        if action == 'return':
+            raise NotBorrowed(book_id)
+    return 'checkout', lend_book(user_id, book_id, copy_id=copy_id)
+
+
+def _restore_available(book_ids):
+    """book_ids 中每出现一次，对应图书的可借数量加一（不超过总数量）
+
+    按归还册数分组，每组一条 UPDATE。
+    """
+    increments = {}
+    for book_id, count in Counter(book_ids).items():
+        increments.setdefault(count, []).append(book_id)
+    for count, grouped in increments.items():
+        restored = Book.available_quantity + count
+        Book.query.filter(Book.id.in_(grouped)).update(
+            {Book.available_quantity: case((restored > Book.quantity, Book.quantity), else_=restored)},
+            synchronize_session=False)
+
+
+def release_user_loans(user_id):
+    """删除读者之前放回其未归还的图书：副本恢复可借，可借数量加回，返回放回的册数
+
+    不提交，由调用方在同一事务中删除借阅记录和读者（在借计数随记录删除调整）。
+    """
+    pending = (BorrowRecord.user_id == user_id,
+               BorrowRecord.status != 'returned',
+               BorrowRecord.return_date.is_(None))
+    # 第一条 SQL 是写语句，之后读到的在借记录不会再被并发的归还改动
+    BookCopy.query.filter(
+        BookCopy.id.in_(db.session.query(BorrowRecord.copy_id).filter(*pending)),
+        BookCopy.status == 'borrowed'
+    ).update({BookCopy.status: 'available'}, synchronize_session=False)
+    book_ids = [book_id for (book_id,) in db.session.query(BorrowRecord.book_id).filter(*pending).with_for_update()]
+    _restore_available(book_ids)
+    return len(book_ids)
+
+
+def _return_chunk(record_ids):
+    """归还一批记录并提交，返回 (已归还的 id 集合, 存在的记录 id 到书名的映射)"""
+    records = (BorrowRecord.query
+               .options(joinedload(BorrowRecord.book))
+               .filter(BorrowRecord.id.in_(record_ids))
+               .all())
+    # 提交后对象会过期，书名先取出来供错误信息使用
+    titles = {record.id: record.book.title for record in records}
+    pending = [record for record in records if record.status != 'returned' and record.return_date is None]
+    if not pending:
+        return set(), titles
+
+    # 以本次的归还时间作为标记，条件不满足（已被其他请求归还）的行不会被改动
+    now = datetime.utcnow()
+    changed = BorrowRecord.query.filter(
+        BorrowRecord.id.in_([record.id for record in pending]),
+        BorrowRecord.status != 'returned',
+        BorrowRecord.return_date.is_(None)
+    ).update({BorrowRecord.status: 'returned', BorrowRecord.return_date: now}, synchronize_session=False)
+    if changed < len(pending):
+        ours = {record_id for (record_id,) in db.session.query(BorrowRecord.id).filter(
+            BorrowRecord.id.in_([record.id for record in pending]),
+            BorrowRecord.return_date == now
+        )}
+        pending = [record for record in pending if record.id in ours]
+    if not pending:
+        db.session.rollback()
+        return set(), titles
+
+    borrowed = [record for record in pending if record.status == 'borrowed']
+    if borrowed:
+        adjust_counters(db.session.connection(),
+                        overdue_due_dates=[record.due_date for record in borrowed],
+                        advance_overdue=True, active_borrows=-len(borrowed))
+
+    _restore_available(record.book_id for record in pending)
+    copy_ids = [record.copy_id for record in pending if record.copy_id is not None]
+    if copy_ids:
+        BookCopy.query.filter(
+            BookCopy.id.in_(copy_ids),
+            BookCopy.status == 'borrowed'
+        ).update({BookCopy.status: 'available'}, synchronize_session=False)
+
+    returned = {record.id for record in pending}
+    db.session.commit()
+    return returned, titles
+
+
+def return_records(record_ids, chunk_size=RETURN_CHUNK_SIZE):
+    """批量归还，返回 (成功数量, 失败列表)
+
+    失败列表按 record_ids 的顺序给出 (record_id, 书名)：书名为 None 表示记录不存在，
+    否则表示该记录已经归还（重复出现的 id 从第二次起也视为已归还）。
+    每 chunk_size 条记录一个事务，每批只需一次查询和几条 UPDATE。
+    """
+    success_count = 0
+    failures = []
+    seen = set()
+    for start in range(0, len(record_ids), chunk_size):
+        chunk = record_ids[start:start + chunk_size]
+        valid_ids = set()
+        for record_id in chunk:
+            try:
+                valid_ids.add(int(record_id))
+            except (TypeError, ValueError):
+                pass
+        returned, titles = _return_chunk(sorted(valid_ids)) if valid_ids else (set(), {})
+
+        for record_id in chunk:
+            try:
+                key = int(record_id)
+            except (TypeError, ValueError):
+                failures.append((record_id, None))
+                continue
+            if key not in titles:
+                failures.append((record_id, None))
+            elif key in returned and key not in seen:
+                success_count += 1
+            else:
+                failures.append((record_id, titles[key]))
+            seen.add(key)
+    return success_count, failures
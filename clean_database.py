@@ -39,9 +39,9 @@ def clean_database():
 
 def init_sample_data():
     """初始化示例数据"""
-    from app import create_app
+    from database import create_db_app
 
-    app = create_app()
+    app = create_db_app()
 
     with app.app_context():
         try:
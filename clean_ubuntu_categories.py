@@ -5,7 +5,10 @@
 删除Ubuntu和Ubuntu-22.04分类，并将关联的图书转移到其他分类
 """
 
-from app import app, db, Book, Category
+from database import create_db_app
+from models import db, Book, Category
+
+app = create_db_app()
 
 def clean_ubuntu_categories():
     """清理Ubuntu相关分类"""
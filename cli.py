@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库初始化命令
+
+应用启动时不再连接数据库建表、写数据，部署或升级时执行一次：
+
+    flask --app wsgi init-db    # 建表、执行迁移、补建搜索索引和统计行、创建默认管理员
+    flask --app wsgi seed       # 写入默认分类、测试用户和示例图书（已存在的跳过）
+
+两个命令都可以重复执行。批量导入图书目录见 catalog_import.py：
+
+    flask --app wsgi import-books books.csv
+"""
+
+import click
+from flask.cli import with_appcontext
+
+from catalog_import import IMPORT_BATCH_SIZE, IMPORT_FORMATS, detect_format, import_books
+from migrations import upgrade as upgrade_schema
+from models import db, Admin, User, Category, Book
+from search import ensure_book_search_index, ensure_ngram_index
+from stats import ensure_library_stats
+
+DEFAULT_CATEGORIES = [
+    ('文学小说', '各类文学作品和小说'),
+    ('科学技术', '科学、技术、工程类图书'),
+    ('经济管理', '经济、管理、商业类图书'),
+    ('教育学习', '教材、教辅、学习资料'),
+    ('艺术设计', '艺术、设计、创意类图书'),
+    ('生活健康', '生活、健康、休闲类图书'),
+    ('历史传记', '历史、传记、人文社科'),
+    ('儿童读物', '儿童、青少年读物'),
+]
+
+SAMPLE_BOOKS = [
+    {'title': 'Python编程从入门到精通', 'author': '张三', 'isbn': '9787111123453', 'publisher': '清华大学出版社',
+     'quantity': 5, 'description': 'Python编程入门书籍，适合初学者', 'category': '科学技术'},
+    {'title': '活着', 'author': '余华', 'isbn': '9787530221235', 'publisher': '作家出版社',
+     'quantity': 3, 'description': '余华经典小说作品', 'category': '文学小说'},
+]
+
+
+def init_database():
+    """在当前应用上下文中建表并补齐结构和基础数据"""
+    db.create_all()
+    print("数据库表创建成功")
+
+    # 为已有数据库补建索引等结构变更
+    upgrade_schema()
+
+    # 为已有数据库补建图书全文索引和中文 n-gram 索引
+    ensure_book_search_index()
+    ensure_ngram_index()
+
+    # 初始化仪表板统计计数
+    ensure_library_stats()
+
+    # 创建默认管理员账户（ID为1）
+    if not Admin.query.filter_by(username='admin').first():
+        admin = Admin(username='admin', email='admin@library.com')
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        print("创建默认管理员: admin/admin123")
+
+
+def seed_sample_data():
+    """写入默认分类、测试用户和示例图书，已存在的跳过"""
+    existing = {name for (name,) in db.session.query(Category.name)}
+    db.session.add_all(Category(name=name, description=description)
+                       for name, description in DEFAULT_CATEGORIES if name not in existing)
+    db.session.commit()
+    print("✓ 默认分类已就绪")
+
+    if not User.query.filter_by(username='testuser').first():
+        test_user = User(username='testuser', email='test@example.com', full_name='测试用户',
+                         phone='13800138000', address='测试地址')
+        test_user.set_password('test123')
+        db.session.add(test_user)
+        db.session.commit()
+        print("✓ 测试用户创建成功 (用户名: testuser, 密码: test123)")
+
+    if not Book.query.first():
+        categories = dict(db.session.query(Category.name, Category.id))
+        for data in SAMPLE_BOOKS:
+            data = dict(data)
+            data['category_id'] = categories[data.pop('category')]
+            db.session.add(Book(available_quantity=data['quantity'], **data))
+        db.session.commit()
+        print("✓ 示例图书创建成功")
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """建表、执行迁移并创建默认管理员"""
+    init_database()
+
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """写入默认分类、测试用户和示例图书"""
+    seed_sample_data()
+
+
+@click.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS), help='默认按扩展名判断')
+@click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def import_books_command(path, file_format, batch_size):
+    """从 CSV 或 JSONL 文件批量导入图书"""
+    file_format = file_format or detect_format(path)
+    if file_format is None:
+        raise click.UsageError('无法从扩展名判断文件格式，请指定 --format')
+
+    def progress(report):
+        click.echo(f'已处理 {report.rows} 行，导入 {report.inserted} 本', err=True)
+
+    with open(path, 'rb') as stream:
+        report = import_books(stream, file_format, batch_size=batch_size, progress=progress)
+    for line, message in report.errors:
+        click.echo(f'第 {line} 行：{message}' if line else message, err=True)
+    if report.error_count > len(report.errors):
+        click.echo(f'……另有 {report.error_count - len(report.errors)} 行错误未列出', err=True)
+    click.echo(report.summary())
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(import_books_command)
@@ -5,10 +5,38 @@ class Config:
     # 使用SQLite数据库，避免MySQL配置问题
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///library.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite 运行参数：production 启用 WAL 等设置，default 保持 SQLite 默认值（见 sqlite_tuning.py）
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE') or 'production'
+
+    # 读写分离：GET 请求的查询走只读副本（未配置时 SQLite 使用同一文件的只读连接），见 db_routing.py
+    READ_WRITE_SPLIT = os.environ.get('READ_WRITE_SPLIT', '1') != '0'
+    SQLALCHEMY_READ_DATABASE_URI = os.environ.get('DATABASE_READ_URL')
+    READ_YOUR_WRITES_SECONDS = 5  # 写入后该用户的请求走主库的秒数
+
+    # 请求级 SQL 剖析（见 instrumentation.py）
+    SQL_PROFILING = True
+    SQL_PROFILE_HEADERS = None  # 是否输出 X-SQL-Count / X-SQL-Time-Ms 响应头，None 表示跟随 debug
+    SLOW_REQUEST_DB_MS = 200  # 单个请求数据库总耗时超过该值（毫秒）时记录日志
+    SLOW_QUERY_MS = 100  # 单条语句超过该值（毫秒）时记录日志
+    SQL_SLOWEST_PER_REQUEST = 3  # 日志中列出的最慢语句条数
+
+    # Prometheus 指标（见 metrics.py），/metrics 不需要登录，应在反向代理上限制访问
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    METRICS_GAUGE_TTL = 15  # 馆藏和可借册数的缓存秒数
 
     # 管理员配置
     ADMIN_DEFAULT_PASSWORD = 'admin123'
 
     # 分页配置
     BOOKS_PER_PAGE = 10
-    RECORDS_PER_PAGE = 10
\ No newline at end of file
+    RECORDS_PER_PAGE = 10
+    # 列表总数缓存秒数；缓存只在进程内失效，多进程部署时其他工作进程的总数最多滞后这么久
+    COUNT_CACHE_TTL = 30
+    COUNT_ESTIMATE_THRESHOLD = 10000  # 借阅记录总数超过该值时只显示“N+ 条”
+
+    # 已登录用户的进程内缓存秒数，0 表示每次请求都查询数据库
+    IDENTITY_CACHE_TTL = 60
+
+    # 仪表板逾期数量的刷新间隔（秒）：超过后读取时临时统计新到期的记录，不写数据库；
+    # 用 python stats.py --overdue 定时把它们累加进计数
+    STATS_OVERDUE_REFRESH = 60
\ No newline at end of file
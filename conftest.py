@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pytest 公共夹具：使用临时 SQLite 数据库和一份小型示例数据
+"""
+
+import itertools
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# 必须在导入 app 之前指定数据库，避免测试写入 instance/library.db
+_test_db_dir = tempfile.mkdtemp(prefix='library-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_test_db_dir, 'library.db')
+
+
+def seed_library(db, num_books=30, num_users=5, num_records=40):
+    """写入分类、图书、用户和借阅记录；num_records 条记录中约三分之一已归还"""
+    from copies import backfill_copies
+    from isbn import isbn13_check_digit
+    from models import Category, Book, User, BorrowRecord
+    from sqlite_tuning import analyze
+
+    categories = [Category(name=name, description=f'{name}类图书') for name in ('计算机科学', '文学', '历史')]
+    db.session.add_all(categories)
+    db.session.flush()
+
+    books = []
+    for i in range(num_books):
+        books.append(Book(
+            title=f'测试图书{i} Python',
+            author=f'作者{i % 7}',
+            isbn=f'978711100{i:03d}' + isbn13_check_digit(f'978711100{i:03d}'),
+            publisher='测试出版社',
+            quantity=5,
+            available_quantity=5,
+            description=f'第 {i} 本测试图书',
+            category_id=categories[i % len(categories)].id
+        ))
+    db.session.add_all(books)
+
+    users = []
+    for i in range(num_users):
+        user = User(username=f'reader{i + 1}', email=f'reader{i + 1}@example.com', full_name=f'读者{i + 1}')
+        user.set_password('test123')
+        users.append(user)
+    db.session.add_all(users)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    for i in range(num_records):
+        book = books[i % num_books]
+        borrow_date = now - timedelta(days=i)
+        record = BorrowRecord(
+            user_id=users[i % num_users].id,
+            book_id=book.id,
+            borrow_date=borrow_date,
+            due_date=borrow_date + timedelta(days=30)
+        )
+        if i % 3 == 0:
+            record.status = 'returned'
+            record.return_date = borrow_date + timedelta(days=7)
+        else:
+            book.available_quantity -= 1
+        db.session.add(record)
+    db.session.commit()
+
+    # 图书的副本在写入时自动建立，在借记录各分配一册
+    backfill_copies(db.session.connection())
+    # 与 generate_dataset.py 一样，写入数据后更新查询规划器的统计信息
+    analyze(db.session.connection())
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app, initialize_database
+    from models import db
+
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    initialize_database()
+    with flask_app.app_context():
+        seed_library(db)
+    return flask_app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+_category_numbers = itertools.count(1)
+
+
+@pytest.fixture
+def scratch_category(app):
+    """测试专用的空分类，测试结束后删除其中的图书（连同借阅记录和副本）和分类本身，不影响示例数据"""
+    from models import db, Book, BookCopy, BorrowRecord, Category
+
+    with app.app_context():
+        category = Category(name=f'测试分类{next(_category_numbers)}', description='测试专用')
+        db.session.add(category)
+        db.session.commit()
+        category_id, name = category.id, category.name
+
+    yield category_id, name
+
+    with app.app_context():
+        books = Book.query.filter_by(category_id=category_id).all()
+        book_ids = [book.id for book in books]
+        if book_ids:
+            BorrowRecord.query.filter(BorrowRecord.book_id.in_(book_ids)).delete(synchronize_session=False)
+            BookCopy.query.filter(BookCopy.book_id.in_(book_ids)).delete(synchronize_session=False)
+        # 逐个删除图书对象，n-gram、全文索引和统计计数随之更新
+        for book in books:
+            db.session.delete(book)
+        db.session.delete(db.session.get(Category, category_id))
+        db.session.commit()
+
+
+def _login(app, username, password):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def admin_client(app):
+    return _login(app, 'admin', 'admin123')
+
+
+@pytest.fixture
+def user_client(app):
+    return _login(app, 'reader2', 'test123')
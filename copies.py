@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+馆藏副本
+
+每一册书在 book_copies 表中有一行，带条码（C + 7 位图书 id + 4 位册号）和状态：
+available（可借）、borrowed（借出）、withdrawn（注销）。借阅记录指向借出的那一册。
+
+Book.quantity（未注销的册数）和 available_quantity（可借册数）仍然保留，作为按副本状态
+维护的计数：借出、归还、增减册数时与副本状态在同一事务中修改，列表筛选和库存检查只读计数。
+ORM 新增的图书自动按 quantity 建立副本；直接写入的图书需要调用 add_copies。
+
+计数由 check_copy_counters 核对：只检查上次核对以来副本或图书有变化的图书（按 updated_at
+索引查找），不一致时以副本状态为准修正计数。可定时执行：
+
+    python copies.py           # 增量核对
+    python copies.py --full    # 核对全部图书
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, event, exists, func, select, union, update
+from sqlalchemy.orm import Session
+
+from bulk import bulk_insert
+from models import db, Book, BookCopy, BorrowRecord, LibraryStats
+from stats import STATS_ID
+
+COPY_BATCH_SIZE = 1000
+# 增量核对的起点比上次核对的开始时间早一段，覆盖核对时尚未提交的事务
+CHECK_OVERLAP = timedelta(minutes=1)
+
+COPY_COLUMNS = ('book_id', 'barcode', 'status', 'created_at', 'updated_at')
+
+
+class CopiesOnLoan(Exception):
+    """要注销的册数多于可借的册数"""
+
+    def __init__(self, borrowed):
+        super().__init__(borrowed)
+        self.borrowed = borrowed
+
+
+def copy_barcode(book_id, number):
+    return f'C{book_id:07d}{number:04d}'
+
+
+def add_copies(connection, counts):
+    """counts 为 [(图书 id, 已有副本数, 新增册数)]，新增的副本为可借状态，返回写入行数"""
+    now = datetime.utcnow()
+    rows = ((book_id, copy_barcode(book_id, number), 'available', now, now)
+            for book_id, existing, count in counts
+            for number in range(existing + 1, existing + count + 1))
+    return bulk_insert(connection, BookCopy.__table__, COPY_COLUMNS, rows, COPY_BATCH_SIZE)
+
+
+@event.listens_for(Session, 'after_flush')
+def _add_copies_for_new_books(session, flush_context):
+    counts = [(obj.id, 0, obj.quantity or 0) for obj in session.new if isinstance(obj, Book)]
+    if counts:
+        add_copies(session.connection(), counts)
+
+
+def set_copy_count(book, quantity):
+    """把图书未注销的册数调整为 quantity：不足时新增可借副本，多出时注销编号最大的可借副本
+
+    借出的副本不能注销，可借的册数不够注销时抛出 CopiesOnLoan。计数随之调整，由调用方提交。
+    """
+    counts = dict(db.session.query(BookCopy.status, func.count())
+                  .filter(BookCopy.book_id == book.id)
+                  .group_by(BookCopy.status))
+    available = counts.get('available', 0)
+    delta = quantity - available - counts.get('borrowed', 0)
+    if delta > 0:
+        add_copies(db.session.connection(), [(book.id, sum(counts.values()), delta)])
+    elif delta < 0:
+        if available < -delta:
+            raise CopiesOnLoan(counts.get('borrowed', 0))
+        copy_ids = [copy_id for (copy_id,) in db.session.query(BookCopy.id)
+                    .filter_by(book_id=book.id, status='available')
+                    .order_by(BookCopy.id.desc()).limit(-delta)]
+        # 以可借状态为条件，期间被借出的副本不会被注销
+        withdrawn = BookCopy.query.filter(
+            BookCopy.id.in_(copy_ids),
+            BookCopy.status == 'available'
+        ).update({BookCopy.status: 'withdrawn'}, synchronize_session=False)
+        if withdrawn < -delta:
+            db.session.rollback()
+            raise CopiesOnLoan(counts.get('borrowed', 0) + (-delta - withdrawn))
+    if delta:
+        book.quantity = quantity
+        book.available_quantity = Book.available_quantity + delta
+
+
+def _copy_counts(connection, book_ids):
+    """按副本状态统计，返回 {图书 id: (未注销册数, 可借册数)}；还没有副本的图书不在结果中"""
+    rows = connection.execute(
+        select(BookCopy.book_id,
+               func.sum(case((BookCopy.status != 'withdrawn', 1), else_=0)),
+               func.sum(case((BookCopy.status == 'available', 1), else_=0)))
+        .where(BookCopy.book_id.in_(book_ids))
+        .group_by(BookCopy.book_id)
+    )
+    return {book_id: (quantity, available) for book_id, quantity, available in rows}
+
+
+def _reconcile_books(connection, book_ids):
+    """把这些图书的计数与副本状态比较并修正，返回 [(图书 id, (原 quantity, 原 available_quantity), (副本统计))]
+
+    还没有副本的图书（直接写入数据库的）跳过，由 backfill_copies 建立副本。
+    """
+    actual = _copy_counts(connection, book_ids)
+    mismatches = []
+    for book_id, quantity, available in connection.execute(
+            select(Book.id, Book.quantity, Book.available_quantity).where(Book.id.in_(book_ids))):
+        expected = actual.get(book_id)
+        if expected is not None and (quantity, available) != expected:
+            mismatches.append((book_id, (quantity, available), expected))
+    if mismatches:
+        # 以读到的计数为条件，期间被借还改动过的图书留给下一次核对
+        connection.execute(
+            update(Book.__table__)
+            .where(Book.__table__.c.id == bindparam('b_id'),
+                   Book.__table__.c.quantity == bindparam('b_quantity'),
+                   Book.__table__.c.available_quantity == bindparam('b_available'))
+            .values(quantity=bindparam('new_quantity'), available_quantity=bindparam('new_available')),
+            [{'b_id': book_id, 'b_quantity': old[0], 'b_available': old[1],
+              'new_quantity': new[0], 'new_available': new[1]} for book_id, old, new in mismatches]
+        )
+    return mismatches
+
+
+def backfill_copies(connection, batch_size=COPY_BATCH_SIZE):
+    """为没有副本的图书按 quantity 建立副本，给没有副本的在借记录分配一册，并按副本重算这些图书的计数
+
+    可借副本不够分配时补建副本（馆藏数量随之增加）。返回 (新建副本数, 分配了副本的在借记录数)。
+    """
+    touched = set()
+    created = 0
+    last_id = 0
+    while True:
+        books = connection.execute(
+            select(Book.id, Book.quantity)
+            .where(Book.id > last_id, ~exists().where(BookCopy.book_id == Book.id))
+            .order_by(Book.id).limit(batch_size)
+        ).all()
+        if not books:
+            break
+        created += add_copies(connection, [(book_id, 0, max(quantity or 0, 0)) for book_id, quantity in books])
+        touched.update(book_id for book_id, _ in books)
+        last_id = books[-1].id
+
+    assigned = 0
+    last_id = 0
+    while True:
+        loans = connection.execute(
+            select(BorrowRecord.id, BorrowRecord.book_id)
+            .where(BorrowRecord.id > last_id, BorrowRecord.copy_id.is_(None),
+                   BorrowRecord.status != 'returned', BorrowRecord.return_date.is_(None))
+            .order_by(BorrowRecord.id).limit(batch_size)
+        ).all()
+        if not loans:
+            break
+        last_id = loans[-1].id
+        by_book = defaultdict(list)
+        for record_id, book_id in loans:
+            by_book[book_id].append(record_id)
+
+        free = _available_copies(connection, by_book)
+        shortages = {book_id: len(record_ids) - len(free[book_id])
+                     for book_id, record_ids in by_book.items() if len(record_ids) > len(free[book_id])}
+        if shortages:
+            existing = dict(connection.execute(
+                select(BookCopy.book_id, func.count()).where(BookCopy.book_id.in_(list(shortages))).group_by(BookCopy.book_id)
+            ).all())
+            created += add_copies(connection, [(book_id, existing.get(book_id, 0), count)
+                                               for book_id, count in shortages.items()])
+            free = _available_copies(connection, by_book)
+
+        assignments = [{'b_record_id': record_id, 'b_copy_id': copy_id}
+                       for book_id, record_ids in by_book.items()
+                       for record_id, copy_id in zip(record_ids, free[book_id])]
+        connection.execute(
+            update(BookCopy.__table__).where(BookCopy.__table__.c.id == bindparam('b_copy_id')).values(status='borrowed'),
+            assignments
+        )
+        connection.execute(
+            update(BorrowRecord.__table__)
+            .where(BorrowRecord.__table__.c.id == bindparam('b_record_id'))
+            .values(copy_id=bindparam('b_copy_id')),
+            assignments
+        )
+        assigned += len(assignments)
+        touched.update(by_book)
+
+    touched = sorted(touched)
+    for start in range(0, len(touched), batch_size):
+        _reconcile_books(connection, touched[start:start + batch_size])
+    return created, assigned
+
+
+def _available_copies(connection, book_ids):
+    free = defaultdict(list)
+    for copy_id, book_id in connection.execute(
+            select(BookCopy.id, BookCopy.book_id)
+            .where(BookCopy.book_id.in_(list(book_ids)), BookCopy.status == 'available')
+            .order_by(BookCopy.id)):
+        free[book_id].append(copy_id)
+    return free
+
+
+def check_copy_counters(full=False, batch_size=COPY_BATCH_SIZE):
+    """核对图书计数与副本状态，修正不一致的计数，返回 (检查的图书数, 不一致列表)
+
+    默认只检查上次核对以来副本或图书有变化的图书；从未核对过或 full=True 时检查全部图书，
+    full=True 时先为还没有副本的图书和在借记录补建副本。
+    """
+    started = datetime.utcnow()
+    if full:
+        with db.engine.begin() as connection:
+            backfill_copies(connection)
+    with db.engine.connect() as connection:
+        since = None if full else connection.execute(
+            select(LibraryStats.copies_checked_at).where(LibraryStats.id == STATS_ID)
+        ).scalar()
+        if since is None:
+            book_ids = list(connection.execute(select(Book.id).order_by(Book.id)).scalars())
+        else:
+            book_ids = sorted(connection.execute(union(
+                select(BookCopy.book_id).where(BookCopy.updated_at >= since),
+                select(Book.id).where(Book.updated_at >= since),
+            )).scalars())
+
+    mismatches = []
+    for start in range(0, len(book_ids), batch_size):
+        with db.engine.begin() as connection:
+            mismatches.extend(_reconcile_books(connection, book_ids[start:start + batch_size]))
+    with db.engine.begin() as connection:
+        connection.execute(update(LibraryStats).where(LibraryStats.id == STATS_ID)
+                           .values(copies_checked_at=started - CHECK_OVERLAP))
+    return len(book_ids), mismatches
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from database import create_db_app
+
+    parser = argparse.ArgumentParser(description='核对图书计数与馆藏副本状态')
+    parser.add_argument('--full', action='store_true', help='核对全部图书，而不只是最近有变化的')
+    args = parser.parse_args()
+
+    with create_db_app().app_context():
+        checked, mismatches = check_copy_counters(full=args.full)
+        for book_id, (quantity, available), (copies, free) in mismatches:
+            print(f"图书 {book_id}：计数 {quantity}/{available}，副本 {copies}/{free}，已修正")
+        print(f"核对 {checked} 本图书，{len(mismatches)} 本计数不一致")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只包含数据库的应用对象
+
+维护脚本、数据生成器和 init-db 等命令只需要 db 和应用上下文，用 create_db_app() 代替 `from app import app`，
+不会导入视图、表单（flask_wtf / wtforms）、登录、读写分离和监控模块。
+app.create_app() 在此基础上注册其余部分。
+
+    from database import create_db_app
+    from models import db, Book
+
+    with create_db_app().app_context():
+        ...
+
+命令行同样可以不加载完整应用：flask --app "database:create_db_app()" init-db
+"""
+
+from flask import Flask
+
+from cli import register_commands
+from config import Config
+from models import db
+from sqlite_tuning import apply_sqlite_profile
+
+
+def create_db_app(config=None, import_name=__name__):
+    """config 为覆盖 Config 的配置字典；只构建应用对象，不连接数据库"""
+    app = Flask(import_name)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+
+    # 在建立第一个数据库连接之前注册 SQLite PRAGMA 钩子
+    with app.app_context():
+        apply_sqlite_profile(db.engine, app.config['SQLITE_PROFILE'])
+
+    register_commands(app)
+    return app
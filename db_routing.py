@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读写分离
+
+GET / HEAD 请求中的 SELECT 走只读 engine，其余语句（flush、批量 UPDATE/DELETE、
+session.connection() 取得的连接）以及非 GET 请求都走主库。只读 engine 的来源：
+- SQLALCHEMY_READ_DATABASE_URI（环境变量 DATABASE_READ_URL）：MySQL 等数据库的只读副本
+- 未配置且主库是 SQLite 文件时：同一个文件上的第二个连接池，连接设置 PRAGMA query_only，
+  配合 WAL 模式读查询不会和借还写入争用连接
+- 都不满足时不做分离
+
+读自己的写：一个请求写入过数据后，本请求余下的查询都走主库；提交后在会话 cookie 中记录
+时间，此后 READ_YOUR_WRITES_SECONDS 秒内该用户的请求全部走主库，避免副本延迟读到旧数据。
+先读后写的 GET 视图（例如借书、删除）用 @use_primary 固定走主库。
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+
+from sqlite_tuning import apply_sqlite_profile
+
+READ_ENGINE_KEY = 'read_engine'
+_WROTE_KEY = 'db_routing_wrote'
+_STICKY_COOKIE_KEY = '_primary_until'
+
+
+class RoutingSession(Session):
+    """在允许读副本的请求中把 SELECT 发往只读 engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_read_engine(clause):
+            return current_app.extensions[READ_ENGINE_KEY]
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info[_WROTE_KEY] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_read_engine(self, clause):
+        return (
+            getattr(clause, 'is_select', False)
+            and not self._flushing
+            and not self.info.get(_WROTE_KEY)
+            and has_app_context()
+            and g.get('use_read_engine', False)
+            and current_app.extensions.get(READ_ENGINE_KEY) is not None
+        )
+
+
+def use_primary(view):
+    """标记先读后写的 GET 视图，读取也走主库"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return view(*args, **kwargs)
+    wrapper.use_primary = True
+    return wrapper
+
+
+def stick_to_primary():
+    """此后 READ_YOUR_WRITES_SECONDS 秒内当前用户的请求走主库；不经过 session 直接写入主库后调用"""
+    seconds = current_app.config.get('READ_YOUR_WRITES_SECONDS', 0)
+    if seconds > 0:
+        session[_STICKY_COOKIE_KEY] = time.time() + seconds
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    if db_session.info.get(_WROTE_KEY) and has_request_context():
+        stick_to_primary()
+
+
+def _choose_engine():
+    view = current_app.view_functions.get(request.endpoint)
+    g.use_read_engine = (
+        request.method in ('GET', 'HEAD')
+        and not getattr(view, 'use_primary', False)
+        and session.get(_STICKY_COOKIE_KEY, 0) <= time.time()
+    )
+
+
+def _make_read_engine(app, primary):
+    url = app.config.get('SQLALCHEMY_READ_DATABASE_URI')
+    if url:
+        engine = create_engine(url, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        apply_sqlite_profile(engine, app.config.get('SQLITE_PROFILE', 'default'))
+        return engine
+
+    if primary.dialect.name != 'sqlite' or primary.url.database in (None, '', ':memory:'):
+        return None
+
+    engine = create_engine(primary.url, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    apply_sqlite_profile(engine, app.config.get('SQLITE_PROFILE', 'default'))
+
+    @event.listens_for(engine, 'connect')
+    def _query_only(dbapi_connection, connection_record):
+        dbapi_connection.execute('PRAGMA query_only=ON')
+
+    return engine
+
+
+def init_read_routing(app, db):
+    """按配置创建只读 engine 并注册请求钩子；需要 db 使用 RoutingSession"""
+    if not app.config.get('READ_WRITE_SPLIT', True):
+        return None
+    with app.app_context():
+        engine = _make_read_engine(app, db.engine)
+    if engine is None:
+        return None
+    app.extensions[READ_ENGINE_KEY] = engine
+    app.before_request(_choose_engine)
+    return engine
+
+
+def dispose_engines(app, db):
+    """丢弃从父进程继承的连接池（pre-fork 服务器在 fork 之后调用），子进程使用时重新建立连接"""
+    with app.app_context():
+        engines = [db.engine, app.extensions.get(READ_ENGINE_KEY)]
+    for engine in engines:
+        if engine is not None:
+            # close=False：不关闭父进程仍在使用的连接，只是不再复用
+            engine.dispose(close=False)
@@ -4,7 +4,10 @@
 删除Ubuntu-22.04分类的脚本
 """
 
-from app import app, db, Book, Category
+from database import create_db_app
+from models import db, Book, Category
+
+app = create_db_app()
 
 def delete_ubuntu_category():
     """删除Ubuntu-22.04分类"""
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+表单类定义
+
+单独成模块，只有处理请求的 app.py 导入 flask_wtf / wtforms，维护脚本和命令不需要加载它们。
+"""
+
+from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, PasswordField, EmailField, IntegerField, DateField, TextAreaField, SelectField, BooleanField
+from wtforms.validators import DataRequired, Length, Email, EqualTo, NumberRange, ValidationError
+
+from isbn import InvalidISBN, normalize_isbn
+
+class LoginForm(FlaskForm):
+    username = StringField('用户名', validators=[DataRequired()])
+    password = PasswordField('密码', validators=[DataRequired()])
+    remember = BooleanField('记住我')
+
+class UserRegistrationForm(FlaskForm):
+    username = StringField('用户名', validators=[DataRequired(), Length(min=4, max=20)])
+    email = EmailField('邮箱', validators=[DataRequired(), Email()])
+    full_name = StringField('姓名', validators=[DataRequired(), Length(max=100)])
+    phone = StringField('手机号', validators=[Length(max=20)])
+    address = TextAreaField('地址')
+    password = PasswordField('密码', validators=[DataRequired(), Length(min=6)])
+    password2 = PasswordField('确认密码', validators=[DataRequired(), EqualTo('password')])
+
+class BookForm(FlaskForm):
+    title = StringField('书名', validators=[DataRequired(), Length(max=200)])
+    author = StringField('作者', validators=[DataRequired(), Length(max=100)])
+    isbn = StringField('ISBN', validators=[DataRequired(), Length(max=20)])
+    publisher = StringField('出版社', validators=[Length(max=100)])
+    publication_date = DateField('出版日期')
+    quantity = IntegerField('数量', validators=[DataRequired(), NumberRange(min=1)])
+    description = TextAreaField('描述')
+    category_id = SelectField('分类', coerce=int, validators=[DataRequired()])
+
+    def validate_isbn(self, field):
+        try:
+            normalize_isbn(field.data)
+        except InvalidISBN as e:
+            raise ValidationError(str(e))
+
+class CategoryForm(FlaskForm):
+    name = StringField('分类名称', validators=[DataRequired(), Length(max=100)])
+    description = TextAreaField('描述')
+
+class BookImportForm(FlaskForm):
+    file = FileField('图书目录文件', validators=[FileRequired(), FileAllowed(['csv', 'jsonl', 'ndjson'], '只支持 CSV 或 JSONL 文件')])
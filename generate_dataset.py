@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成大规模测试数据
+
+按指定数量生成分类、图书、用户和借阅记录，用于在本地复现大数据量下的性能问题：
+- 图书和读者的借阅次数服从 Zipf 分布（少数热门图书、活跃读者占大部分借阅）
+- 可以指定已归还比例和在借记录中的逾期比例
+- 在借数量不超过馆藏数量，同一读者不会同时借两本相同的书，available_quantity 与在借记录一致
+- 每本书按馆藏数量生成副本，在借记录指向借出状态的副本
+- 使用批量 INSERT 写入，相同的 --seed 生成相同的数据（日期以生成时刻为基准）
+
+    python generate_dataset.py --database-url sqlite:////tmp/library-1m.db \\
+        --users 50000 --books 100000 --categories 50 --records 1000000 --skip-ngram-index
+
+百万条借阅记录在一分钟内生成完毕：所有行在一个事务中写入，SQLite 连接关闭日志和同步；
+日期预先格式化为文本，不逐行经过列类型转换；二级索引和图书全文索引在写完后一次性建立。
+中文 n-gram 索引的行数与图书、读者数成正比（10 万本书约 250 万行，需要再花 20 秒左右），
+--skip-ngram-index 跳过这一步，之后运行 flask init-db 补建；不跳过时生成结束即可直接搜索。
+
+生成后用 DATABASE_URL=sqlite:////tmp/library-1m.db python app.py 即可在这份数据上运行应用。
+所有读者的密码都是 --password 指定的值（默认 test123）。
+"""
+
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bulk import bulk_insert
+from isbn import isbn13_check_digit
+
+LOAN_DAYS = 30
+
+_CATEGORY_WORDS = ['计算机科学', '文学', '历史', '哲学', '经济', '管理', '艺术', '医学', '法律', '教育',
+                   '数学', '物理', '化学', '生物', '地理', '军事', '体育', '语言', '心理学', '社会学']
+_TITLE_WORDS = ['数据', '算法', '系统', '网络', '设计', '原理', '实践', '导论', '简史', '中国', '世界',
+                '现代', '经典', '研究', '方法', '思想', '文化', '故事', '艺术', '科学', '工程', '分析',
+                '结构', '模型', '理论', '技术', '应用', '基础', '进阶', '指南']
+_TITLE_TERMS = ['Python', 'Java', 'Linux', 'SQL', 'Web', 'AI', 'Go', 'Rust', 'Flask', 'Data']
+_SURNAMES = ['王', '李', '张', '刘', '陈', '杨', '赵', '黄', '周', '吴', '徐', '孙', '胡', '朱', '高', '林']
+_GIVEN_NAMES = ['伟', '芳', '娜', '敏', '静', '丽', '强', '磊', '军', '洋', '勇', '艳', '杰', '娟', '涛', '明',
+                '超', '秀英', '华', '建国', '晓东', '志强', '海燕', '文博']
+_PUBLISHERS = ['人民邮电出版社', '机械工业出版社', '清华大学出版社', '电子工业出版社', '中华书局',
+               '商务印书馆', '人民文学出版社', '上海译文出版社']
+
+
+def zipf_cum_weights(n, exponent):
+    """排名 1..n 的 Zipf 累积权重"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def zipf_sampler(rng, ids, exponent):
+    """返回按 Zipf 分布抽取 ids 中元素的函数；热门程度与 id 顺序无关"""
+    ranked = list(ids)
+    rng.shuffle(ranked)
+    if exponent <= 0:
+        return lambda: ranked[int(rng.random() * len(ranked))]
+    cum_weights = zipf_cum_weights(len(ranked), exponent)
+    total = cum_weights[-1]
+    return lambda: ranked[bisect.bisect_left(cum_weights, rng.random() * total)]
+
+
+def person_name(rng):
+    return rng.choice(_SURNAMES) + rng.choice(_GIVEN_NAMES)
+
+
+# 各生成函数产生的元组按以下列顺序排列
+CATEGORY_COLUMNS = ('id', 'name', 'description', 'created_at')
+BOOK_COLUMNS = ('id', 'title', 'author', 'isbn', 'isbn13', 'publisher', 'quantity', 'available_quantity',
+                'description', 'category_id', 'created_at', 'updated_at')
+USER_COLUMNS = ('id', 'username', 'email', 'password_hash', 'full_name', 'phone', 'created_at')
+RECORD_COLUMNS = ('id', 'user_id', 'book_id', 'copy_id', 'borrow_date', 'due_date', 'return_date', 'status',
+                  'created_at')
+COPY_COLUMNS = ('id', 'book_id', 'barcode', 'status', 'created_at', 'updated_at')
+
+
+# 以下生成函数的 created_at 为 TimestampFormatter 格式化后的文本，写入时用 bulk_insert(..., processed=True)
+def generate_categories(count, created_at):
+    for i in range(count):
+        base = _CATEGORY_WORDS[i % len(_CATEGORY_WORDS)]
+        name = base if i < len(_CATEGORY_WORDS) else f'{base}{i // len(_CATEGORY_WORDS) + 1}'
+        yield i + 1, name, f'{name}类图书', created_at
+
+
+def generate_books(rng, count, num_categories, created_at):
+    for book_id in range(1, count + 1):
+        words = rng.sample(_TITLE_WORDS, 2)
+        title = f'{words[0]}{words[1]}'
+        if rng.random() < 0.4:
+            title += ' ' + rng.choice(_TITLE_TERMS)
+        quantity = rng.randint(1, 10)
+        isbn = f'978{book_id:09d}'
+        isbn += isbn13_check_digit(isbn)
+        yield (book_id, f'{title}（第{book_id}卷）', person_name(rng), isbn, isbn,
+               rng.choice(_PUBLISHERS), quantity, quantity,
+               f'{rng.choice(_TITLE_WORDS)}与{rng.choice(_TITLE_WORDS)}。',
+               rng.randint(1, num_categories), created_at, created_at)
+
+
+def generate_users(rng, count, password_hash, created_at):
+    for user_id in range(1, count + 1):
+        yield (user_id, f'reader{user_id}', f'reader{user_id}@example.com', password_hash,
+               person_name(rng), f'1{rng.randint(3000000000, 9999999999)}', created_at)
+
+
+def copy_offsets(quantities):
+    """每本书的副本按图书 id 顺序连续编号，第 n 册的副本 id 为 offsets[book_id] + n"""
+    offsets = {}
+    total = 0
+    for book_id in sorted(quantities):
+        offsets[book_id] = total
+        total += quantities[book_id]
+    return offsets
+
+
+def generate_copies(quantities, active, created_at):
+    """每本书前 active[book_id] 册为借出状态，与 generate_records 分配给在借记录的副本一致"""
+    from copies import copy_barcode  # 导入 models，需在设置 DATABASE_URL 之后
+
+    offsets = copy_offsets(quantities)
+    for book_id in sorted(quantities):
+        for number in range(1, quantities[book_id] + 1):
+            status = 'borrowed' if number <= active.get(book_id, 0) else 'available'
+            yield offsets[book_id] + number, book_id, copy_barcode(book_id, number), status, created_at, created_at
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_seconds(value):
+    """naive UTC 时间对应的秒数"""
+    return int((value - _EPOCH).total_seconds())
+
+
+class TimestampFormatter:
+    """把 UTC 秒数格式化为 SQLAlchemy 在 SQLite 中保存 DateTime 的文本（精确到秒）
+
+    借阅记录的四个日期列逐行经过列类型的绑定处理函数是生成时最慢的一步；这里按天缓存日期部分，
+    秒数部分查表拼接，写入的文本与 ORM 写入的完全一致。
+    """
+
+    def __init__(self):
+        self._days = {}
+        self._times = [f'{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}.000000'
+                       for second in range(86400)]
+
+    def __call__(self, timestamp):
+        day, second = divmod(timestamp, 86400)
+        prefix = self._days.get(day)
+        if prefix is None:
+            prefix = self._days[day] = (_EPOCH + timedelta(days=day)).strftime('%Y-%m-%d ')
+        return prefix + self._times[second]
+
+
+def generate_records(rng, count, pick_book, pick_user, quantities, active, args, now):
+    """生成借阅记录；quantities 为 book_id 到馆藏数量的映射，active 中累计每本书的在借数量
+
+    在借记录依次占用每本书的第 1、2……册，已归还的记录按记录 id 轮流指向各册。
+    日期列为 TimestampFormatter 格式化后的文本。
+    """
+    offsets = copy_offsets(quantities)
+    active_pairs = set()
+    fmt = TimestampFormatter()
+    now_seconds = epoch_seconds(now)
+    random = rng.random
+    loan = LOAN_DAYS * 86400
+    # 已归还：借出于 horizon 到 LOAN_DAYS 天之前；逾期：借出于 LOAN_DAYS 到 4 × LOAN_DAYS 天之前
+    returned_span = max(args.days * 86400, loan + 1) - loan + 1
+    overdue_span = loan * 3
+    current_span = loan - 3600 + 1
+    returned_ratio = args.returned_ratio
+    overdue_ratio = args.overdue_ratio
+    for record_id in range(1, count + 1):
+        book_id = pick_book()
+        user_id = pick_user()
+        returned = random() < returned_ratio
+        if not returned and (active.get(book_id, 0) >= quantities[book_id] or (user_id, book_id) in active_pairs):
+            returned = True
+
+        if returned:
+            borrowed_at = now_seconds - loan - int(random() * returned_span)
+            # 借出后 1 到 LOAN_DAYS + 10 天内的某一时刻归还
+            returned_at = min(borrowed_at + 86400 + int(random() * (LOAN_DAYS + 10) * 86400), now_seconds)
+            return_date = fmt(returned_at)
+            status = 'returned'
+            copy_number = record_id % quantities[book_id] + 1
+        else:
+            if random() < overdue_ratio:
+                # 借出超过 LOAN_DAYS 天仍未归还
+                borrowed_at = now_seconds - loan - 1 - int(random() * overdue_span)
+            else:
+                borrowed_at = now_seconds - int(random() * current_span)
+            return_date = None
+            status = 'borrowed'
+            active[book_id] = active.get(book_id, 0) + 1
+            active_pairs.add((user_id, book_id))
+            copy_number = active[book_id]
+
+        borrow_date = fmt(borrowed_at)
+        yield (record_id, user_id, book_id, offsets[book_id] + copy_number, borrow_date, fmt(borrowed_at + loan),
+               return_date, status, borrow_date)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='生成大规模测试数据')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='目标数据库，默认使用 DATABASE_URL 或应用配置')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--returned-ratio', type=float, default=0.8, help='已归还记录的比例')
+    parser.add_argument('--overdue-ratio', type=float, default=0.15, help='在借记录中已逾期的比例')
+    parser.add_argument('--book-skew', type=float, default=1.0, help='图书热度的 Zipf 指数，0 为均匀分布')
+    parser.add_argument('--user-skew', type=float, default=0.6, help='读者活跃度的 Zipf 指数，0 为均匀分布')
+    parser.add_argument('--days', type=int, default=730, help='借阅记录覆盖最近多少天')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default='test123', help='所有读者的登录密码')
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--force', action='store_true', help='目标数据库已有数据时清空后重新生成')
+    parser.add_argument('--skip-ngram-index', action='store_true',
+                        help='不建立中文 n-gram 索引，之后由 flask init-db 补建（中文搜索在此之前没有结果）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.database_url:
+        # 必须在导入 config 之前设置
+        os.environ['DATABASE_URL'] = args.database_url
+
+    from werkzeug.security import generate_password_hash
+
+    from cli import init_database
+    from database import create_db_app
+    from models import db, Book, BookCopy, BorrowRecord, Category, User
+    from search import ensure_book_search_index, rebuild_ngram_index, suspend_book_search_index
+    from sqlite_tuning import analyze
+    from stats import reconcile_library_stats
+
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    created_at = TimestampFormatter()(epoch_seconds(now))
+
+    app = create_db_app()
+    with app.app_context():
+        if args.force:
+            db.drop_all()
+        elif db.inspect(db.engine).has_table(BorrowRecord.__tablename__) and (
+                db.session.query(Book.id).first() or db.session.query(User.id).first()):
+            print('目标数据库已有图书或读者，使用 --force 清空后重新生成', file=sys.stderr)
+            return 1
+        db.session.remove()
+        init_database()
+
+        engine = db.engine
+        # 关闭其他连接，WAL 模式需要独占数据库才能切换日志模式
+        engine.dispose()
+        indexes = [index for model in (Book, User, BorrowRecord, BookCopy) for index in model.__table__.indexes]
+        with engine.begin() as connection:
+            if engine.dialect.name == 'sqlite':
+                # 只影响本次生成使用的连接：不写日志（WAL 模式下每页要先写 -wal 再写回数据库）、
+                # 不等待落盘，加大页缓存加快建索引时的排序。中途失败时用 --force 重新生成
+                connection.exec_driver_sql('PRAGMA journal_mode=OFF')
+                connection.exec_driver_sql('PRAGMA synchronous=OFF')
+                connection.exec_driver_sql('PRAGMA cache_size=-262144')
+            # 先删除各表的二级索引，写完后一次性重建，比逐行维护索引快得多
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+            suspend_book_search_index(connection)
+
+            bulk_insert(connection, Category.__table__, CATEGORY_COLUMNS,
+                        generate_categories(args.categories, created_at), args.batch_size, processed=True)
+
+            books = list(generate_books(rng, args.books, args.categories, created_at))
+            quantity_index = BOOK_COLUMNS.index('quantity')
+            quantities = {book[0]: book[quantity_index] for book in books}
+            bulk_insert(connection, Book.__table__, BOOK_COLUMNS, books, args.batch_size, processed=True)
+            print(f'图书 {len(books)} 本，{time.perf_counter() - started:.1f}s')
+
+            password_hash = generate_password_hash(args.password)
+            users = bulk_insert(connection, User.__table__, USER_COLUMNS,
+                                generate_users(rng, args.users, password_hash, created_at), args.batch_size,
+                                processed=True)
+            print(f'读者 {users} 人，{time.perf_counter() - started:.1f}s')
+
+            pick_book = zipf_sampler(rng, range(1, args.books + 1), args.book_skew)
+            pick_user = zipf_sampler(rng, range(1, args.users + 1), args.user_skew)
+            active = {}
+            records = bulk_insert(connection, BorrowRecord.__table__, RECORD_COLUMNS,
+                                  generate_records(rng, args.records, pick_book, pick_user, quantities, active, args, now),
+                                  args.batch_size, processed=True)
+            print(f'借阅记录 {records} 条，{time.perf_counter() - started:.1f}s')
+
+            # 可借数量 = 馆藏数量 - 在借数量
+            if active:
+                connection.execute(
+                    Book.__table__.update()
+                    .where(Book.__table__.c.id == db.bindparam('book_id'))
+                    .values(available_quantity=Book.__table__.c.quantity - db.bindparam('borrowed')),
+                    [{'book_id': book_id, 'borrowed': borrowed} for book_id, borrowed in active.items()]
+                )
+
+            copies = bulk_insert(connection, BookCopy.__table__, COPY_COLUMNS,
+                                 generate_copies(quantities, active, created_at), args.batch_size, processed=True)
+            print(f'馆藏副本 {copies} 册，{time.perf_counter() - started:.1f}s')
+
+            for index in indexes:
+                index.create(connection)
+            print(f'索引重建完成，{time.perf_counter() - started:.1f}s')
+
+        ensure_book_search_index(rebuild=True)
+        if not args.skip_ngram_index:
+            grams = rebuild_ngram_index()
+            print(f'n-gram 索引 {grams} 行，{time.perf_counter() - started:.1f}s')
+
+        counts = reconcile_library_stats()
+        with engine.begin() as connection:
+            analyze(connection)
+        print(f'完成：{counts}，共 {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
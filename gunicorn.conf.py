@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置：pre-fork 多进程，每个进程多线程
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+主进程先导入应用（preload_app），再 fork 出工作进程，模板、模块只加载一次，
+工作进程共享这部分内存。fork 后每个工作进程丢弃继承来的数据库连接池，
+各自重新建立连接，避免多个进程共用同一个 socket / 文件句柄。
+
+环境变量：
+- BIND：监听地址，默认 0.0.0.0:8000
+- WEB_CONCURRENCY：工作进程数，默认 CPU 核数 * 2 + 1
+- WEB_THREADS：每个进程的线程数，默认 4
+- WEB_TIMEOUT：请求超时秒数，默认 30
+- WEB_MAX_REQUESTS：处理多少个请求后重启工作进程，默认 0（不重启）
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    from app import app
+    from db_routing import dispose_engines
+    from models import db
+
+    dispose_engines(app, db)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登录身份解析
+
+会话中保存的 id 形如 admin:1 或 user:1（见 models.PrincipalMixin），load_principal()
+按前缀只查询一张表。另外可以在进程内缓存已登录用户的字段（IDENTITY_CACHE_TTL 秒，
+LRU 淘汰），命中时不访问数据库，直接把对象放回当前会话。
+
+管理员或用户的资料、密码被修改或删除（包括批量 update/delete）后，提交事务时清除对应缓存。
+缓存只在当前进程内有效，多进程部署时其他进程最多在 TTL 内读到旧资料。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from models import db, Admin, User
+
+PRINCIPAL_MODELS = {model.principal_type: model for model in (Admin, User)}
+
+
+class IdentityCache:
+    """按 (类型, id) 缓存登录主体的列值，带 TTL 和 LRU 上限"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, values = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return values
+
+    def set(self, key, values, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_type(self, principal_type):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == principal_type]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def parse_principal_id(value):
+    """解析会话中的 id，返回 (模型, 主键)；旧格式的纯数字 id 模型为 None，无法解析时返回 None"""
+    principal_type, _, pk = str(value).rpartition(':')
+    try:
+        pk = int(pk)
+    except ValueError:
+        return None
+    if not principal_type:
+        return None, pk
+    model = PRINCIPAL_MODELS.get(principal_type)
+    if model is None:
+        return None
+    return model, pk
+
+
+def _column_values(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in db.inspect(obj).mapper.column_attrs}
+
+
+def _from_cache(model, values):
+    """用缓存的列值构造对象并并入当前会话，不执行 SQL"""
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+
+def load_principal(value):
+    """Flask-Login 的 user_loader：按会话中的 id 返回 Admin 或 User，找不到时返回 None"""
+    parsed = parse_principal_id(value)
+    if parsed is None:
+        return None
+    model, pk = parsed
+
+    if model is None:
+        # 升级前登录的会话仍保存纯数字 id，按原来的顺序查找，重新登录后即为新格式
+        return db.session.get(Admin, pk) or db.session.get(User, pk)
+
+    ttl = current_app.config.get('IDENTITY_CACHE_TTL', 0)
+    key = (model.principal_type, pk)
+    if ttl > 0:
+        values = identity_cache.get(key)
+        if values is not None:
+            return _from_cache(model, values)
+
+    obj = db.session.get(model, pk)
+    if obj is not None and ttl > 0:
+        identity_cache.set(key, _column_values(obj), ttl)
+    return obj
+
+
+_PENDING_KEY = 'identity_cache_dirty'
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_flush(session, flush_context):
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, (Admin, User)):
+            session.info.setdefault(_PENDING_KEY, set()).add((obj.principal_type, obj.id))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_bulk(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    for mapper in orm_execute_state.all_mappers:
+        if mapper.class_ in (Admin, User):
+            # 批量语句不知道具体影响了哪些行，整类失效
+            orm_execute_state.session.info.setdefault(_PENDING_KEY, set()).add((mapper.class_.principal_type, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate(session):
+    for principal_type, pk in session.info.pop(_PENDING_KEY, ()):
+        if pk is None:
+            identity_cache.invalidate_type(principal_type)
+        else:
+            identity_cache.invalidate((principal_type, pk))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -14,8 +14,10 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
     # 导入Flask应用和模型
-    from app import app, db
-    from models import Admin, User, Category, Book, BorrowRecord
+    from database import create_db_app
+    from models import db, Admin, User, Category, Book, BorrowRecord
+
+    app = create_db_app()
 
     def init_database():
         """初始化SQLite数据库"""
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL 语句计数和请求级 SQL 剖析
+
+count_queries() 记录一段代码（通常是一次测试客户端请求）执行的 SQL 语句，
+assert_max_queries() 在语句数超出预期时抛出 AssertionError 并列出全部语句，
+用于在测试中发现 N+1 懒加载之类的回归。只统计当前线程执行的语句；
+不指定 engine 时统计所有 engine（包括读写分离的只读 engine）。
+
+init_request_profiling() 为每个请求记录 SQL 语句数、数据库总耗时和最慢的几条语句：
+- SQL_PROFILE_HEADERS（默认跟随 debug）开启时写入 X-SQL-Count / X-SQL-Time-Ms 响应头
+- 数据库耗时超过 SLOW_REQUEST_DB_MS，或有语句超过 SLOW_QUERY_MS 时，输出一行 JSON 日志
+- 所有语句按 SQL 文本汇总到 sql_report，/admin/sql-report 按总耗时列出前 N 条
+"""
+
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from flask import current_app, request
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    """收集当前线程在 engine（为 None 时为所有 engine）上执行的 SQL 语句"""
+
+    def __init__(self, engine=None):
+        self.engine = engine if engine is not None else Engine
+        self.statements = []
+        self.parameters = []
+        self._thread_id = threading.get_ident()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread_id:
+            self.statements.append(statement)
+            self.parameters.append(parameters)
+
+    def start(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def stop(self):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def report(self):
+        return '\n'.join(f'{i}. {statement}' for i, statement in enumerate(self.statements, 1))
+
+
+@contextmanager
+def count_queries(engine=None):
+    """with count_queries() as counter: ...  执行完毕后 counter.count 为语句数"""
+    counter = QueryCounter(engine)
+    counter.start()
+    try:
+        yield counter
+    finally:
+        counter.stop()
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """代码块执行的 SQL 语句超过 limit 条时失败"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(f'执行了 {counter.count} 条 SQL 语句，预期不超过 {limit} 条：\n{counter.report()}')
+
+
+class RequestProfile:
+    """一次请求内执行的 SQL 语句及耗时（秒）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = []
+
+    @property
+    def count(self):
+        return len(self.timings)
+
+    @property
+    def db_time(self):
+        return sum(elapsed for elapsed, _ in self.timings)
+
+    def slowest(self, limit):
+        return sorted(self.timings, key=lambda item: item[0], reverse=True)[:limit]
+
+
+# IN (?, ?, ?) 按参数个数会产生不同的 SQL 文本，汇总时合并为一条
+_IN_LIST = re.compile(r'\((?:\?|%s|:\w+)(?:,\s*(?:\?|%s|:\w+))+\)')
+
+
+def normalize_statement(statement):
+    return _IN_LIST.sub('(?...)', ' '.join(statement.split()))
+
+
+class SlowQueryReport:
+    """按 SQL 文本汇总各请求的语句耗时，最多保留 max_statements 种语句"""
+
+    def __init__(self, max_statements=500):
+        self.max_statements = max_statements
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def add(self, profile, endpoint=None):
+        grouped = {}
+        for elapsed, statement in profile.timings:
+            grouped.setdefault(normalize_statement(statement), []).append(elapsed)
+        with self._lock:
+            for statement, timings in grouped.items():
+                entry = self._stats.get(statement)
+                if entry is None:
+                    if len(self._stats) >= self.max_statements:
+                        # 已满时淘汰总耗时最少的语句
+                        del self._stats[min(self._stats, key=lambda key: self._stats[key]['total'])]
+                    entry = self._stats[statement] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'endpoints': set()}
+                entry['calls'] += len(timings)
+                entry['total'] += sum(timings)
+                entry['max'] = max(entry['max'], max(timings))
+                if endpoint and len(entry['endpoints']) < 5:
+                    entry['endpoints'].add(endpoint)
+
+    def top(self, limit=20, sort='total'):
+        """按 sort（total / max / calls）降序返回前 limit 条，耗时单位为毫秒"""
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: item[1][sort], reverse=True)[:limit]
+            return [{
+                'statement': statement,
+                'calls': entry['calls'],
+                'total_ms': round(entry['total'] * 1000, 2),
+                'mean_ms': round(entry['total'] * 1000 / entry['calls'], 3),
+                'max_ms': round(entry['max'] * 1000, 2),
+                'endpoints': sorted(entry['endpoints']),
+            } for statement, entry in items]
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+sql_report = SlowQueryReport()
+_profiling = threading.local()
+
+
+def current_profile():
+    return getattr(_profiling, 'profile', None)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None and context is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = getattr(context, '_profile_started', None)
+    if profile is not None and started is not None:
+        profile.timings.append((time.perf_counter() - started, statement))
+
+
+def _start_profile():
+    _profiling.profile = RequestProfile()
+
+
+def _finish_profile(response):
+    profile = current_profile()
+    if profile is None:
+        return response
+    _profiling.profile = None
+    config = current_app.config
+    sql_report.add(profile, request.endpoint)
+
+    db_ms = profile.db_time * 1000
+    headers = config.get('SQL_PROFILE_HEADERS')
+    if current_app.debug if headers is None else headers:
+        response.headers['X-SQL-Count'] = str(profile.count)
+        response.headers['X-SQL-Time-Ms'] = f'{db_ms:.2f}'
+
+    slowest = profile.slowest(config.get('SQL_SLOWEST_PER_REQUEST', 3))
+    slow_statement = slowest and slowest[0][0] * 1000 >= config.get('SLOW_QUERY_MS', 100)
+    if db_ms >= config.get('SLOW_REQUEST_DB_MS', 200) or slow_statement:
+        current_app.logger.warning('slow_request %s', json.dumps({
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'statements': profile.count,
+            'db_ms': round(db_ms, 2),
+            'request_ms': round((time.perf_counter() - profile.started) * 1000, 2),
+            'slowest': [{'ms': round(elapsed * 1000, 2), 'sql': normalize_statement(statement)}
+                        for elapsed, statement in slowest],
+        }, ensure_ascii=False))
+    return response
+
+
+def _discard_profile(exc):
+    _profiling.profile = None
+
+
+def init_request_profiling(app):
+    """为 app 的每个请求记录 SQL 语句数和耗时；SQL_PROFILING 为 False 时不启用"""
+    if not app.config.get('SQL_PROFILING', True):
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
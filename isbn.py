@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ISBN 规范化
+
+同一本书的 ISBN 可能写成 978-7-115-42802-8、9787115428028 或对应的 10 位 ISBN。
+图书在 isbn 列保存录入时的写法，另在带唯一索引的 isbn13 列保存规范化后的 13 位 ISBN：
+去掉连字符和空白，10 位 ISBN 转换为 978 开头的 13 位，并检查校验位。
+按 ISBN 精确查找（查重、搜索、扫码）都使用 isbn13 列。
+"""
+
+import re
+
+_SEPARATORS_RE = re.compile(r'[\s\-\u2010-\u2015]+')  # 空白、连字符和全角破折号
+_ISBN10_RE = re.compile(r'\d{9}[\dX]')
+_ISBN13_RE = re.compile(r'97[89]\d{10}')
+
+
+class InvalidISBN(ValueError):
+    """不是合法的 ISBN"""
+
+
+def isbn13_check_digit(first12):
+    weights = (1, 3) * 6
+    return str(-sum(int(digit) * weight for digit, weight in zip(first12, weights)) % 10)
+
+
+def isbn10_check_digit(first9):
+    remainder = -sum(int(digit) * weight for digit, weight in zip(first9, range(10, 1, -1))) % 11
+    return 'X' if remainder == 10 else str(remainder)
+
+
+def normalize_isbn(value):
+    """返回规范化的 13 位 ISBN，格式或校验位不正确时抛出 InvalidISBN"""
+    compact = _SEPARATORS_RE.sub('', value or '').upper()
+    if _ISBN13_RE.fullmatch(compact):
+        if isbn13_check_digit(compact[:12]) != compact[12]:
+            raise InvalidISBN(f'ISBN 校验位不正确：{value}')
+        return compact
+    if _ISBN10_RE.fullmatch(compact):
+        if isbn10_check_digit(compact[:9]) != compact[9]:
+            raise InvalidISBN(f'ISBN 校验位不正确：{value}')
+        first12 = '978' + compact[:9]
+        return first12 + isbn13_check_digit(first12)
+    raise InvalidISBN(f'ISBN 应为 10 位或 978/979 开头的 13 位：{value}')
+
+
+def to_isbn13(value):
+    """同 normalize_isbn，不合法时返回 None"""
+    try:
+        return normalize_isbn(value)
+    except InvalidISBN:
+        return None
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus 格式的 /metrics 接口
+
+- library_http_requests_total / library_http_request_duration_seconds：按 Flask endpoint 统计的请求数和延迟直方图
+- library_sql_statements_total / library_sql_duration_seconds_total：按 endpoint 统计的 SQL 语句数和耗时
+  （来自 instrumentation 的请求剖析，SQL_PROFILING 关闭时没有这两项）
+- library_db_pool_connections：主库和只读 engine 连接池的占用情况
+- 业务指标：在借、逾期数量读取 library_stats 计数行，馆藏和可借册数的 SUM 缓存 METRICS_GAUGE_TTL 秒
+
+请求路径上每个线程只累加自己的计数器，不加锁；抓取时汇总所有线程的数据，
+已结束线程的数据并入一份总计后丢弃，线程不断新建（例如开发服务器）时内存也不会增长。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, g, request
+from sqlalchemy import func
+
+from db_routing import READ_ENGINE_KEY
+from instrumentation import current_profile
+from models import db, Book
+from stats import get_library_stats
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    """一个线程的累计数据"""
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.requests = {}    # (endpoint, method, status) -> 次数
+        self.durations = {}   # endpoint -> [各桶次数..., 总秒数]
+        self.sql = {}         # endpoint -> [语句数, 总秒数]
+
+    def observe(self, endpoint, method, status, seconds, statements=None, db_seconds=0.0):
+        key = (endpoint, method, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.durations.get(endpoint)
+        if histogram is None:
+            histogram = self.durations[endpoint] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(DURATION_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+        if statements is not None:
+            totals = self.sql.get(endpoint)
+            if totals is None:
+                totals = self.sql[endpoint] = [0, 0.0]
+            totals[0] += statements
+            totals[1] += db_seconds
+
+    def merge(self, other):
+        for key, count in other.requests.copy().items():
+            self.requests[key] = self.requests.get(key, 0) + count
+        for endpoint, histogram in other.durations.copy().items():
+            mine = self.durations.setdefault(endpoint, [0] * (len(DURATION_BUCKETS) + 1) + [0.0])
+            for i, value in enumerate(list(histogram)):
+                mine[i] += value
+        for endpoint, totals in other.sql.copy().items():
+            mine = self.sql.setdefault(endpoint, [0, 0.0])
+            mine[0] += totals[0]
+            mine[1] += totals[1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()  # 只在线程首次记录和抓取时使用
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def snapshot(self):
+        """汇总所有线程的数据，返回一个新的 _Shard"""
+        total = _Shard()
+        with self._lock:
+            alive = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    self._retired.merge(shard)
+            self._shards = alive
+            total.merge(self._retired)
+        for shard in alive:
+            total.merge(shard)
+        return total
+
+    def clear(self):
+        with self._lock:
+            self._shards = []
+            self._retired = _Shard()
+        self._local = threading.local()
+
+
+registry = MetricsRegistry()
+_copies_cache = {'expires': 0.0, 'value': None}
+
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _book_copies():
+    """(馆藏册数, 可借册数)，缓存 METRICS_GAUGE_TTL 秒"""
+    now = time.monotonic()
+    if _copies_cache['value'] is None or now >= _copies_cache['expires']:
+        total, available = db.session.query(
+            func.coalesce(func.sum(Book.quantity), 0), func.coalesce(func.sum(Book.available_quantity), 0)).one()
+        _copies_cache['value'] = (int(total), int(available))
+        _copies_cache['expires'] = now + current_app.config.get('METRICS_GAUGE_TTL', 15)
+    return _copies_cache['value']
+
+
+def _pool_lines(engines):
+    lines = ['# HELP library_db_pool_connections Database pool connections by state',
+             '# TYPE library_db_pool_connections gauge']
+    for name, engine in engines:
+        pool = engine.pool
+        for state, method in (('size', 'size'), ('checked_out', 'checkedout'),
+                              ('idle', 'checkedin'), ('overflow', 'overflow')):
+            if hasattr(pool, method):
+                # QueuePool.overflow() 在连接数未达到 size 时为负数
+                value = max(getattr(pool, method)(), 0)
+                lines.append(f'library_db_pool_connections{_labels(engine=name, state=state)} {value}')
+    return lines
+
+
+def render_metrics():
+    data = registry.snapshot()
+    lines = ['# HELP library_http_requests_total HTTP requests by endpoint, method and status',
+             '# TYPE library_http_requests_total counter']
+    for (endpoint, method, status), count in sorted(data.requests.items()):
+        lines.append(f'library_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    lines += ['# HELP library_http_request_duration_seconds HTTP request latency by endpoint',
+              '# TYPE library_http_request_duration_seconds histogram']
+    for endpoint, histogram in sorted(data.durations.items()):
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + ('+Inf',), histogram):
+            cumulative += count
+            lines.append(f'library_http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {cumulative}')
+        lines.append(f'library_http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {histogram[-1]:.6f}')
+        lines.append(f'library_http_request_duration_seconds_count{_labels(endpoint=endpoint)} {cumulative}')
+
+    if data.sql:
+        lines += ['# HELP library_sql_statements_total SQL statements executed by endpoint',
+                  '# TYPE library_sql_statements_total counter']
+        lines += [f'library_sql_statements_total{_labels(endpoint=endpoint)} {totals[0]}'
+                  for endpoint, totals in sorted(data.sql.items())]
+        lines += ['# HELP library_sql_duration_seconds_total Time spent in SQL statements by endpoint',
+                  '# TYPE library_sql_duration_seconds_total counter']
+        lines += [f'library_sql_duration_seconds_total{_labels(endpoint=endpoint)} {totals[1]:.6f}'
+                  for endpoint, totals in sorted(data.sql.items())]
+
+    engines = [('primary', db.engine)]
+    if current_app.extensions.get(READ_ENGINE_KEY) is not None:
+        engines.append(('read', current_app.extensions[READ_ENGINE_KEY]))
+    lines += _pool_lines(engines)
+
+    stats = get_library_stats()
+    total_copies, available_copies = _book_copies()
+    gauges = (
+        ('library_active_borrows', 'Books currently borrowed', stats['active_borrows']),
+        ('library_overdue_records', 'Borrowed books past their due date', stats['overdue_records']),
+        ('library_books', 'Book titles in the catalog', stats['total_books']),
+        ('library_users', 'Registered readers', stats['total_users']),
+        ('library_total_copies', 'Copies in the catalog', total_copies),
+        ('library_available_copies', 'Copies available to borrow', available_copies),
+    )
+    for name, help_text, value in gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    profile = current_profile()
+    registry.shard().observe(
+        request.endpoint or 'none', request.method, response.status_code, time.perf_counter() - started,
+        statements=profile.count if profile is not None else None,
+        db_seconds=profile.db_time if profile is not None else 0.0,
+    )
+    return response
+
+
+def metrics_view():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """注册请求计时钩子和 /metrics；需在 init_request_profiling 之后调用，才能读到本请求的 SQL 统计"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
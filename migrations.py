@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带版本号的数据库迁移
+
+db.create_all() 只会创建缺少的表，不会给已有的表补索引或新列。这类结构变更写成
+MIGRATIONS 中的一个迁移，按版本号顺序执行，执行过的版本记录在 schema_migrations 表中，
+每个迁移在单独的事务里执行，只会执行一次。
+
+新建的数据库由 create_all() 按模型直接建好，迁移需要能在这种情况下重复执行（例如建索引时
+checkfirst=True）。`flask --app wsgi init-db` 会自动执行，也可以手动运行
+`python migrations.py`。
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, inspect, select, update
+
+from copies import backfill_copies
+from isbn import to_isbn13
+from models import (db, Book, BookCopy, BorrowRecord, LibraryStats, SchemaMigration, User,
+                    RETURN_SORT_DATE_EXPRESSION)
+from sqlite_tuning import analyze
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """注册一个迁移，被装饰的函数接收当前事务的 connection"""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+
+def _add_column(connection, model, name, ddl):
+    """已有的表没有这一列时用 ALTER TABLE 补上"""
+    if name not in {column['name'] for column in inspect(connection).get_columns(model.__tablename__)}:
+        connection.exec_driver_sql(f'ALTER TABLE {model.__tablename__} ADD COLUMN {name} {ddl}')
+
+
+def _create_indexes(connection, model, names):
+    indexes = {index.name: index for index in model.__table__.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+@migration(1, '借阅记录常用筛选的复合索引')
+def add_borrow_record_indexes(connection):
+    _create_indexes(connection, BorrowRecord, (
+        'ix_borrow_records_status_due_date',
+        'ix_borrow_records_user_status_due_date',
+        'ix_borrow_records_user_created_at',
+        'ix_borrow_records_book_status',
+        'ix_borrow_records_borrow_date',
+    ))
+
+
+ISBN_BACKFILL_BATCH_SIZE = 1000
+
+
+@migration(2, '图书规范化 ISBN-13 列及唯一索引')
+def add_book_isbn13(connection):
+    _add_column(connection, Book, 'isbn13', 'VARCHAR(13)')
+
+    # 按 id 分批回填；规范化后与前面的图书重复的保留为空，由管理员核对后修改
+    statement = update(Book.__table__).where(Book.__table__.c.id == bindparam('book_id')).values(isbn13=bindparam('value'))
+    seen = set()
+    invalid = duplicated = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(Book.id, Book.isbn).where(Book.id > last_id).order_by(Book.id).limit(ISBN_BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for book_id, value in rows:
+            isbn13 = to_isbn13(value)
+            if isbn13 is None:
+                invalid += 1
+            elif isbn13 in seen:
+                duplicated += 1
+                isbn13 = None
+            else:
+                seen.add(isbn13)
+            updates.append({'book_id': book_id, 'value': isbn13})
+        connection.execute(statement, updates)
+        last_id = rows[-1].id
+
+    _create_indexes(connection, Book, ('ix_books_isbn13',))
+    if invalid or duplicated:
+        print(f"isbn13 回填：{invalid} 本图书 ISBN 不合法，{duplicated} 本与其他图书的 ISBN 重复，isbn13 留空")
+
+
+@migration(3, '馆藏副本表、借阅记录的副本列和副本计数核对时间')
+def add_book_copies(connection):
+    BookCopy.__table__.create(connection, checkfirst=True)
+    _add_column(connection, BorrowRecord, 'copy_id', 'INTEGER REFERENCES book_copies (id)')
+    _add_column(connection, LibraryStats, 'copies_checked_at', 'DATETIME')
+    _create_indexes(connection, Book, ('ix_books_updated_at',))
+
+    # 按 quantity 为已有图书建立副本，在借记录各分配一册，计数按副本重新计算
+    created, assigned = backfill_copies(connection)
+    if created:
+        print(f"馆藏副本：新建 {created} 册，{assigned} 条在借记录已分配副本")
+
+
+@migration(4, '借阅记录列表各排序方式的索引和归还时间排序列')
+def add_borrow_record_sort_indexes(connection):
+    _add_column(connection, BorrowRecord, 'return_sort_date',
+                f'DATETIME GENERATED ALWAYS AS ({RETURN_SORT_DATE_EXPRESSION}) VIRTUAL')
+    _create_indexes(connection, BorrowRecord, (
+        'ix_borrow_records_status_borrow_date',
+        'ix_borrow_records_due_date',
+        'ix_borrow_records_return_sort_date',
+    ))
+    _create_indexes(connection, User, ('ix_users_full_name',))
+    analyze(connection)
+
+
+def applied_versions():
+    return {version for (version,) in db.session.query(SchemaMigration.version)}
+
+
+def upgrade():
+    """执行所有未执行的迁移，返回本次执行的版本号列表"""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    done = applied_versions()
+    applied = []
+    for version, description, func in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            func(db.session.connection())
+            db.session.add(SchemaMigration(version=version, description=description,
+                                           applied_at=datetime.utcnow()))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+if __name__ == '__main__':
+    from database import create_db_app
+
+    with create_db_app().app_context():
+        db.create_all()
+        applied = upgrade()
+        if applied:
+            print(f"已执行迁移：{', '.join(str(version) for version in applied)}")
+        else:
+            print("数据库已是最新版本")
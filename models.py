@@ -3,11 +3,23 @@ from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from db_routing import RoutingSession
+from isbn import to_isbn13
+
+# RoutingSession 在 GET 请求中把查询发往只读 engine，见 db_routing.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# 登录主体：会话中保存的 id 带上类型前缀（admin:1 / user:1），管理员和用户的 id 不会混淆
+class PrincipalMixin(UserMixin):
+    principal_type = None
+
+    def get_id(self):
+        return f'{self.principal_type}:{self.id}'
 
 # 管理员表
-class Admin(db.Model, UserMixin):
+class Admin(db.Model, PrincipalMixin):
     __tablename__ = 'admins'
+    principal_type = 'admin'
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -22,8 +34,9 @@ class Admin(db.Model, UserMixin):
         return check_password_hash(self.password_hash, password)
 
 # 用户表
-class User(db.Model, UserMixin):
+class User(db.Model, PrincipalMixin):
     __tablename__ = 'users'
+    principal_type = 'user'
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -37,6 +50,11 @@ class User(db.Model, UserMixin):
     # 关系：一个用户可以有多条借阅记录
     borrow_records = db.relationship('BorrowRecord', backref='user', lazy=True)
 
+    # 借阅记录列表按读者姓名排序时按此索引依次取各读者的记录
+    __table_args__ = (
+        db.Index('ix_users_full_name', 'full_name'),
+    )
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -53,7 +71,11 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # 关系：一个分类可以有多本书
-    books = db.relationship('Book', backref='category', lazy=True)
+    # 删除分类前图书已被批量移走，passive_deletes 避免再加载整个集合
+    books = db.relationship('Book', backref='category', lazy=True, passive_deletes=True)
+
+    # 图书数量，仅在查询时通过 with_expression() 填充，未填充时为 None
+    book_count = db.query_expression()
 
 # 图书表
 class Book(db.Model):
@@ -63,6 +85,8 @@ class Book(db.Model):
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(100), nullable=False)
     isbn = db.Column(db.String(20), unique=True, nullable=False)
+    # 规范化的 13 位 ISBN，随 isbn 自动更新；isbn 不合法时为空，见 isbn.py
+    isbn13 = db.Column(db.String(13))
     publisher = db.Column(db.String(100))
     publication_date = db.Column(db.Date)
     quantity = db.Column(db.Integer, default=1)
@@ -75,6 +99,38 @@ class Book(db.Model):
     # 关系：一本书可以有多条借阅记录
     borrow_records = db.relationship('BorrowRecord', backref='book', lazy=True)
 
+    # 按 ISBN 精确查找走 isbn13 索引；updated_at 索引供副本计数的增量核对使用，见 copies.py。
+    # 由 migrations.py 为已有数据库补建
+    __table_args__ = (
+        db.Index('ix_books_isbn13', 'isbn13', unique=True),
+        db.Index('ix_books_updated_at', 'updated_at'),
+    )
+
+    @db.validates('isbn')
+    def _set_isbn13(self, key, value):
+        self.isbn13 = to_isbn13(value)
+        return value
+
+# 馆藏副本表：每一册书一行，带贴在书上的条码。
+# Book.quantity / available_quantity 是按副本状态在同一事务中维护的计数，见 copies.py
+class BookCopy(db.Model):
+    __tablename__ = 'book_copies'
+
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    barcode = db.Column(db.String(32), unique=True, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='available')  # available, borrowed, withdrawn
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_book_copies_book_status', 'book_id', 'status'),
+        db.Index('ix_book_copies_updated_at', 'updated_at'),
+    )
+
+RETURN_SORT_DATE_EXPRESSION = "coalesce(return_date, '0001-01-01 00:00:00.000000')"
+
+
 # 借阅记录表
 class BorrowRecord(db.Model):
     __tablename__ = 'borrow_records'
@@ -82,12 +138,32 @@ class BorrowRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    # 借出的那一册；副本表建立之前已归还的记录可能为空
+    copy_id = db.Column(db.Integer, db.ForeignKey('book_copies.id'))
     borrow_date = db.Column(db.DateTime, default=datetime.utcnow)
     due_date = db.Column(db.DateTime, nullable=False)
     return_date = db.Column(db.DateTime)
+    # 按归还时间排序用的虚拟列：未归还（return_date 为空）的记录取最早时间，倒序时排在最后，
+    # 可以直接建索引，也可以作为游标比较
+    return_sort_date = db.Column(db.DateTime, db.Computed(RETURN_SORT_DATE_EXPRESSION))
     status = db.Column(db.String(20), default='borrowed')  # borrowed, returned, overdue
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    copy = db.relationship('BookCopy', lazy=True)
+
+    # 与借阅记录列表、用户仪表板、借阅历史和逾期统计的查询条件对应，由 migrations.py 为已有数据库补建
+    __table_args__ = (
+        db.Index('ix_borrow_records_status_due_date', 'status', 'due_date'),
+        db.Index('ix_borrow_records_user_status_due_date', 'user_id', 'status', 'due_date'),
+        db.Index('ix_borrow_records_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_borrow_records_book_status', 'book_id', 'status'),
+        db.Index('ix_borrow_records_borrow_date', 'borrow_date'),
+        # 记录列表的各种排序
+        db.Index('ix_borrow_records_status_borrow_date', 'status', 'borrow_date'),
+        db.Index('ix_borrow_records_due_date', 'due_date'),
+        db.Index('ix_borrow_records_return_sort_date', 'return_sort_date'),
+    )
+
     def is_overdue(self):
         if self.return_date:
             return False
@@ -95,4 +171,41 @@ class BorrowRecord(db.Model):
 
     def extend_due_date(self, days):
         if self.due_date:
-            self.due_date = self.due_date + timedelta(days=days)
\ No newline at end of file
+            self.due_date = self.due_date + timedelta(days=days)
+
+# 检索用 n-gram 倒排表：记录某个实体的某个字段包含哪些 n-gram
+class SearchGram(db.Model):
+    __tablename__ = 'search_grams'
+
+    entity = db.Column(db.String(20), primary_key=True)  # books, users
+    field = db.Column(db.String(20), primary_key=True)
+    gram = db.Column(db.String(8), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_search_grams_entity_id', 'entity', 'entity_id'),
+    )
+
+# 仪表板统计计数表：只有 id=1 一行，由 stats.py 随写入操作增量维护
+class LibraryStats(db.Model):
+    __tablename__ = 'library_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    total_users = db.Column(db.Integer, nullable=False, default=0)
+    total_books = db.Column(db.Integer, nullable=False, default=0)
+    total_categories = db.Column(db.Integer, nullable=False, default=0)
+    active_borrows = db.Column(db.Integer, nullable=False, default=0)
+    # overdue_records 统计 due_date 早于 overdue_checked_at 的在借记录
+    overdue_records = db.Column(db.Integer, nullable=False, default=0)
+    overdue_checked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # 副本计数上次增量核对的时间，为空时下次核对全部图书，见 copies.py
+    copies_checked_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# 已执行的数据库迁移版本，见 migrations.py
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+游标（keyset）分页
+
+paginate() 与 Flask-SQLAlchemy 的 query.paginate() 返回的对象接口一致，模板中的页码、
+总数等用法不变；另外提供 next_cursor / prev_cursor 两个不透明游标。请求中带上
+after= 或 before= 游标时，按排序键直接定位到上一页最后一行之后（或下一页第一行之前），
+不再使用 OFFSET 扫描前面的行，也不再重复执行 COUNT(*)，总数沿用游标中记录的值。
+
+按页码翻页时总数可以按筛选条件缓存（count_key），在 TTL 内或被写入操作清除前直接复用；
+结果集很大时可以只数到上限（estimate），模板显示为“N+ 条”。
+"""
+
+import base64
+import json
+import threading
+import time
+import zlib
+from datetime import date, datetime
+
+from flask import current_app, request, url_for
+from flask_sqlalchemy.pagination import QueryPagination
+from sqlalchemy import Date, DateTime, and_, event, literal, or_, tuple_
+from sqlalchemy.orm import Session
+
+
+class SortKey:
+    """分页排序键：column 为排序表达式，descending 表示是否倒序"""
+
+    def __init__(self, column, descending=False):
+        self.column = column
+        self.descending = descending
+
+    def order_clause(self, reverse=False):
+        descending = self.descending != reverse
+        return self.column.desc() if descending else self.column.asc()
+
+    def dump(self, value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+    def load(self, value):
+        if value is None:
+            return None
+        if isinstance(self.column.type, DateTime):
+            return datetime.fromisoformat(value)
+        if isinstance(self.column.type, Date):
+            return date.fromisoformat(value)
+        return value
+
+
+def _signature(keys):
+    """排序键签名，排序方式变化后旧游标自动失效"""
+    text = '|'.join(f'{key.column}:{int(key.descending)}' for key in keys)
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def encode_cursor(keys, values, position, total=None, estimated=False):
+    payload = {
+        's': _signature(keys),
+        'v': [key.dump(value) for key, value in zip(keys, values)],
+        'p': position,
+        't': total,
+        'e': int(estimated),
+    }
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(keys, token):
+    """解析游标，格式错误或排序方式不匹配时返回 None"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        if payload['s'] != _signature(keys) or len(payload['v']) != len(keys):
+            return None
+        values = [key.load(value) for key, value in zip(keys, payload['v'])]
+        position = int(payload['p'])
+    except (ValueError, TypeError, KeyError):
+        return None
+    return {
+        'values': values,
+        'position': max(position, 0),
+        'total': payload.get('t'),
+        'estimated': bool(payload.get('e')),
+    }
+
+
+def _seek_condition(keys, values, forward):
+    """排在游标之后（forward）或之前的行"""
+    def compare(key, column, value):
+        greater = key.descending != forward
+        return column > value if greater else column < value
+
+    bound = [literal(value, type_=key.column.type) for key, value in zip(keys, values)]
+    if len({key.descending for key in keys}) == 1:
+        # 方向一致时使用行值比较，数据库可以直接利用复合索引定位
+        return compare(keys[0], tuple_(*[key.column for key in keys]), tuple_(*bound))
+
+    clauses = []
+    for i, key in enumerate(keys):
+        equal = [keys[j].column == bound[j] for j in range(i)]
+        clauses.append(and_(*equal, compare(key, key.column, bound[i])))
+    return or_(*clauses)
+
+
+class CountCache:
+    """按命名空间和筛选条件缓存查询总数，带 TTL，命名空间可整体失效
+
+    缓存在进程内：失效只作用于当前进程，其他工作进程中的缓存要等 TTL 到期。
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            expires, generation, total = entry
+            if expires < time.monotonic() or generation != self._generations.get(namespace, 0):
+                del self._entries[(namespace, key)]
+                return None
+            return total
+
+    def set(self, namespace, key, total, ttl):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            generation = self._generations.get(namespace, 0)
+            self._entries[(namespace, key)] = (time.monotonic() + ttl, generation, total)
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+count_cache = CountCache()
+
+
+def invalidate_counts_on_commit(model, namespace):
+    """model 的数据在事务中被写入（含批量 update/delete）时，提交后清除 namespace 下的缓存总数"""
+    pending_key = f'count_cache_dirty:{namespace}'
+
+    @event.listens_for(Session, 'after_flush')
+    def _mark_flush(session, flush_context):
+        if any(isinstance(obj, model) for obj in (*session.new, *session.dirty, *session.deleted)):
+            session.info[pending_key] = True
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _mark_bulk(orm_execute_state):
+        if ((orm_execute_state.is_update or orm_execute_state.is_delete)
+                and model in [m.class_ for m in orm_execute_state.all_mappers]):
+            orm_execute_state.session.info[pending_key] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidate(session):
+        if session.info.pop(pending_key, False):
+            count_cache.invalidate(namespace)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard(session):
+        session.info.pop(pending_key, None)
+
+
+def count_rows(query, count_key=None, estimate=False):
+    """统计 query 的行数，返回 (total, estimated)
+
+    count_key 为 (命名空间, 规范化后的筛选条件) 时结果会缓存 COUNT_CACHE_TTL 秒；
+    estimate 为 True 时最多数到 COUNT_ESTIMATE_THRESHOLD 行，超出时返回上限并标记为估算值。
+    """
+    config = current_app.config
+    if count_key is not None:
+        cached = count_cache.get(*count_key)
+        if cached is not None:
+            return cached
+
+    query = query.order_by(None)
+    threshold = config.get('COUNT_ESTIMATE_THRESHOLD', 10000)
+    if estimate:
+        # 子查询只取常量列，无筛选条件时数据库可以只扫描最小的索引
+        total = query.with_entities(literal(1)).limit(threshold + 1).count()
+        result = (threshold, True) if total > threshold else (total, False)
+    else:
+        result = (query.count(), False)
+
+    if count_key is not None:
+        count_cache.set(*count_key, result, config.get('COUNT_CACHE_TTL', 30))
+    return result
+
+
+class KeysetPagination(QueryPagination):
+    """支持游标定位的分页结果
+
+    除 query 外还需要 keys（SortKey 列表，最后一个应为唯一键），可选 cursor、direction，
+    以及传给 count_rows() 的 count_key、estimate。
+    """
+
+    def __init__(self, page=None, per_page=None, cursor=None, direction='after', **kwargs):
+        self.is_keyset = cursor is not None
+        self.total_is_estimate = False
+        self._cursor = cursor
+        self._direction = direction
+        if cursor is not None:
+            kwargs['count'] = False
+        super().__init__(page=page, per_page=per_page, cursor=cursor, direction=direction, **kwargs)
+        if cursor is not None:
+            # 游标定位不知道确切页码，按游标记录的位置推算
+            self.page = self._start // self.per_page + 1
+            self.total = cursor['total']
+            self.total_is_estimate = cursor['estimated']
+
+    def _query_count(self):
+        total, self.total_is_estimate = count_rows(
+            self._query_args['query'],
+            count_key=self._query_args.get('count_key'),
+            estimate=self._query_args.get('estimate', False)
+        )
+        return total
+
+    def _fetch(self, query, keys, reverse=False):
+        query = query.order_by(None).order_by(*[key.order_clause(reverse) for key in keys])
+        return query.add_columns(*[key.column for key in keys])
+
+    def _query_items(self):
+        query = self._query_args['query']
+        keys = self._query_args['keys']
+        cursor = self._cursor
+
+        if cursor is None:
+            rows = self._fetch(query, keys).limit(self.per_page + 1).offset(self._query_offset).all()
+            self._has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            self._start = self._query_offset
+            self._has_before = self._start > 0
+        elif self._direction == 'after':
+            rows = (self._fetch(query, keys)
+                    .filter(_seek_condition(keys, cursor['values'], forward=True))
+                    .limit(self.per_page + 1).all())
+            self._has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            self._start = cursor['position'] + 1
+            self._has_before = True
+        else:
+            rows = (self._fetch(query, keys, reverse=True)
+                    .filter(_seek_condition(keys, cursor['values'], forward=False))
+                    .limit(self.per_page + 1).all())
+            self._has_before = len(rows) > self.per_page
+            rows = list(reversed(rows[:self.per_page]))
+            self._start = max(cursor['position'] - len(rows), 0) if self._has_before else 0
+            self._has_more = True
+
+        self._keys = [tuple(row[1:]) for row in rows]
+        return [row[0] for row in rows]
+
+    @property
+    def pages(self):
+        # 总数未知或已过期时，至少保证能翻到下一页
+        return max(super().pages, self.page + (1 if self.has_next else 0))
+
+    @property
+    def first(self):
+        return self._start + 1 if self.items else 0
+
+    @property
+    def has_prev(self):
+        return self._has_before
+
+    @property
+    def has_next(self):
+        return self._has_more
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return encode_cursor(self._query_args['keys'], self._keys[-1],
+                             self._start + len(self.items) - 1, self.total, self.total_is_estimate)
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev or not self.items:
+            return None
+        return encode_cursor(self._query_args['keys'], self._keys[0], self._start,
+                             self.total, self.total_is_estimate)
+
+
+def paginate(query, keys, page=1, per_page=10, after=None, before=None, count=True,
+             count_key=None, estimate=False):
+    """对 query 按 keys 排序并分页；after / before 为上一页给出的游标
+
+    count_key、estimate 控制总数的缓存和估算，见 count_rows()。
+    """
+    keys = list(keys)
+    cursor, direction = None, 'after'
+    if after:
+        cursor = decode_cursor(keys, after)
+    elif before:
+        cursor, direction = decode_cursor(keys, before), 'before'
+
+    return KeysetPagination(
+        query=query,
+        keys=keys,
+        page=page,
+        per_page=per_page,
+        cursor=cursor,
+        direction=direction,
+        error_out=False,
+        count=count,
+        count_key=count_key,
+        estimate=estimate
+    )
+
+
+def cursor_url(after=None, before=None):
+    """当前页面换成指定游标后的地址，保留其余查询参数"""
+    args = request.args.to_dict()
+    for name in ('page', 'after', 'before'):
+        args.pop(name, None)
+    if after:
+        args['after'] = after
+    if before:
+        args['before'] = before
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
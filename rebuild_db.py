@@ -41,9 +41,9 @@ def create_database():
 
 def init_database():
     """初始化数据库"""
-    from app import create_app
+    from database import create_db_app
 
-    app = create_app()
+    app = create_db_app()
 
     with app.app_context():
         try:
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+借阅记录筛选
+
+借阅记录管理页面和导出接口共用同一套请求参数：search / search_type、status、days、
+date_from / date_to、due_filter 和 sort_by。
+"""
+
+from datetime import datetime, timedelta
+
+from models import db, Book, BorrowRecord, User
+from pagination import SortKey
+from search import isbn_filter, substring_filter
+
+
+def filter_borrow_records(query, args):
+    """按请求参数为借阅记录查询加上筛选条件
+
+    返回 (query, sort_keys, count_key)：sort_keys 以记录 id 作为最后的排序键，
+    count_key 为规范化后的筛选条件，用作总数缓存的键。
+    """
+    # 获取搜索和筛选参数
+    search = args.get('search', '').strip()
+    status = args.get('status', '')
+    search_type = args.get('search_type', 'all')
+    days = args.get('days', '')
+    date_from = args.get('date_from', '')
+    date_to = args.get('date_to', '')
+    sort_by = args.get('sort_by', 'borrow_date')
+    due_filter = args.get('due_filter', '')  # 新增：到期日期筛选参数
+
+    # 应用搜索筛选；记录是否已连接 users 表，按读者姓名排序时不重复连接
+    joined_user = False
+    if search:
+        search_term = f"%{search}%"
+        if search_type == 'book':
+            query = query.join(Book, BorrowRecord.book_id == Book.id).filter(
+                substring_filter(Book, ('title',), search)
+            )
+        elif search_type == 'user':
+            query = query.join(User, BorrowRecord.user_id == User.id).filter(
+                substring_filter(User, ('username', 'full_name', 'email'), search)
+            )
+            joined_user = True
+        elif search_type == 'isbn':
+            condition = isbn_filter(search)
+            query = query.join(Book).filter(condition if condition is not None else Book.isbn.like(search_term))
+        elif search_type == 'id':
+            try:
+                record_id = int(search)
+                query = query.filter(BorrowRecord.id == record_id)
+            except ValueError:
+                pass
+        else:  # all
+            query = query.join(Book, BorrowRecord.book_id == Book.id).join(User, BorrowRecord.user_id == User.id).filter(
+                db.or_(
+                    substring_filter(Book, ('title', 'author', 'isbn'), search),
+                    substring_filter(User, ('username', 'full_name', 'email'), search)
+                )
+            )
+            joined_user = True
+
+    # 应用状态筛选
+    if status == 'borrowed':
+        query = query.filter(BorrowRecord.status == 'borrowed')
+    elif status == 'returned':
+        query = query.filter(BorrowRecord.status == 'returned')
+    elif status == 'overdue':
+        query = query.filter(
+            BorrowRecord.status == 'borrowed',
+            BorrowRecord.due_date < datetime.utcnow()
+        )
+
+    # 应用时间筛选
+    if days:
+        try:
+            days_num = int(days)
+            start_date = datetime.utcnow() - timedelta(days=days_num)
+            query = query.filter(BorrowRecord.borrow_date >= start_date)
+        except ValueError:
+            pass
+    elif date_from:
+        try:
+            start_date = datetime.strptime(date_from, '%Y-%m-%d')
+            query = query.filter(BorrowRecord.borrow_date >= start_date)
+        except ValueError:
+            pass
+
+    if date_to:
+        try:
+            end_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+            query = query.filter(BorrowRecord.borrow_date < end_date)
+        except ValueError:
+            pass
+
+    # 应用到期日期筛选
+    if due_filter == 'today':
+        # 今日到期：从今天开始到明天结束
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        today_end = today_start + timedelta(days=1)
+        query = query.filter(
+            BorrowRecord.status == 'borrowed',
+            BorrowRecord.due_date >= today_start,
+            BorrowRecord.due_date < today_end
+        )
+    elif due_filter == 'this_week':
+        # 本周到期：从本周一开始到本周日结束
+        now = datetime.utcnow()
+        days_since_monday = now.weekday()
+        week_start = (now - timedelta(days=days_since_monday)).replace(hour=0, minute=0, second=0, microsecond=0)
+        week_end = week_start + timedelta(days=7)
+        query = query.filter(
+            BorrowRecord.status == 'borrowed',
+            BorrowRecord.due_date >= week_start,
+            BorrowRecord.due_date < week_end
+        )
+
+
+    # 应用排序
+    if sort_by == 'due_date':
+        sort_keys = [SortKey(BorrowRecord.due_date, descending=True), SortKey(BorrowRecord.id, descending=True)]
+    elif sort_by == 'return_date':
+        # 未归还的记录排在最后，见 BorrowRecord.return_sort_date
+        sort_keys = [SortKey(BorrowRecord.return_sort_date, descending=True), SortKey(BorrowRecord.id, descending=True)]
+    elif sort_by == 'user_name':
+        if not joined_user:
+            query = query.join(User, BorrowRecord.user_id == User.id)
+        sort_keys = [SortKey(User.full_name), SortKey(BorrowRecord.id)]
+    else:
+        sort_keys = [SortKey(BorrowRecord.borrow_date, descending=True), SortKey(BorrowRecord.id, descending=True)]
+
+    # 总数按规范化后的筛选条件缓存，翻页时不再重复 COUNT(*)
+    count_key = ('borrow_records', (
+        search,
+        search_type if search else '',
+        status,
+        days,
+        '' if days else date_from,
+        date_to,
+        due_filter
+    ))
+
+    return query, sort_keys, count_key
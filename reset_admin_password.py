@@ -8,8 +8,10 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db
-from models import Admin
+from database import create_db_app
+from models import db, Admin
+
+app = create_db_app()
 
 def reset_admin_password():
     """重置管理员密码"""
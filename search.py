@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图书与用户检索
+
+1. 全文索引：SQLite 下使用 FTS5 外部内容表 books_fts 索引图书的书名、作者、ISBN 和描述，
+   由触发器与 books 表保持同步，结果按 bm25 相关度排序。
+2. 中文 n-gram 索引：unicode61 分词无法切分中文，书名、作者、描述、用户名和姓名
+   在写入时被切分为二元组存入 search_grams 表，中文子串查询先通过
+   倒排表求交集得到候选行，再用 LIKE 校验候选行。
+
+两种索引都不可用时回退到 LIKE 全表匹配。
+"""
+
+import re
+
+from sqlalchemy import DDL, column, delete, event, func, insert, inspect, literal_column, select, table, text
+from sqlalchemy.orm import Session
+
+from bulk import bulk_insert
+from isbn import to_isbn13
+from models import db, Book, User, SearchGram
+
+BOOK_FTS_TABLE = 'books_fts'
+BOOK_FTS_COLUMNS = ('title', 'author', 'isbn', 'description')
+# bm25 列权重，顺序与 BOOK_FTS_COLUMNS 一致：书名 > 作者 > ISBN > 描述
+BOOK_FTS_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+_CREATE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {BOOK_FTS_TABLE} USING fts5(
+        title, author, isbn, description,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {BOOK_FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {BOOK_FTS_TABLE}(rowid, title, author, isbn, description)
+        VALUES (new.id, new.title, new.author, new.isbn, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {BOOK_FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {BOOK_FTS_TABLE}({BOOK_FTS_TABLE}, rowid, title, author, isbn, description)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.description);
+    END""",
+    # 只有检索列变化时才更新索引，借还书修改库存不会触发
+    f"""CREATE TRIGGER IF NOT EXISTS {BOOK_FTS_TABLE}_au
+        AFTER UPDATE OF title, author, isbn, description ON books BEGIN
+        INSERT INTO {BOOK_FTS_TABLE}({BOOK_FTS_TABLE}, rowid, title, author, isbn, description)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.description);
+        INSERT INTO {BOOK_FTS_TABLE}(rowid, title, author, isbn, description)
+        VALUES (new.id, new.title, new.author, new.isbn, new.description);
+    END""",
+]
+
+_TOKEN_RE = re.compile(r'\w+')
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+# 按数据库 URL 缓存 FTS 表是否可用，避免每次搜索都查询 sqlite_master
+_fts_status = {}
+
+_books_fts = table(BOOK_FTS_TABLE, column('rowid'))
+
+
+def _fts5_supported(ddl, target, bind, **kw):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return bool(bind.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+for _sql in _CREATE_FTS_SQL:
+    event.listen(Book.__table__, 'after_create', DDL(_sql).execute_if(callable_=_fts5_supported))
+event.listen(Book.__table__, 'before_drop',
+             DDL(f'DROP TABLE IF EXISTS {BOOK_FTS_TABLE}').execute_if(dialect='sqlite'))
+
+
+def fts_enabled():
+    """当前数据库是否可以使用 books_fts 全文索引"""
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _fts_status:
+        if engine.dialect.name != 'sqlite':
+            _fts_status[key] = False
+        else:
+            with engine.connect() as conn:
+                _fts_status[key] = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                    (BOOK_FTS_TABLE,)
+                ).first() is not None
+    return _fts_status[key]
+
+
+def ensure_book_search_index(rebuild=False):
+    """为已有数据库创建全文索引；新建或 rebuild=True 时从 books 表重建索引内容
+
+    返回索引是否可用（非 SQLite 或不支持 FTS5 时返回 False）。
+    """
+    engine = db.engine
+    _fts_status.pop(str(engine.url), None)
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    with engine.begin() as conn:
+        if not conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar():
+            return False
+        existed = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (BOOK_FTS_TABLE,)
+        ).first() is not None
+        for sql in _CREATE_FTS_SQL:
+            conn.exec_driver_sql(sql)
+        if rebuild or not existed:
+            conn.exec_driver_sql(f"INSERT INTO {BOOK_FTS_TABLE}({BOOK_FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def suspend_book_search_index(connection):
+    """批量写入图书前删除全文索引的插入触发器，写完后调用 ensure_book_search_index(rebuild=True) 恢复
+
+    逐行触发写入全文索引比写完后一次重建慢十几倍。
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {BOOK_FTS_TABLE}_ai')
+
+
+def build_match_expression(search, columns=BOOK_FTS_COLUMNS):
+    """把用户输入转换为 FTS5 MATCH 表达式：每个词按前缀匹配，多个词取交集"""
+    tokens = _TOKEN_RE.findall(search)
+    if not tokens:
+        return None
+    expression = ' AND '.join(f'"{token}"*' for token in tokens)
+    if tuple(columns) != BOOK_FTS_COLUMNS:
+        expression = '{%s} : (%s)' % (' '.join(columns), expression)
+    return expression
+
+
+def isbn_filter(search):
+    """search 是合法的完整 ISBN 时返回按 isbn13 精确匹配的条件，否则返回 None"""
+    isbn13 = to_isbn13(search)
+    return Book.isbn13 == isbn13 if isbn13 else None
+
+
+def apply_book_search(query, search, columns=BOOK_FTS_COLUMNS):
+    """为图书查询加上关键字搜索条件
+
+    返回 (query, rank)。使用全文索引时 rank 为 bm25 相关度列（越小越相关），
+    可直接用于 order_by；中文查询走 n-gram 索引或回退到 LIKE 匹配时 rank 为 None。
+    """
+    search = search.strip()
+    if not search:
+        return query, None
+
+    # 完整的 ISBN（带不带连字符、10 位或 13 位）直接查 isbn13 唯一索引
+    condition = isbn_filter(search) if 'isbn' in columns else None
+    if condition is not None:
+        return query.filter(condition), None
+
+    # unicode61 分词无法切分中文，含中日韩字符的搜索交给 n-gram 索引
+    expression = None
+    if not _CJK_RE.search(search) and fts_enabled():
+        expression = build_match_expression(search, columns)
+
+    if expression is None:
+        return query.filter(substring_filter(Book, columns, search)), None
+
+    matches = select(
+        _books_fts.c.rowid.label('book_id'),
+        func.bm25(literal_column(BOOK_FTS_TABLE), *BOOK_FTS_WEIGHTS).label('rank')
+    ).where(text(f'{BOOK_FTS_TABLE} MATCH :fts_query').bindparams(fts_query=expression)).subquery()
+
+    query = query.join(matches, Book.id == matches.c.book_id)
+    return query, matches.c.rank
+
+
+# ---------------------------------------------------------------------------
+# 中文 n-gram 索引
+# ---------------------------------------------------------------------------
+
+NGRAM_SIZE = 2
+# 参与 n-gram 索引的字段；ISBN、邮箱、电话不会包含中文，中文查询无需检索这些字段
+NGRAM_FIELDS = {
+    'books': ('title', 'author', 'description'),
+    'users': ('username', 'full_name'),
+}
+NGRAM_BATCH_SIZE = 1000
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(value):
+    """统一大小写并合并空白，写入和查询使用同样的规范化规则"""
+    return _WHITESPACE_RE.sub(' ', value or '').strip().casefold()
+
+
+def make_ngrams(value, size=NGRAM_SIZE):
+    """把文本切分为去重后的 n-gram 集合；不足 size 个字符时返回空集合"""
+    value = normalize_text(value)
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+def _ngram_rows(entity, obj, fields):
+    for field in fields:
+        for gram in make_ngrams(getattr(obj, field)):
+            yield {'entity': entity, 'field': field, 'gram': gram, 'entity_id': obj.id}
+
+
+def _reindex_objects(connection, entity, objects, fields):
+    ids = [obj.id for obj in objects]
+    connection.execute(
+        delete(SearchGram).where(
+            SearchGram.entity == entity,
+            SearchGram.entity_id.in_(ids),
+            SearchGram.field.in_(fields)
+        )
+    )
+    rows = [row for obj in objects for row in _ngram_rows(entity, obj, fields)]
+    for start in range(0, len(rows), NGRAM_BATCH_SIZE):
+        connection.execute(insert(SearchGram), rows[start:start + NGRAM_BATCH_SIZE])
+
+
+def index_new_rows(connection, entity, rows):
+    """为不经过 ORM 直接写入的新行建立 n-gram，返回写入的 n-gram 行数；rows 需要带 id 和 NGRAM_FIELDS 中的字段"""
+    grams = ((entity, field, gram, row.id)
+             for field in NGRAM_FIELDS[entity] for row in rows for gram in make_ngrams(getattr(row, field)))
+    return bulk_insert(connection, SearchGram.__table__, ('entity', 'field', 'gram', 'entity_id'), grams,
+                       NGRAM_BATCH_SIZE * 10)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_ngram_index(session, flush_context):
+    """在同一事务中维护新增、修改、删除的图书和用户的 n-gram"""
+    changed = {}
+    removed = {}
+    for obj in session.new | session.dirty:
+        entity = getattr(obj, '__tablename__', None)
+        if entity not in NGRAM_FIELDS:
+            continue
+        state = inspect(obj)
+        fields = tuple(field for field in NGRAM_FIELDS[entity]
+                       if obj in session.new or state.attrs[field].history.has_changes())
+        if fields:
+            changed.setdefault((entity, fields), []).append(obj)
+    for obj in session.deleted:
+        entity = getattr(obj, '__tablename__', None)
+        if entity in NGRAM_FIELDS:
+            removed.setdefault(entity, []).append(obj.id)
+
+    if not changed and not removed:
+        return
+
+    connection = session.connection()
+    for (entity, fields), objects in changed.items():
+        _reindex_objects(connection, entity, objects, fields)
+    for entity, ids in removed.items():
+        connection.execute(
+            delete(SearchGram).where(SearchGram.entity == entity, SearchGram.entity_id.in_(ids))
+        )
+
+
+def rebuild_ngram_index():
+    """从 books 和 users 表重建全部 n-gram，返回写入的 n-gram 行数"""
+    total = 0
+    with db.engine.begin() as conn:
+        conn.execute(delete(SearchGram))
+        for model in (Book, User):
+            entity = model.__tablename__
+            columns = [model.id] + [getattr(model, field) for field in NGRAM_FIELDS[entity]]
+            for rows in conn.execute(select(*columns)).yield_per(NGRAM_BATCH_SIZE * 10).partitions():
+                total += index_new_rows(conn, entity, rows)
+    return total
+
+
+def ensure_ngram_index():
+    """已有数据但倒排表为空时（如升级后的旧数据库）重建 n-gram 索引"""
+    if db.session.query(SearchGram.entity).first() is not None:
+        return
+    if db.session.query(Book.id).first() is None and db.session.query(User.id).first() is None:
+        return
+    rebuild_ngram_index()
+
+
+def ngram_candidates(model, columns, search):
+    """返回 columns 中可能包含 search 子串的行 id 子查询
+
+    只处理含中文且可以切出 n-gram 的查询；不适用时返回 None，由调用方直接使用 LIKE。
+    候选集合可能包含 n-gram 位置不连续的行，调用方需要再用 LIKE 校验。
+    """
+    if not _CJK_RE.search(search):
+        return None
+    entity = model.__tablename__
+    fields = [name for name in columns if name in NGRAM_FIELDS.get(entity, ())]
+    grams = make_ngrams(search)
+    if not fields or not grams:
+        return None
+
+    return (
+        select(SearchGram.entity_id)
+        .where(
+            SearchGram.entity == entity,
+            SearchGram.field.in_(fields),
+            SearchGram.gram.in_(grams)
+        )
+        .group_by(SearchGram.entity_id, SearchGram.field)
+        .having(func.count() == len(grams))
+    )
+
+
+def substring_filter(model, columns, search):
+    """columns 中任一字段包含 search 的过滤条件，中文查询先用 n-gram 索引缩小范围"""
+    search_term = f'%{search}%'
+    condition = db.or_(*[getattr(model, name).like(search_term) for name in columns])
+    candidates = ngram_candidates(model, columns, search)
+    if candidates is not None:
+        condition = db.and_(model.id.in_(candidates), condition)
+    return condition
+
+
+if __name__ == '__main__':
+    from database import create_db_app
+
+    with create_db_app().app_context():
+        if ensure_book_search_index(rebuild=True):
+            print(f"全文索引 {BOOK_FTS_TABLE} 重建完成，共 {Book.query.count()} 本图书")
+        else:
+            print("当前数据库不支持 FTS5，英文搜索将使用 LIKE 匹配")
+        print(f"n-gram 索引重建完成，共 {rebuild_ngram_index()} 条")
@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+"""
+Minimal launcher. Startup does not touch the database: run `flask --app wsgi init-db`
+(and optionally `flask --app wsgi seed`) first, or pass --init to run both before serving.
+"""
 
 import os
 import sys
@@ -12,16 +16,21 @@ def main():
 
     try:
         # Import and start Flask app
-        from app import app
-        from models import db
-
-        with app.app_context():
-            db.create_all()
+        from app import create_app
+        app = create_app()
+
+        # The reloader's child process must not initialize again
+        if '--init' in sys.argv[1:] and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+            from cli import init_database, seed_sample_data
+            with app.app_context():
+                init_database()
+                seed_sample_data()
             print("Database initialized successfully")
 
         print("Server starting at http://localhost:5000")
         print("Admin: admin / admin123")
         print("User: testuser / test123")
+        print("First run? Initialize the database with: flask --app wsgi init-db")
         print("Press Ctrl+C to stop")
 
         app.run(host='0.0.0.0', port=5000, debug=True)
@@ -2,37 +2,31 @@
 # -*- coding: utf-8 -*-
 """
 图书管理系统启动脚本 - 简化版
+
+启动时只构建应用对象，不连接数据库。首次运行或升级后先执行 `flask --app wsgi init-db`
+（可选 `flask --app wsgi seed`），或用 `python start_server.py --init` 在启动前执行这两步。
 """
 
 import os
 import sys
-from flask import Flask
-from create_database import create_database
 
 def main():
     print("=" * 50)
     print("图书管理系统")
     print("=" * 50)
 
-    # 创建数据库
-    try:
-        print("正在创建数据库...")
-        create_database()
-        print("数据库创建成功")
-    except Exception as e:
-        print(f"数据库创建失败: {e}")
-        print("请确保MySQL服务正在运行，并且配置正确")
-        sys.exit(1)
-
     # 导入应用
     try:
         print("正在初始化应用...")
-        from app import app, initialize_database
+        from app import create_app
+        app = create_app()
 
-        # 初始化数据库
-        if not initialize_database():
-            print("数据库初始化失败")
-            sys.exit(1)
+        # 重载器启动的子进程不再重复初始化
+        if '--init' in sys.argv[1:] and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+            from cli import init_database, seed_sample_data
+            with app.app_context():
+                init_database()
+                seed_sample_data()
 
         print("应用初始化成功")
     except Exception as e:
@@ -48,6 +42,7 @@ def main():
     print("管理员账户: admin / admin123")
     print("测试用户: testuser / test123")
     print("调试模式: 开启")
+    print("首次运行请先执行: flask --app wsgi init-db")
     print("按 Ctrl+C 停止服务器")
     print("-" * 50)
 
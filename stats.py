@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+仪表板统计计数器
+
+library_stats 表只保存一行（id=1）：用户、图书、分类、在借和逾期数量。
+ORM 的新增、删除、借阅状态变化以及批量删除都会在同一事务中增量更新这行计数，
+管理员仪表板只需按主键读取一行。
+
+逾期数量随时间推移而变化：计数只包含 due_date 早于 overdue_checked_at 的在借记录，
+借还等写入计数的事务在距上次推进超过 STATS_OVERDUE_REFRESH 秒时顺带累加新到期的记录并推进时间。
+读取不写数据库：推进已过期时（一段时间没有借还），只临时统计新到期的记录加上；
+`python stats.py --overdue` 把它们累加进计数并推进时间，可定时执行。
+
+直接执行 SQL 的脚本不会触发计数更新，可运行 `python stats.py` 从头重新计算。
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, event, func, select, update
+from sqlalchemy.orm import Session
+
+from models import db, User, Book, Category, BorrowRecord, LibraryStats
+
+STATS_ID = 1
+
+# 新增或删除这些模型的对象时，对应计数加减 1
+_ROW_COUNTERS = {
+    User: 'total_users',
+    Book: 'total_books',
+    Category: 'total_categories',
+}
+
+
+def adjust_counters(connection, overdue_due_dates=(), overdue_sign=-1, advance_overdue=False, **deltas):
+    """在当前事务中调整计数
+
+    deltas 为计数名到增量的映射；overdue_due_dates 为离开（或进入）在借状态的记录的应还日期，
+    其中早于 overdue_checked_at 的记录已计入逾期数量，需要按 overdue_sign 同步调整。
+    advance_overdue 为 True 时，若距上次推进超过 STATS_OVERDUE_REFRESH 秒，同一条 UPDATE
+    顺带累加新到期的在借记录并推进 overdue_checked_at；借阅状态的修改须已写入数据库。
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    # overdue_checked_at 不会晚于当前时间，尚未到期的记录无需读取它
+    now = datetime.utcnow()
+    overdue_due_dates = [due_date for due_date in overdue_due_dates if due_date and due_date < now]
+    if overdue_due_dates:
+        checked_at = connection.execute(
+            select(LibraryStats.overdue_checked_at)
+            .where(LibraryStats.id == STATS_ID)
+            .with_for_update()
+        ).scalar()
+        if checked_at is not None:
+            counted = sum(1 for due_date in overdue_due_dates if due_date < checked_at)
+            deltas['overdue_records'] = deltas.get('overdue_records', 0) + overdue_sign * counted
+            deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    values = {getattr(LibraryStats, name): getattr(LibraryStats, name) + delta for name, delta in deltas.items()}
+    values[LibraryStats.updated_at] = now
+    if advance_overdue:
+        refresh = current_app.config.get('STATS_OVERDUE_REFRESH', 60)
+        stale = LibraryStats.overdue_checked_at <= now - timedelta(seconds=refresh)
+        # SET 右侧读到的是修改前的 overdue_checked_at，上面的调整也以它为准
+        newly_overdue = select(func.count(BorrowRecord.id)).where(
+            BorrowRecord.status == 'borrowed',
+            BorrowRecord.due_date >= LibraryStats.overdue_checked_at,
+            BorrowRecord.due_date < now
+        ).scalar_subquery()
+        values[LibraryStats.overdue_records] = (values.get(LibraryStats.overdue_records, LibraryStats.overdue_records)
+                                                + case((stale, newly_overdue), else_=0))
+        values[LibraryStats.overdue_checked_at] = case((stale, now), else_=LibraryStats.overdue_checked_at)
+    connection.execute(update(LibraryStats).where(LibraryStats.id == STATS_ID).values(values))
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    deltas = {}
+    left_borrowed = []
+    entered_borrowed = []
+
+    for obj in session.new:
+        counter = _ROW_COUNTERS.get(type(obj))
+        if counter:
+            deltas[counter] = deltas.get(counter, 0) + 1
+        elif isinstance(obj, BorrowRecord) and obj.status in (None, 'borrowed'):
+            deltas['active_borrows'] = deltas.get('active_borrows', 0) + 1
+            entered_borrowed.append(obj.due_date)
+
+    for obj in session.deleted:
+        counter = _ROW_COUNTERS.get(type(obj))
+        if counter:
+            deltas[counter] = deltas.get(counter, 0) - 1
+        elif isinstance(obj, BorrowRecord) and obj.status == 'borrowed':
+            deltas['active_borrows'] = deltas.get('active_borrows', 0) - 1
+            left_borrowed.append(obj.due_date)
+
+    for obj in session.dirty:
+        if not isinstance(obj, BorrowRecord):
+            continue
+        history = db.inspect(obj).attrs.status.history
+        if not history.has_changes():
+            continue
+        was_borrowed = 'borrowed' in (history.deleted or ())
+        if was_borrowed and obj.status != 'borrowed':
+            deltas['active_borrows'] = deltas.get('active_borrows', 0) - 1
+            left_borrowed.append(obj.due_date)
+        elif not was_borrowed and obj.status == 'borrowed':
+            deltas['active_borrows'] = deltas.get('active_borrows', 0) + 1
+            entered_borrowed.append(obj.due_date)
+
+    if not deltas and not left_borrowed and not entered_borrowed:
+        return
+    connection = session.connection()
+    # 推进逾期计数放在最后一次调整中，此前的调整都以推进前的时间为准
+    if entered_borrowed:
+        adjust_counters(connection, overdue_due_dates=left_borrowed)
+        adjust_counters(connection, overdue_due_dates=entered_borrowed, overdue_sign=1, advance_overdue=True,
+                        **deltas)
+    else:
+        adjust_counters(connection, overdue_due_dates=left_borrowed, advance_overdue=True, **deltas)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_delete(orm_execute_state):
+    """query.delete() 不经过 flush，执行前按相同条件统计将被删除的行"""
+    if not orm_execute_state.is_delete or orm_execute_state.bind_mapper is None:
+        return
+    model = orm_execute_state.bind_mapper.class_
+    if model is not BorrowRecord and model not in _ROW_COUNTERS:
+        return
+
+    whereclause = orm_execute_state.statement.whereclause
+    table = model.__table__
+    connection = orm_execute_state.session.connection()
+
+    def count(*criteria):
+        stmt = select(func.count()).select_from(table).where(*criteria)
+        if whereclause is not None:
+            stmt = stmt.where(whereclause)
+        return connection.execute(stmt).scalar()
+
+    if model is BorrowRecord:
+        checked_at = select(LibraryStats.overdue_checked_at).where(LibraryStats.id == STATS_ID).scalar_subquery()
+        adjust_counters(
+            connection,
+            active_borrows=-count(BorrowRecord.status == 'borrowed'),
+            overdue_records=-count(BorrowRecord.status == 'borrowed', BorrowRecord.due_date < checked_at)
+        )
+    else:
+        adjust_counters(connection, **{_ROW_COUNTERS[model]: -count()})
+
+
+def reconcile_library_stats():
+    """从各数据表重新计算全部计数并写入 library_stats，返回计数字典"""
+    now = datetime.utcnow()
+    counts = {
+        'total_users': db.session.query(func.count(User.id)).scalar(),
+        'total_books': db.session.query(func.count(Book.id)).scalar(),
+        'total_categories': db.session.query(func.count(Category.id)).scalar(),
+        'active_borrows': db.session.query(func.count(BorrowRecord.id))
+            .filter(BorrowRecord.status == 'borrowed').scalar(),
+        'overdue_records': db.session.query(func.count(BorrowRecord.id))
+            .filter(BorrowRecord.status == 'borrowed', BorrowRecord.due_date < now).scalar(),
+    }
+
+    row = db.session.get(LibraryStats, STATS_ID)
+    if row is None:
+        row = LibraryStats(id=STATS_ID)
+        db.session.add(row)
+    for name, value in counts.items():
+        setattr(row, name, value)
+    row.overdue_checked_at = now
+    row.updated_at = now
+    db.session.commit()
+    return counts
+
+
+def ensure_library_stats():
+    """统计行不存在时（新建或升级后的数据库）重新计算一次"""
+    if db.session.get(LibraryStats, STATS_ID) is None:
+        reconcile_library_stats()
+
+
+def _newly_overdue(checked_at, now):
+    """checked_at 之后、now 之前到期的在借记录数，即逾期数量中尚未累加的部分"""
+    return db.session.query(func.count(BorrowRecord.id)).filter(
+        BorrowRecord.status == 'borrowed',
+        BorrowRecord.due_date >= checked_at,
+        BorrowRecord.due_date < now
+    ).scalar()
+
+
+def get_library_stats():
+    """读取仪表板计数，不写数据库
+
+    距上次推进超过 STATS_OVERDUE_REFRESH 秒时，逾期数量加上这段时间内新到期的在借记录，
+    但不保存；推进由借还时的计数调整、advance_overdue_count 或重新计算完成。
+    """
+    row = db.session.get(LibraryStats, STATS_ID)
+    if row is None:
+        return reconcile_library_stats()
+
+    overdue_records = row.overdue_records
+    now = datetime.utcnow()
+    if (now - row.overdue_checked_at).total_seconds() >= current_app.config.get('STATS_OVERDUE_REFRESH', 60):
+        overdue_records += _newly_overdue(row.overdue_checked_at, now)
+
+    return {
+        'total_users': row.total_users,
+        'total_books': row.total_books,
+        'total_categories': row.total_categories,
+        'active_borrows': row.active_borrows,
+        'overdue_records': overdue_records,
+    }
+
+
+def advance_overdue_count():
+    """把新到期的在借记录累加到逾期数量并推进 overdue_checked_at，返回累加的记录数
+
+    长时间没有借还时，定时执行本函数（`python stats.py --overdue`）可让仪表板保持按主键读取一行。
+    """
+    checked_at = db.session.query(LibraryStats.overdue_checked_at).filter(LibraryStats.id == STATS_ID).scalar()
+    if checked_at is None:
+        reconcile_library_stats()
+        return 0
+    now = datetime.utcnow()
+    newly_overdue = _newly_overdue(checked_at, now)
+    # 以旧的推进时间为条件，并发执行时只有一个会生效
+    advanced = db.session.execute(
+        update(LibraryStats)
+        .where(LibraryStats.id == STATS_ID, LibraryStats.overdue_checked_at == checked_at)
+        .values(overdue_records=LibraryStats.overdue_records + newly_overdue, overdue_checked_at=now)
+    ).rowcount
+    db.session.commit()
+    return newly_overdue if advanced else 0
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from database import create_db_app
+
+    parser = argparse.ArgumentParser(description='重新计算仪表板统计计数')
+    parser.add_argument('--overdue', action='store_true', help='只累加新到期的逾期记录，不重新计算其他计数')
+    args = parser.parse_args()
+
+    with create_db_app().app_context():
+        db.create_all()
+        if args.overdue:
+            print(f"新增逾期记录 {advance_overdue_count()} 条")
+        else:
+            counts = reconcile_library_stats()
+            print("统计计数已重新计算：")
+            for name, value in counts.items():
+                print(f"  {name}: {value}")
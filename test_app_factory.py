@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+应用工厂和 fork 后连接池处理的测试
+"""
+
+from app import create_app
+from db_routing import READ_ENGINE_KEY, dispose_engines
+from models import db
+
+
+def test_create_app_registers_routes_with_plain_endpoints(app):
+    other = create_app({'TESTING': True, 'SECRET_KEY': 'other'})
+    assert other is not app
+    assert other.config['SECRET_KEY'] == 'other'
+    assert set(app.view_functions) == set(other.view_functions)
+    assert 'admin_borrow_records' in other.view_functions
+    with other.test_request_context():
+        from flask import url_for
+        assert url_for('browse_books') == '/books'
+
+
+def test_dispose_engines_drops_pooled_connections(app):
+    with app.app_context():
+        db.session.execute(db.text('SELECT 1'))
+        db.session.remove()
+        primary = db.engine
+    replica = app.extensions[READ_ENGINE_KEY]
+    with replica.connect() as connection:
+        connection.exec_driver_sql('SELECT 1')
+    assert primary.pool.checkedin() > 0 and replica.pool.checkedin() > 0
+
+    dispose_engines(app, db)
+    assert primary.pool.checkedin() == 0
+    assert replica.pool.checkedin() == 0
+
+
+def test_init_db_and_seed_commands_are_repeatable(tmp_path):
+    other = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/cli.db', 'READ_WRITE_SPLIT': False})
+    runner = other.test_cli_runner()
+    for _ in range(2):
+        assert runner.invoke(args=['init-db']).exit_code == 0
+        assert runner.invoke(args=['seed']).exit_code == 0
+
+    from models import Admin, Book, Category, User
+    with other.app_context():
+        assert Admin.query.filter_by(username='admin').count() == 1
+        assert User.query.filter_by(username='testuser').count() == 1
+        assert Category.query.count() == 8
+        assert Book.query.count() == 2
+        db.engine.dispose()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图书目录批量导入测试：校验、去重、n-gram 索引、统计计数、命令和上传页面
+"""
+
+import io
+import json
+
+from catalog_import import import_books
+from models import Book, BookCopy
+from search import substring_filter
+from stats import get_library_stats
+
+CSV_TEXT = '''\ufefftitle,author,isbn,category,quantity,publication_date
+批量导入测试之书,导入作者,978-7-300-00001-5,{category},3,2020-05-01
+批量导入测试之书（重复）,导入作者,9787300000015,{category},1,
+已存在的书,某作者,978-7-111-00000-6,{category},1,
+分类不存在的书,某作者,9787300000022,不存在的分类,1,
+数量错误的书,某作者,9787300000039,{category},很多,
+,缺书名,9787300000046,{category},1,
+'''
+
+
+def test_import_csv(app, app_context, scratch_category):
+    _, category = scratch_category
+    before = get_library_stats()['total_books']
+    csv_text = CSV_TEXT.format(category=category)
+    report = import_books(io.BytesIO(csv_text.encode('utf-8')), 'csv', batch_size=2)
+
+    assert (report.rows, report.inserted, report.duplicates, report.error_count) == (6, 1, 2, 3)
+    assert [line for line, _ in report.errors] == [5, 6, 7]
+    assert report.rows_per_second > 0
+
+    book = Book.query.filter_by(isbn='9787300000015').one()
+    assert (book.quantity, book.available_quantity, book.category.name) == (3, 3, category)
+    assert str(book.publication_date) == '2020-05-01'
+    assert BookCopy.query.filter_by(book_id=book.id, status='available').count() == 3
+    # 直接写入的图书也要进入 n-gram 索引和仪表板计数
+    assert Book.query.filter(substring_filter(Book, ('title',), '导入测试')).count() == 1
+    assert get_library_stats()['total_books'] == before + 1
+
+
+def test_import_jsonl_reports_bad_lines(app, app_context, scratch_category):
+    _, category = scratch_category
+    lines = [
+        json.dumps({'书名': 'JSONL 导入之书', '作者': '作者甲', 'isbn': '9787300001005', '分类': category},
+                   ensure_ascii=False),
+        '{not json',
+        '[1, 2]',
+        '',
+    ]
+    report = import_books(io.BytesIO('\n'.join(lines).encode('utf-8')), 'jsonl')
+    assert (report.inserted, report.error_count) == (1, 2)
+    assert [line for line, _ in report.errors] == [2, 3]
+    assert Book.query.filter_by(isbn='9787300001005').one().quantity == 1
+
+
+def test_import_command(app, tmp_path, scratch_category):
+    _, category = scratch_category
+    path = tmp_path / 'books.csv'
+    path.write_text(f'title,author,isbn,category\n命令行导入之书,作者乙,9787300002002,{category}\n', encoding='utf-8')
+    result = app.test_cli_runner().invoke(args=['import-books', str(path)])
+    assert result.exit_code == 0, result.output
+    assert '导入 1 本' in result.output
+
+
+def test_upload_page(admin_client, user_client, scratch_category):
+    _, category = scratch_category
+    csv_text = f'title,author,isbn,category\n上传导入之书,作者丙,9787300003009,{category}\n'
+    data = {'file': (io.BytesIO(csv_text.encode('utf-8')),
+                     'books.csv')}
+    response = admin_client.post('/admin/books/import', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert '导入 1 本' in response.get_data(as_text=True)
+
+    data = {'file': (io.BytesIO(b'x'), 'books.xlsx')}
+    response = admin_client.post('/admin/books/import', data=data, content_type='multipart/form-data')
+    assert '只支持 CSV 或 JSONL 文件' in response.get_data(as_text=True)
+    assert user_client.get('/admin/books/import').status_code == 403
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发借还压力测试：多个线程同时借阅、归还同一本书，检查库存和借阅记录始终一致
+"""
+
+import threading
+from datetime import datetime
+
+import pytest
+
+from circulation import lend_book, return_record, return_records, CirculationError, AlreadyBorrowed
+from instrumentation import count_queries
+from models import db, Book, BorrowRecord, Category, User
+
+THREADS = 16
+COPIES = 5
+
+
+@pytest.fixture
+def scarce_book(app):
+    """一本只有 COPIES 册的新书，以及 THREADS 个新读者"""
+    with app.app_context():
+        category = Category(name=f'并发测试{datetime.utcnow().timestamp()}')
+        db.session.add(category)
+        db.session.flush()
+        book = Book(title='抢手的书', author='测试', isbn=f'S{datetime.utcnow().timestamp()}',
+                    quantity=COPIES, available_quantity=COPIES, category_id=category.id)
+        users = []
+        for i in range(THREADS):
+            users.append(User(username=f'{category.name}-{i}', email=f'{category.id}-{i}@example.com',
+                              full_name='并发读者', password_hash='-'))
+        db.session.add(book)
+        db.session.add_all(users)
+        db.session.commit()
+        return book.id, [user.id for user in users]
+
+
+def run_concurrently(app, target, args_list):
+    """每个线程在自己的应用上下文（独立会话）中执行 target，返回各自的结果或异常"""
+    barrier = threading.Barrier(len(args_list))
+    results = [None] * len(args_list)
+
+    def worker(index, args):
+        with app.app_context():
+            barrier.wait()
+            try:
+                results[index] = target(*args)
+            except CirculationError as e:
+                results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def book_state(app, book_id):
+    with app.app_context():
+        book = db.session.get(Book, book_id)
+        borrowed = BorrowRecord.query.filter_by(book_id=book_id, status='borrowed').count()
+        return book.available_quantity, borrowed
+
+
+def test_concurrent_borrows_never_oversell(app, scarce_book):
+    book_id, user_ids = scarce_book
+
+    results = run_concurrently(app, lambda user_id: lend_book(user_id, book_id) and True,
+                               [(user_id,) for user_id in user_ids])
+
+    assert sum(1 for result in results if result is True) == COPIES
+    assert book_state(app, book_id) == (0, COPIES)
+
+
+def test_concurrent_borrows_by_one_user_create_one_record(app, scarce_book):
+    book_id, user_ids = scarce_book
+
+    results = run_concurrently(app, lambda: lend_book(user_ids[0], book_id) and True, [()] * 8)
+
+    assert sum(1 for result in results if result is True) == 1
+    assert all(isinstance(result, AlreadyBorrowed) for result in results if result is not True)
+    assert book_state(app, book_id) == (COPIES - 1, 1)
+
+
+def test_concurrent_returns_restore_stock_once(app, scarce_book):
+    book_id, user_ids = scarce_book
+    with app.app_context():
+        record_ids = [lend_book(user_id, book_id).id for user_id in user_ids[:COPIES]]
+
+    def give_back(record_id):
+        return_record(db.session.get(BorrowRecord, record_id))
+        return True
+
+    # 每条记录由两个线程同时归还
+    results = run_concurrently(app, give_back, [(record_id,) for record_id in record_ids * 2])
+
+    assert sum(1 for result in results if result is True) == COPIES
+    assert book_state(app, book_id) == (COPIES, 0)
+
+
+@pytest.mark.parametrize('chunk_size', [2, 500])
+def test_batch_return_reports_each_id_and_restores_stock(app, scarce_book, chunk_size):
+    book_id, user_ids = scarce_book
+    with app.app_context():
+        record_ids = [lend_book(user_id, book_id).id for user_id in user_ids[:4]]
+        return_record(db.session.get(BorrowRecord, record_ids[0]))
+
+        request_ids = [record_ids[0], record_ids[1], 999999, record_ids[2], record_ids[1], 'x', record_ids[3]]
+        success_count, failures = return_records(request_ids, chunk_size=chunk_size)
+
+    assert success_count == 3
+    assert failures == [(record_ids[0], '抢手的书'), (999999, None), (record_ids[1], '抢手的书'), ('x', None)]
+    assert book_state(app, book_id) == (COPIES, 0)
+
+
+def test_batch_return_statement_count_independent_of_size(app, scarce_book):
+    book_id, user_ids = scarce_book
+    with app.app_context():
+        engine = db.engine
+        record_ids = [lend_book(user_id, book_id).id for user_id in user_ids[:COPIES]]
+        db.session.remove()
+
+    with app.app_context():
+        with count_queries(engine) as one:
+            assert return_records(record_ids[:1]) == (1, [])
+    with app.app_context():
+        with count_queries(engine) as many:
+            assert return_records(record_ids[1:]) == (COPIES - 1, [])
+    assert many.count == one.count, many.report()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+馆藏副本测试：自动建立副本、借还时的副本状态、增减册数、扫副本条码、计数核对、回填和删除读者时放回副本
+"""
+
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from circulation import lend_book, return_record
+from copies import backfill_copies, check_copy_counters, copy_barcode
+from instrumentation import count_queries
+from isbn import isbn13_check_digit
+from models import db, Book, BookCopy, BorrowRecord, User
+
+_isbn_numbers = itertools.count()
+
+
+@pytest.fixture
+def new_book(app, scratch_category):
+    """一本有 3 册的新书，放在测试专用分类中，测试结束后连同副本和借阅记录删除"""
+    category_id, _ = scratch_category
+    with app.app_context():
+        isbn = f'978730099{next(_isbn_numbers):03d}'
+        book = Book(title='副本测试之书', author='测试', isbn=isbn + isbn13_check_digit(isbn),
+                    quantity=3, available_quantity=3, category_id=category_id)
+        db.session.add(book)
+        db.session.commit()
+        return book.id
+
+
+def copy_statuses(book_id):
+    return [status for (status,) in db.session.query(BookCopy.status).filter_by(book_id=book_id).order_by(BookCopy.id)]
+
+
+def test_lend_and_return_move_a_copy(app_context, new_book):
+    barcodes = [barcode for (barcode,) in db.session.query(BookCopy.barcode).filter_by(book_id=new_book)]
+    assert barcodes == [copy_barcode(new_book, number) for number in (1, 2, 3)]
+
+    user_id = User.query.filter_by(username='reader1').one().id
+    record = lend_book(user_id, new_book)
+    assert record.copy.barcode == barcodes[0]
+    assert copy_statuses(new_book) == ['borrowed', 'available', 'available']
+
+    return_record(record)
+    assert copy_statuses(new_book) == ['available'] * 3
+    assert db.session.get(Book, new_book).available_quantity == 3
+
+
+def test_edit_quantity_adds_and_withdraws_copies(app, admin_client, new_book):
+    with app.app_context():
+        book = db.session.get(Book, new_book)
+        form = {'title': book.title, 'author': book.author, 'isbn': book.isbn, 'category_id': book.category_id}
+        lend_book(User.query.filter_by(username='reader1').one().id, new_book)
+
+    admin_client.post(f'/admin/books/edit/{new_book}', data=dict(form, quantity=5))
+    with app.app_context():
+        book = db.session.get(Book, new_book)
+        assert (book.quantity, book.available_quantity) == (5, 4)
+        assert len(copy_statuses(new_book)) == 5
+
+    admin_client.post(f'/admin/books/edit/{new_book}', data=dict(form, quantity=2))
+    with app.app_context():
+        book = db.session.get(Book, new_book)
+        assert (book.quantity, book.available_quantity) == (2, 1)
+        assert copy_statuses(new_book) == ['borrowed', 'available', 'withdrawn', 'withdrawn', 'withdrawn']
+
+
+def test_edit_quantity_below_borrowed_is_rejected(app, admin_client, new_book):
+    with app.app_context():
+        book = db.session.get(Book, new_book)
+        form = {'title': book.title, 'author': book.author, 'isbn': book.isbn, 'category_id': book.category_id}
+        for username in ('reader1', 'reader2'):
+            lend_book(User.query.filter_by(username=username).one().id, new_book)
+
+    html = admin_client.post(f'/admin/books/edit/{new_book}', data=dict(form, quantity=1)).get_data(as_text=True)
+    assert '当前有 2 册借出' in html
+    with app.app_context():
+        book = db.session.get(Book, new_book)
+        assert (book.quantity, book.available_quantity) == (3, 1)
+
+
+def test_scan_copy_barcode(app, admin_client, new_book):
+    barcode = copy_barcode(new_book, 2)
+    response = admin_client.post('/admin/circulation/scan', json={'user': 'reader1', 'item': barcode.lower()})
+    assert response.status_code == 200, response.get_json()
+    with app.app_context():
+        assert db.session.get(BorrowRecord, response.get_json()['record_id']).copy.barcode == barcode
+
+    # 这一册已借出，其他读者不能再借
+    response = admin_client.post('/admin/circulation/scan', json={'user': 'reader2', 'item': barcode})
+    assert response.status_code == 409
+    assert admin_client.post('/admin/circulation/scan',
+                             json={'user': 'reader1', 'item': barcode}).get_json()['action'] == 'return'
+
+
+def test_incremental_check_only_reads_changed_books(app, monkeypatch):
+    monkeypatch.setattr('copies.CHECK_OVERLAP', timedelta(0))
+    with app.app_context():
+        check_copy_counters(full=True)
+        book = Book.query.first()
+        # 漏掉副本变化的计数写入
+        db.session.execute(update(Book).where(Book.id == book.id)
+                           .values(available_quantity=Book.available_quantity + 1, updated_at=datetime.utcnow()))
+        db.session.commit()
+
+        with count_queries() as counter:
+            checked, mismatches = check_copy_counters()
+        assert [book_id for book_id, _, _ in mismatches] == [book.id]
+        assert checked == 1
+        db.session.expire_all()
+        assert check_copy_counters(full=True)[1] == []
+
+        with db.engine.connect() as connection:
+            for statement, parameters in zip(counter.statements, counter.parameters):
+                if statement.lstrip().upper().startswith('SELECT'):
+                    details = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement,
+                                                                             parameters)]
+                    assert not [detail for detail in details
+                                if detail.startswith(('SCAN books', 'SCAN book_copies')) and 'USING' not in detail], \
+                        f'{statement}\n{details}'
+
+
+def test_backfill_assigns_loans_to_copies(app_context, new_book):
+    user_id = User.query.filter_by(username='reader3').one().id
+    record = lend_book(user_id, new_book)
+    record_id = record.id
+    # 副本表建立之前的数据：图书没有副本，在借记录没有指向副本
+    db.session.execute(update(BorrowRecord).where(BorrowRecord.id == record_id).values(copy_id=None))
+    BookCopy.query.filter_by(book_id=new_book).delete()
+    db.session.commit()
+
+    created, assigned = backfill_copies(db.session.connection())
+    db.session.commit()
+    assert (created, assigned) == (3, 1)
+    assert db.session.get(BorrowRecord, record_id).copy.status == 'borrowed'
+    book = db.session.get(Book, new_book)
+    assert (book.quantity, book.available_quantity) == (3, 2)
+
+
+def test_delete_user_returns_borrowed_copies(app, admin_client, new_book):
+    with app.app_context():
+        user = User(username='副本测试读者', email='copies-reader@example.com', full_name='副本测试读者',
+                    password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        return_record(lend_book(user_id, new_book))
+        lend_book(user_id, new_book)
+        assert copy_statuses(new_book) == ['borrowed', 'available', 'available']
+
+    admin_client.get(f'/admin/users/delete/{user_id}')
+    with app.app_context():
+        assert db.session.get(User, user_id) is None
+        assert copy_statuses(new_book) == ['available'] * 3
+        book = db.session.get(Book, new_book)
+        assert (book.quantity, book.available_quantity) == (3, 3)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读写分离测试：GET 请求的查询走只读 engine，写入和写入后的请求走主库
+"""
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from conftest import _login
+from db_routing import READ_ENGINE_KEY
+from instrumentation import count_queries
+from models import db, Book
+
+
+@pytest.fixture
+def engines(app):
+    with app.app_context():
+        return db.engine, app.extensions[READ_ENGINE_KEY]
+
+
+def test_get_requests_read_from_read_engine(user_client, engines):
+    primary, replica = engines
+    # 第一次搜索会在主库上检测 FTS5 是否可用
+    user_client.get('/books?search=Python')
+    with count_queries(primary) as on_primary, count_queries(replica) as on_replica:
+        assert user_client.get('/books?search=Python').status_code == 200
+    assert on_replica.count > 0
+    assert on_primary.count == 0, on_primary.report()
+
+
+def test_read_engine_is_read_only(engines):
+    _, replica = engines
+    with replica.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("UPDATE books SET quantity = quantity")
+
+
+def test_writes_stick_to_primary(app, engines):
+    primary, replica = engines
+    client = _login(app, 'reader4', 'test123')
+    with app.app_context():
+        book_id = Book.query.filter(Book.available_quantity > 0).order_by(Book.id.desc()).first().id
+
+    with count_queries(replica) as during_borrow:
+        assert client.get(f'/books/borrow/{book_id}').status_code == 302
+    assert during_borrow.count == 0, during_borrow.report()
+
+    # 刚写入过的用户在 READ_YOUR_WRITES_SECONDS 内读主库
+    with count_queries(replica) as after_borrow:
+        assert client.get('/user/borrow-history').status_code == 200
+    assert after_borrow.count == 0, after_borrow.report()
+
+    # 其他用户不受影响
+    other = _login(app, 'reader5', 'test123')
+    with count_queries(replica) as other_user:
+        assert other.get('/user/borrow-history').status_code == 200
+    assert other_user.count > 0
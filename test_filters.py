@@ -4,7 +4,7 @@
 测试快速筛选功能
 """
 
-from run import create_app
+from app import create_app
 from models import db, BorrowRecord
 from datetime import datetime, timedelta
 
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试数据生成器测试：借阅记录满足库存约束，热门图书集中，固定种子结果可重复
+"""
+
+import random
+from collections import Counter
+from datetime import datetime
+
+from generate_dataset import RECORD_COLUMNS, copy_offsets, generate_records, parse_args, zipf_sampler
+
+NOW = datetime(2024, 6, 1)
+# 日期列按 SQLAlchemy 在 SQLite 中保存 DateTime 的格式生成为文本，可以直接按字符串比较先后
+NOW_TEXT = NOW.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def make_records(seed, count=5000, books=200, users=100):
+    args = parse_args(['--records', str(count)])
+    rng = random.Random(seed)
+    quantities = {book_id: 2 for book_id in range(1, books + 1)}
+    active = {}
+    pick_book = zipf_sampler(rng, range(1, books + 1), args.book_skew)
+    pick_user = zipf_sampler(rng, range(1, users + 1), args.user_skew)
+    records = [dict(zip(RECORD_COLUMNS, row))
+               for row in generate_records(rng, count, pick_book, pick_user, quantities, active, args, NOW)]
+    return records, quantities, active
+
+
+def test_active_borrows_respect_stock_and_uniqueness():
+    records, quantities, active = make_records(seed=1)
+    borrowed = [record for record in records if record['status'] == 'borrowed']
+
+    per_book = Counter(record['book_id'] for record in borrowed)
+    assert per_book == Counter(active)
+    assert all(count <= quantities[book_id] for book_id, count in per_book.items())
+    assert len({(record['user_id'], record['book_id']) for record in borrowed}) == len(borrowed)
+    assert all(record['return_date'] is None and record['borrow_date'] <= NOW_TEXT for record in borrowed)
+    assert all(record['borrow_date'] < record['return_date'] <= NOW_TEXT
+               for record in records if record['status'] == 'returned')
+
+    # 每条在借记录占用自己那本书的一册，不会两条记录指向同一册
+    offsets = copy_offsets(quantities)
+    assert len({record['copy_id'] for record in borrowed}) == len(borrowed)
+    assert all(offsets[record['book_id']] < record['copy_id'] <= offsets[record['book_id']] + quantities[record['book_id']]
+               for record in records)
+
+
+def test_popularity_is_skewed_and_seeded():
+    records, _, _ = make_records(seed=7)
+    top = Counter(record['book_id'] for record in records).most_common(20)
+    # 前 10% 的图书占了远超 10% 的借阅
+    assert sum(count for _, count in top) > len(records) * 0.3
+    assert make_records(seed=7)[0] == records
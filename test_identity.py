@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登录身份解析测试：类型前缀区分管理员和用户，身份缓存命中时不查询数据库，修改资料后失效
+"""
+
+import pytest
+
+from identity import identity_cache, load_principal
+from instrumentation import count_queries
+from models import db, Admin, User
+
+
+@pytest.fixture
+def session_scope(app):
+    identity_cache.clear()
+    with app.test_request_context():
+        yield
+        db.session.rollback()
+        db.session.remove()
+
+
+def test_admin_and_user_with_same_id_are_distinct(session_scope):
+    user = User.query.filter_by(username='reader1').one()
+    admin = Admin.query.filter_by(username='admin').one()
+    assert user.id == admin.id
+
+    assert isinstance(load_principal(user.get_id()), User)
+    assert isinstance(load_principal(admin.get_id()), Admin)
+    assert load_principal('reader:1') is None
+    assert load_principal('user:abc') is None
+
+
+def test_legacy_numeric_id_still_resolves(session_scope):
+    admin = Admin.query.filter_by(username='admin').one()
+    assert load_principal(str(admin.id)) is admin
+
+
+def test_cached_identity_skips_database_until_profile_changes(session_scope):
+    user_id = User.query.filter_by(username='reader3').one().get_id()
+    db.session.expunge_all()
+
+    with count_queries() as first:
+        load_principal(user_id)
+    assert first.count == 1
+
+    db.session.expunge_all()
+    with count_queries() as cached:
+        user = load_principal(user_id)
+    assert cached.count == 0
+    assert user.username == 'reader3'
+
+    user.full_name = '读者三号'
+    db.session.commit()
+    db.session.expunge_all()
+    with count_queries() as reloaded:
+        user = load_principal(user_id)
+    assert reloaded.count == 1
+    assert user.full_name == '读者三号'
+
+
+def test_user_with_admin_id_can_open_user_pages(app):
+    client = app.test_client()
+    assert client.post('/login', data={'username': 'reader1', 'password': 'test123'}).status_code == 302
+    assert client.get('/user/dashboard').status_code == 200
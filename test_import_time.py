@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入耗时测试：用 python -X importtime 在新进程中导入模块
+
+- 维护脚本和命令使用的 database / cli 不能加载表单、视图和监控模块
+- 本项目模块自身的导入耗时（不含 Flask、SQLAlchemy 等第三方库）不超过 OWN_BUDGET_MS
+- 包括第三方库在内的总耗时不超过 TOTAL_BUDGET_MS，预留了较大余量，只用于发现引入重量级依赖之类的回归
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+OWN_BUDGET_MS = {'app': 200, 'database': 120}
+TOTAL_BUDGET_MS = {'app': 2000, 'database': 1500}
+
+# 只有处理请求的 app 需要的模块
+WEB_ONLY_MODULES = {'app', 'forms', 'flask_wtf', 'wtforms', 'email_validator', 'metrics', 'instrumentation'}
+
+
+def import_profile(module):
+    """返回 {模块名: (自身微秒, 累计微秒)}"""
+    env = dict(os.environ, DATABASE_URL='sqlite://')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        profile[name] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def own_module(name):
+    return os.path.exists(os.path.join(ROOT, name.split('.')[0] + '.py'))
+
+
+@pytest.mark.parametrize('module', ['database', 'cli', 'models'])
+def test_maintenance_imports_skip_web_modules(module):
+    loaded = set(import_profile(module))
+    assert not loaded & WEB_ONLY_MODULES, sorted(loaded & WEB_ONLY_MODULES)
+
+
+@pytest.mark.parametrize('module', sorted(OWN_BUDGET_MS))
+def test_import_time_budget(module):
+    # 取两次中较快的一次，减少磁盘缓存等偶然因素的影响
+    profiles = [import_profile(module) for _ in range(2)]
+    own_ms = min(sum(self_us for name, (self_us, _) in profile.items() if own_module(name))
+                 for profile in profiles) / 1000
+    total_ms = min(profile[module][1] for profile in profiles) / 1000
+    assert own_ms <= OWN_BUDGET_MS[module], f'{module} 自身导入耗时 {own_ms:.0f}ms'
+    assert total_ms <= TOTAL_BUDGET_MS[module], f'{module} 导入总耗时 {total_ms:.0f}ms'
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ISBN 规范化测试：格式转换、校验位、isbn13 回填、查重和精确查找
+"""
+
+import pytest
+from sqlalchemy import update
+
+from instrumentation import count_queries
+from isbn import InvalidISBN, normalize_isbn, to_isbn13
+from migrations import add_book_isbn13
+from models import db, Book
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('978-7-115-42802-8', '9787115428028'),
+    ('9787115428028', '9787115428028'),
+    (' 978 7 115 42802 8 ', '9787115428028'),
+    ('0-306-40615-2', '9780306406157'),
+    ('080442957x', '9780804429573'),
+])
+def test_normalize_isbn(value, expected):
+    assert normalize_isbn(value) == expected
+
+
+@pytest.mark.parametrize('value', ['9787115428029', '0-306-40615-3', '12345', '', None, 'B00000001'])
+def test_invalid_isbn(value):
+    with pytest.raises(InvalidISBN):
+        normalize_isbn(value)
+    assert to_isbn13(value) is None
+
+
+def test_isbn13_follows_isbn(app_context):
+    book = Book.query.first()
+    original = book.isbn
+    book.isbn = '0-306-40615-2'
+    assert book.isbn13 == '9780306406157'
+    book.isbn = original
+    assert book.isbn13 == normalize_isbn(original)
+    db.session.rollback()
+
+
+def test_backfill_migration(app_context):
+    db.session.execute(update(Book).values(isbn13=None))
+    add_book_isbn13(db.session.connection())
+    db.session.commit()
+    books = Book.query.all()
+    assert all(book.isbn13 == to_isbn13(book.isbn) for book in books)
+    assert any(book.isbn13 for book in books)
+
+
+def test_hyphenated_search_uses_isbn13(app, admin_client, user_client):
+    with app.app_context():
+        book = Book.query.filter(Book.isbn13.isnot(None)).first()
+        isbn13, title = book.isbn13, book.title
+    hyphenated = f'{isbn13[:3]}-{isbn13[3]}-{isbn13[4:7]}-{isbn13[7:12]}-{isbn13[12]}'
+
+    with count_queries() as counter:
+        html = admin_client.get(f'/admin/books?search={hyphenated}').get_data(as_text=True)
+    assert title in html
+    assert any('books.isbn13 = ' in statement for statement in counter.statements)
+
+    with count_queries() as counter:
+        response = admin_client.get(f'/admin/records?search={hyphenated}&search_type=isbn')
+    assert response.status_code == 200
+    assert any('books.isbn13 = ' in statement for statement in counter.statements)
+    assert user_client.get(f'/user/borrow-history?search={hyphenated}').status_code == 200
+
+
+def test_add_book_rejects_duplicate_and_bad_checksum(app, admin_client):
+    with app.app_context():
+        book = Book.query.filter(Book.isbn13.isnot(None)).first()
+        isbn13, category_id, count = book.isbn13, book.category_id, Book.query.count()
+
+    form = {'title': '重复的书', 'author': '作者', 'quantity': 1, 'category_id': category_id,
+            'isbn': f'{isbn13[:3]}-{isbn13[3:]}'}
+    html = admin_client.post('/admin/books/add', data=form).get_data(as_text=True)
+    assert 'ISBN已存在' in html
+
+    form['isbn'] = isbn13[:12] + str((int(isbn13[12]) + 1) % 10)
+    html = admin_client.post('/admin/books/add', data=form).get_data(as_text=True)
+    assert 'ISBN 校验位不正确' in html
+    with app.app_context():
+        assert Book.query.count() == count
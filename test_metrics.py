@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/metrics 接口测试
+"""
+
+import threading
+
+from metrics import registry
+
+
+def _metric_values(text):
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+
+def test_metrics_exposes_requests_sql_and_gauges(app, admin_client):
+    registry.clear()
+    for _ in range(3):
+        assert admin_client.get('/admin/records').status_code == 200
+
+    response = admin_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    values = _metric_values(response.get_data(as_text=True))
+
+    assert values['library_http_requests_total{endpoint="admin_borrow_records",method="GET",status="200"}'] == 3
+    assert values['library_http_request_duration_seconds_count{endpoint="admin_borrow_records"}'] == 3
+    assert values['library_http_request_duration_seconds_bucket{endpoint="admin_borrow_records",le="+Inf"}'] == 3
+    assert values['library_sql_statements_total{endpoint="admin_borrow_records"}'] >= 3
+    assert 'library_db_pool_connections{engine="primary",state="checked_out"}' in values
+
+    from models import db, Book, BorrowRecord
+    with app.app_context():
+        assert values['library_active_borrows'] == BorrowRecord.query.filter_by(status='borrowed').count()
+        assert values['library_available_copies'] == db.session.query(db.func.sum(Book.available_quantity)).scalar()
+
+
+def test_metrics_from_finished_threads_are_kept(app):
+    registry.clear()
+
+    def worker():
+        with app.test_request_context('/books'):
+            registry.shard().observe('browse_books', 'GET', 200, 0.02)
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = registry.snapshot()
+    assert snapshot.requests[('browse_books', 'GET', 200)] == 5
+    # 已结束线程的数据并入总计，不再单独保存
+    assert registry._shards == []
+    assert registry.snapshot().requests[('browse_books', 'GET', 200)] == 5
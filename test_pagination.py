@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+游标分页测试：after / before 游标、游标校验，以及游标翻页与页码翻页结果一致；总数缓存的命中和失效
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from instrumentation import count_queries
+from models import db, BorrowRecord, User
+from pagination import CountCache, count_cache, count_rows, decode_cursor, encode_cursor, paginate
+from record_filters import filter_borrow_records
+
+SORTS = ['borrow_date', 'due_date', 'return_date', 'user_name']
+PER_PAGE = 7
+
+
+def record_query(sort):
+    query, keys, _ = filter_borrow_records(BorrowRecord.query, {'sort_by': sort})
+    return query, keys
+
+
+def ids(pagination):
+    return [record.id for record in pagination.items]
+
+
+@pytest.mark.parametrize('sort', SORTS)
+def test_cursor_pages_match_offset_pages(app_context, sort):
+    query, keys = record_query(sort)
+    offset_pages = []
+    page = paginate(query, keys, page=1, per_page=PER_PAGE)
+    while True:
+        offset_pages.append(ids(page))
+        if not page.has_next:
+            break
+        page = paginate(query, keys, page=page.page + 1, per_page=PER_PAGE)
+    assert len(offset_pages) > 2
+
+    # 从第一页起用 after 游标向后翻到最后一页
+    page = paginate(query, keys, page=1, per_page=PER_PAGE)
+    forward = [ids(page)]
+    while page.next_cursor:
+        page = paginate(query, keys, per_page=PER_PAGE, after=page.next_cursor)
+        assert page.is_keyset
+        forward.append(ids(page))
+    assert forward == offset_pages
+    assert page.page == len(offset_pages)
+    assert page.total == sum(len(items) for items in offset_pages)
+
+    # 再用 before 游标从最后一页翻回第一页
+    backward = [ids(page)]
+    while page.prev_cursor:
+        page = paginate(query, keys, per_page=PER_PAGE, before=page.prev_cursor)
+        backward.append(ids(page))
+    assert list(reversed(backward)) == offset_pages
+    assert page.page == 1 and not page.has_prev
+
+
+def test_cursor_position_and_total(app_context):
+    query, keys = record_query('borrow_date')
+    first = paginate(query, keys, page=1, per_page=PER_PAGE)
+    # 游标翻页沿用游标中的总数，不再 COUNT(*)
+    with count_queries() as counter:
+        second = paginate(query, keys, per_page=PER_PAGE, after=first.next_cursor)
+        assert second.items
+    assert len(counter.statements) == 1
+    assert (second.page, second.first, second.total) == (2, PER_PAGE + 1, first.total)
+    assert second.has_prev and second.prev_cursor
+    back = paginate(query, keys, per_page=PER_PAGE, before=second.prev_cursor)
+    assert ids(back) == ids(first)
+
+
+def test_cursor_for_another_sort_is_ignored(app_context):
+    query, keys = record_query('borrow_date')
+    token = paginate(query, keys, page=1, per_page=PER_PAGE).next_cursor
+    assert decode_cursor(keys, token) is not None
+
+    # 换了排序方式后旧游标的签名不匹配，回到第一页
+    other_query, other_keys = record_query('due_date')
+    assert decode_cursor(other_keys, token) is None
+    page = paginate(other_query, other_keys, per_page=PER_PAGE, after=token)
+    assert not page.is_keyset
+    assert ids(page) == ids(paginate(other_query, other_keys, page=1, per_page=PER_PAGE))
+
+
+def _b64(payload):
+    raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda token: token[:-4],                                   # 截断
+    lambda token: '!' + token[1:],                              # 非 base64 字符
+    lambda token: _b64(b'\xff\xfe not json'),                   # 解码后不是 JSON
+    lambda token: _b64({'v': [], 'p': 0}),                      # 缺少签名
+    lambda token: _b64(dict(json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))),
+                            v=['not a date', 1])),              # 排序键值格式错误
+    lambda token: _b64(dict(json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))),
+                            p='x')),                            # 位置不是整数
+])
+def test_tampered_cursor_is_rejected(app_context, tamper):
+    query, keys = record_query('borrow_date')
+    first = paginate(query, keys, page=1, per_page=PER_PAGE)
+    token = tamper(first.next_cursor)
+    assert decode_cursor(keys, token) is None
+    page = paginate(query, keys, per_page=PER_PAGE, after=token)
+    assert not page.is_keyset and ids(page) == ids(first)
+
+
+def test_encode_decode_round_trip(app_context):
+    _, keys = record_query('return_date')
+    record = BorrowRecord.query.filter(BorrowRecord.return_date.is_(None)).first()
+    token = encode_cursor(keys, [record.return_sort_date, record.id], 12, total=40)
+    cursor = decode_cursor(keys, token)
+    assert cursor['values'] == [record.return_sort_date, record.id]
+    assert (cursor['position'], cursor['total'], cursor['estimated']) == (12, 40, False)
+
+
+COUNT_KEY = ('borrow_records', ('总数缓存测试',))
+
+
+def counted(query):
+    """返回 (总数, 是否执行了 SQL)"""
+    with count_queries() as counter:
+        total, _ = count_rows(query, count_key=COUNT_KEY)
+    return total, bool(counter.statements)
+
+
+def test_count_cache_hit_skips_sql(app_context):
+    count_cache.clear()
+    query = BorrowRecord.query
+    total, queried = counted(query)
+    assert queried and total == query.count()
+    assert counted(query) == (total, False)
+
+
+def test_count_cache_invalidated_by_record_writes(app_context):
+    count_cache.clear()
+    query = BorrowRecord.query.filter(BorrowRecord.status == 'returned')
+    user_id, book_id = db.session.query(BorrowRecord.user_id, BorrowRecord.book_id).first()
+    total, _ = counted(query)
+
+    # 新增
+    now = datetime.utcnow()
+    record = BorrowRecord(user_id=user_id, book_id=book_id, borrow_date=now, due_date=now + timedelta(days=30),
+                          status='returned', return_date=now)
+    db.session.add(record)
+    db.session.commit()
+    assert counted(query) == (total + 1, True)
+    assert counted(query) == (total + 1, False)
+
+    # ORM 修改（不经过在借状态，不影响仪表板计数）
+    record.status = 'overdue'
+    db.session.commit()
+    assert counted(query) == (total, True)
+
+    # 批量修改
+    BorrowRecord.query.filter_by(id=record.id).update({BorrowRecord.status: 'returned'})
+    db.session.commit()
+    assert counted(query) == (total + 1, True)
+
+    # 批量删除
+    BorrowRecord.query.filter_by(id=record.id).delete()
+    db.session.commit()
+    assert counted(query) == (total, True)
+
+
+def test_count_cache_survives_rollback_and_other_tables(app_context):
+    count_cache.clear()
+    query = BorrowRecord.query
+    total, _ = counted(query)
+
+    BorrowRecord.query.filter(BorrowRecord.id < 0).delete()
+    db.session.rollback()
+    assert counted(query) == (total, False)
+
+    user = User.query.first()
+    user.phone = '13900000000'
+    db.session.commit()
+    assert counted(query) == (total, False)
+
+
+def test_count_cache_ttl_and_capacity(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('pagination.time.monotonic', lambda: clock[0])
+    cache = CountCache(max_entries=2)
+    cache.set('books', 'a', (1, False), ttl=30)
+    assert cache.get('books', 'a') == (1, False)
+    clock[0] += 31
+    assert cache.get('books', 'a') is None
+
+    cache.set('books', 'a', (1, False), ttl=30)
+    cache.set('books', 'b', (2, False), ttl=30)
+    cache.set('books', 'c', (3, False), ttl=30)
+    # 超出容量时淘汰最早写入的条目
+    assert [cache.get('books', key) for key in 'abc'] == [None, (2, False), (3, False)]
+
+    # 只失效指定的命名空间
+    cache.set('users', 'a', (4, False), ttl=30)
+    cache.invalidate('books')
+    assert cache.get('books', 'c') is None
+    assert cache.get('users', 'a') == (4, False)
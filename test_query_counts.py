@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+借阅记录相关页面的 SQL 语句数测试：每页的语句数不应随记录行数增长（N+1 懒加载）
+"""
+
+import pytest
+
+from instrumentation import assert_max_queries, count_queries
+from pagination import count_cache
+
+
+def test_admin_borrow_records_eager_loads_rows(admin_client):
+    with assert_max_queries(3):
+        response = admin_client.get('/admin/records?sort_by=due_date')
+    assert response.status_code == 200
+    assert '读者' in response.get_data(as_text=True)
+
+
+def test_admin_borrow_records_query_count_independent_of_rows(admin_client):
+    # 两次请求都重新统计总数，比较的只是取数据本身的语句数
+    count_cache.clear()
+    with count_queries() as one_row:
+        assert admin_client.get('/admin/records?search=1&search_type=id').status_code == 200
+    with count_queries() as full_page:
+        assert admin_client.get('/admin/records?status=borrowed').status_code == 200
+    assert full_page.count == one_row.count, full_page.report()
+
+
+@pytest.mark.parametrize('url, limit', [
+    ('/user/dashboard', 5),
+    ('/user/borrow-history', 4),
+    ('/user/borrow-history?search=Python', 4),
+])
+def test_user_pages_eager_load_books(user_client, url, limit):
+    with assert_max_queries(limit):
+        response = user_client.get(url)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('url', ['/admin/categories', '/admin/categories?search=文学'])
+def test_admin_categories_counts_books_in_sql(admin_client, url):
+    with assert_max_queries(3) as counter:
+        response = admin_client.get(url)
+    assert response.status_code == 200
+    assert not any(statement.lstrip().startswith('SELECT books.') for statement in counter.statements), counter.report()
+    assert '10 本书' in response.get_data(as_text=True)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+借阅记录查询的执行计划测试：各页面对 borrow_records 的查询都应使用索引，不做全表扫描
+"""
+
+import pytest
+from sqlalchemy import text
+
+from instrumentation import count_queries
+from migrations import MIGRATIONS, applied_versions
+from models import db, BorrowRecord
+from pagination import paginate
+from record_filters import filter_borrow_records
+
+
+@pytest.fixture
+def engine(app):
+    with app.app_context():
+        return db.engine
+
+
+def borrow_record_plans(engine, counter):
+    """对捕获到的每条涉及 borrow_records 的 SELECT 执行 EXPLAIN QUERY PLAN，返回 (语句, 计划行)"""
+    plans = []
+    with engine.connect() as connection:
+        for statement, parameters in zip(counter.statements, counter.parameters):
+            if not statement.lstrip().upper().startswith('SELECT') or 'borrow_records' not in statement:
+                continue
+            rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            plans.append((statement, [row[-1] for row in rows]))
+    return plans
+
+
+def assert_no_full_scan(plans, allow_sort=False):
+    """不允许全表扫描、不带条件的覆盖索引全扫描，以及为 ORDER BY 建临时 B 树（要读出全部匹配行再排序）
+
+    按索引顺序扫描（SCAN ... USING INDEX）并在取够 LIMIT 行后停止是允许的。allow_sort 用于按到期日期
+    范围筛选的页面：按 (status, due_date) 索引只取出范围内的在借记录，再按借阅日期排序。
+    """
+    assert plans
+    for statement, details in plans:
+        problems = [detail for detail in details
+                    if (detail.startswith('SCAN borrow_records')
+                        and ('USING' not in detail or 'COVERING INDEX' in detail))
+                    or ('USE TEMP B-TREE FOR ORDER BY' in detail and not allow_sort)]
+        assert not problems, f'{statement}\n' + '\n'.join(details)
+
+
+SORTS = ['borrow_date', 'due_date', 'return_date', 'user_name']
+
+
+@pytest.mark.parametrize('url', [
+    '/admin/records',
+    '/admin/records?status=borrowed',
+    '/admin/records?status=returned',
+    '/admin/records?days=7',
+    '/admin/records?status=borrowed&sort_by=due_date',
+] + [f'/admin/records?sort_by={sort}' for sort in SORTS])
+def test_admin_record_queries_use_indexes(admin_client, engine, url):
+    with count_queries() as counter:
+        assert admin_client.get(url).status_code == 200
+    assert_no_full_scan(borrow_record_plans(engine, counter))
+
+
+@pytest.mark.parametrize('url', [
+    '/admin/records?status=overdue',
+    '/admin/records?due_filter=today',
+])
+def test_admin_due_filters_use_due_date_index(admin_client, engine, url):
+    with count_queries() as counter:
+        assert admin_client.get(url).status_code == 200
+    plans = borrow_record_plans(engine, counter)
+    assert_no_full_scan(plans, allow_sort=True)
+    assert all(any('ix_borrow_records_status_due_date' in detail for detail in details) for _, details in plans)
+
+
+@pytest.mark.parametrize('sort', SORTS)
+@pytest.mark.parametrize('direction', ['after', 'before'])
+def test_record_cursor_pages_use_indexes(app_context, engine, sort, direction):
+    """按游标翻页时按排序索引直接定位，不扫描前面的行"""
+    query, keys, count_key = filter_borrow_records(BorrowRecord.query, {'sort_by': sort})
+    first = paginate(query, keys, per_page=5, count_key=count_key)
+    second = paginate(query, keys, per_page=5, after=first.next_cursor, count=False)
+    cursor = {'after': first.next_cursor} if direction == 'after' else {'before': second.prev_cursor}
+    with count_queries() as counter:
+        assert paginate(query, keys, per_page=5, **cursor).items
+    assert_no_full_scan(borrow_record_plans(engine, counter))
+    for statement, details in borrow_record_plans(engine, counter):
+        assert any(detail.startswith('SEARCH') for detail in details), f'{statement}\n' + '\n'.join(details)
+
+
+@pytest.mark.parametrize('url, allow_sort', [
+    ('/user/dashboard', False),
+    ('/user/borrow-history', False),
+    ('/user/borrow-history?status=overdue', True),
+])
+def test_user_record_queries_use_indexes(user_client, engine, url, allow_sort):
+    with count_queries() as counter:
+        assert user_client.get(url).status_code == 200
+    assert_no_full_scan(borrow_record_plans(engine, counter), allow_sort=allow_sort)
+
+
+def test_overdue_count_uses_status_due_date_index(engine):
+    with engine.connect() as connection:
+        details = [row[-1] for row in connection.execute(text(
+            "EXPLAIN QUERY PLAN SELECT count(id) FROM borrow_records "
+            "WHERE status = 'borrowed' AND due_date >= :start AND due_date < :end"
+        ), {'start': '2024-01-01', 'end': '2024-02-01'})]
+    assert any('ix_borrow_records_status_due_date' in detail for detail in details), details
+
+
+def test_isbn_lookup_uses_isbn13_index(engine):
+    with engine.connect() as connection:
+        details = [row[-1] for row in connection.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM books WHERE isbn13 = :isbn13"
+        ), {'isbn13': '9787115428028'})]
+    assert any('ix_books_isbn13' in detail for detail in details), details
+
+
+def test_all_migrations_recorded(app_context):
+    assert applied_versions() == {version for version, _, _ in MIGRATIONS}
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+借还台扫码接口测试：标识解析、自动借还、错误码和查询次数
+"""
+
+import pytest
+
+from instrumentation import count_queries
+from models import db, Book, User
+
+SCAN_URL = '/admin/circulation/scan'
+
+
+@pytest.fixture
+def scan_book(app, scratch_category):
+    """一本只有 1 册的新书，ISBN 以带连字符的写法录入；放在测试专用分类中，测试结束后删除"""
+    category_id, _ = scratch_category
+    with app.app_context():
+        book = Book(title='扫码测试之书', author='测试', isbn='978-7-5302-2123-5',
+                    quantity=1, available_quantity=1, category_id=category_id)
+        db.session.add(book)
+        db.session.commit()
+        return book.id
+
+
+def test_scan_toggles_checkout_and_return(app, admin_client, scan_book):
+    with app.app_context():
+        user_id = User.query.filter_by(username='reader5').one().id
+
+    scan = {'user': 'reader5', 'item': '9787530221235'}
+    response = admin_client.post(SCAN_URL, json=scan)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['action'] == 'checkout'
+
+    # 另一位读者扫同一本书：已无库存
+    response = admin_client.post(SCAN_URL, json={'user': 'reader4@example.com', 'item': '978 7 5302 2123 5'})
+    assert response.status_code == 409
+
+    # 用读者 id 再扫一次即归还
+    response = admin_client.post(SCAN_URL, json={'user': str(user_id), 'item': '978-7-5302-2123-5'})
+    assert response.get_json()['action'] == 'return'
+    with app.app_context():
+        assert db.session.get(Book, scan_book).available_quantity == 1
+
+    response = admin_client.post(SCAN_URL, json=dict(scan, action='return'))
+    assert response.status_code == 409
+
+
+@pytest.mark.parametrize('payload, status', [
+    ({'user': 'nobody', 'item': '9787530221235'}, 404),
+    ({'user': 'reader5', 'item': '9780306406157'}, 404),
+    ({'user': 'reader5'}, 400),
+    ({'user': 'reader5', 'item': '9787530221235', 'action': 'renew'}, 400),
+])
+def test_scan_errors(admin_client, scan_book, payload, status):
+    response = admin_client.post(SCAN_URL, json=payload)
+    assert response.status_code == status
+    assert response.get_json()['success'] is False
+
+
+def test_scan_requires_admin(user_client, scan_book):
+    assert user_client.post(SCAN_URL, json={'user': 'reader2', 'item': '9787530221235'}).status_code == 403
+
+
+def test_scan_query_count(admin_client, scan_book):
+    """加载管理员、解析读者和图书、查在借记录、借出（扣减库存、查重、取副本并标为借出、INSERT、计数）、取回记录"""
+    with count_queries() as counter:
+        response = admin_client.post(SCAN_URL, json={'user': 'reader3', 'item': '9787530221235'})
+    assert response.status_code == 200
+    assert len(counter.statements) <= 11, counter.statements
+    admin_client.post(SCAN_URL, json={'user': 'reader3', 'item': '9787530221235', 'action': 'return'})
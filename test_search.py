@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图书检索测试：全文索引随图书增删改同步、按 bm25 相关度排序；中文 n-gram 候选集和倒排表维护
+"""
+
+import pytest
+
+from models import db, Book, BookCopy, SearchGram
+from search import apply_book_search, fts_enabled, make_ngrams, ngram_candidates, substring_filter
+
+
+@pytest.fixture
+def fts(app_context):
+    if not fts_enabled():
+        pytest.skip('当前 SQLite 不支持 FTS5')
+
+
+def add_book(category_id, isbn, **fields):
+    book = Book(author=fields.pop('author', '测试'), isbn=isbn, quantity=1, available_quantity=1,
+                category_id=category_id, **fields)
+    db.session.add(book)
+    db.session.commit()
+    return book
+
+
+def search_ids(search):
+    query, rank = apply_book_search(Book.query, search)
+    assert rank is not None, '应当使用全文索引'
+    return [book.id for book in query.order_by(rank, Book.id)]
+
+
+def test_fts_follows_insert_update_delete(fts, scratch_category):
+    category_id, _ = scratch_category
+    book = add_book(category_id, '9787300009001', title='Zyzzogeton Field Guide')
+    assert search_ids('zyzzogeton') == [book.id]
+    # 前缀匹配
+    assert search_ids('zyzzo') == [book.id]
+
+    book.title = 'Quokkaology Primer'
+    db.session.commit()
+    assert search_ids('zyzzogeton') == []
+    assert search_ids('quokkaology') == [book.id]
+
+    # 只改库存不会改动索引内容
+    book.available_quantity = 0
+    db.session.commit()
+    assert search_ids('quokkaology primer') == [book.id]
+
+    BookCopy.query.filter_by(book_id=book.id).delete()
+    db.session.delete(book)
+    db.session.commit()
+    assert search_ids('quokkaology') == []
+
+
+def test_fts_ranks_by_weighted_bm25(fts, scratch_category):
+    category_id, _ = scratch_category
+    in_description = add_book(category_id, '9787300009018', title='Gardening Notes',
+                              description='A chapter on the axolotl pond')
+    in_title = add_book(category_id, '9787300009025', title='The Axolotl Handbook')
+    in_author = add_book(category_id, '9787300009032', title='River Stories', author='Axolotl Press')
+
+    # 书名权重最高，其次作者，描述最低
+    assert search_ids('axolotl') == [in_title.id, in_author.id, in_description.id]
+    # 多个词取交集
+    assert search_ids('axolotl handbook') == [in_title.id]
+
+
+def substring_ids(category_id, search, columns=('title',)):
+    return [book.id for book in Book.query.filter(Book.category_id == category_id,
+                                                  substring_filter(Book, columns, search)).order_by(Book.id)]
+
+
+def candidate_ids(search, columns=('title',)):
+    return {book_id for (book_id,) in db.session.execute(ngram_candidates(Book, columns, search))}
+
+
+def test_ngram_candidates_require_every_bigram(app_context, scratch_category):
+    category_id, _ = scratch_category
+    exact = add_book(category_id, '9787300009049', title='红楼梦研究')
+    scattered = add_book(category_id, '9787300009056', title='红楼旧事与楼梦杂记')
+    partial = add_book(category_id, '9787300009063', title='红楼往事')
+
+    assert make_ngrams('红楼梦') == {'红楼', '楼梦'}
+    candidates = candidate_ids('红楼梦')
+    # 候选集是各 n-gram 倒排列表的交集，只含一个二元组的图书不在其中
+    assert {exact.id, scattered.id} <= candidates
+    assert partial.id not in candidates
+    # 二元组不相邻的候选行由 LIKE 排除
+    assert substring_ids(category_id, '红楼梦') == [exact.id]
+    assert substring_ids(category_id, '红楼') == [exact.id, scattered.id, partial.id]
+
+
+def test_single_character_and_mixed_queries(app_context, scratch_category):
+    category_id, _ = scratch_category
+    mixed = add_book(category_id, '9787300009070', title='Python编程入门')
+    cjk = add_book(category_id, '9787300009001', title='编程珠玑')
+
+    # 单个汉字切不出二元组，直接用 LIKE 匹配
+    assert ngram_candidates(Book, ('title',), '编') is None
+    assert substring_ids(category_id, '编') == [mixed.id, cjk.id]
+
+    # 中英文混合的查询同样切分为二元组，大小写不敏感
+    assert 'n编' in make_ngrams('PYTHON编程')
+    assert mixed.id in candidate_ids('PYTHON编程')
+    assert substring_ids(category_id, 'PYTHON编程') == [mixed.id]
+    # 不含中文的查询不走 n-gram 索引
+    assert ngram_candidates(Book, ('title',), 'python') is None
+
+
+def test_ngram_postings_follow_title_changes(app_context, scratch_category):
+    category_id, _ = scratch_category
+    book = add_book(category_id, '9787300009018', title='三体问题', description='科幻小说')
+
+    def postings(field):
+        return {gram for (gram,) in db.session.query(SearchGram.gram).filter_by(
+            entity='books', entity_id=book.id, field=field)}
+
+    assert postings('title') == make_ngrams('三体问题')
+    book.title = '球状闪电'
+    db.session.commit()
+    assert postings('title') == make_ngrams('球状闪电')
+    # 未修改的字段保持不变
+    assert postings('description') == make_ngrams('科幻小说')
+    assert substring_ids(category_id, '三体') == []
+    assert substring_ids(category_id, '闪电') == [book.id]
+
+    BookCopy.query.filter_by(book_id=book.id).delete()
+    db.session.delete(book)
+    db.session.commit()
+    assert db.session.query(SearchGram).filter_by(entity='books', entity_id=book.id).count() == 0
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求级 SQL 剖析测试：响应头、慢请求日志和慢查询报告
+"""
+
+import json
+
+import pytest
+
+from instrumentation import RequestProfile, SlowQueryReport, count_queries, normalize_statement, sql_report
+
+
+@pytest.fixture
+def profiling_config(app):
+    saved = {key: app.config.get(key) for key in ('SQL_PROFILE_HEADERS', 'SLOW_REQUEST_DB_MS', 'SLOW_QUERY_MS')}
+    yield app.config
+    app.config.update(saved)
+
+
+def test_headers_report_statement_count(admin_client, profiling_config):
+    profiling_config['SQL_PROFILE_HEADERS'] = True
+    with count_queries() as counter:
+        response = admin_client.get('/admin/records')
+    assert response.status_code == 200
+    assert int(response.headers['X-SQL-Count']) == counter.count
+    assert float(response.headers['X-SQL-Time-Ms']) >= 0
+
+
+def test_headers_follow_debug_by_default(admin_client, profiling_config):
+    profiling_config['SQL_PROFILE_HEADERS'] = None
+    assert 'X-SQL-Count' not in admin_client.get('/admin/records').headers
+
+
+def test_slow_request_is_logged_as_json(app, admin_client, profiling_config, caplog):
+    profiling_config.update(SLOW_REQUEST_DB_MS=0)
+    with caplog.at_level('WARNING', logger=app.logger.name):
+        admin_client.get('/admin/records?search=Python&search_type=book')
+    lines = [record.getMessage() for record in caplog.records if record.getMessage().startswith('slow_request ')]
+    assert lines
+    payload = json.loads(lines[-1][len('slow_request '):])
+    assert payload['endpoint'] == 'admin_borrow_records'
+    assert payload['statements'] >= 1
+    assert payload['slowest'] and 'borrow_records' in ' '.join(item['sql'] for item in payload['slowest'])
+
+
+def test_fast_request_is_not_logged(app, admin_client, profiling_config, caplog):
+    profiling_config.update(SLOW_REQUEST_DB_MS=10 ** 6, SLOW_QUERY_MS=10 ** 6)
+    with caplog.at_level('WARNING', logger=app.logger.name):
+        admin_client.get('/admin/dashboard')
+    assert not [record for record in caplog.records if record.getMessage().startswith('slow_request ')]
+
+
+def test_sql_report_endpoint(admin_client, user_client):
+    sql_report.clear()
+    admin_client.get('/admin/records')
+    report = admin_client.get('/admin/sql-report?limit=5').get_json()
+    assert 0 < len(report['statements']) <= 5
+    assert any('admin_borrow_records' in item['endpoints'] for item in report['statements'])
+    assert user_client.get('/admin/sql-report').status_code == 403
+
+
+def test_report_merges_in_lists_and_evicts_cheapest():
+    report = SlowQueryReport(max_statements=2)
+    profile = RequestProfile()
+    profile.timings = [(0.010, 'SELECT * FROM books WHERE id IN (?, ?)'),
+                       (0.020, 'SELECT * FROM books WHERE id IN (?, ?, ?)'),
+                       (0.001, 'SELECT 1')]
+    report.add(profile, 'browse_books')
+    top = report.top()
+    assert top[0]['statement'] == normalize_statement('SELECT * FROM books WHERE id IN (?, ?)')
+    assert top[0]['calls'] == 2 and top[0]['max_ms'] == 20.0
+
+    profile.timings = [(0.005, 'SELECT 2')]
+    report.add(profile)
+    assert [item['statement'] for item in report.top()] == [top[0]['statement'], 'SELECT 2']
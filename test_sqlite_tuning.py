@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 运行参数测试：production 配置的 PRAGMA 在应用的连接上生效
+"""
+
+from models import db
+from sqlite_tuning import sqlite_pragmas
+
+
+def test_production_pragmas_applied(app_context):
+    with db.engine.connect() as connection:
+        pragmas = sqlite_pragmas(connection)
+    assert pragmas['journal_mode'] == 'wal'
+    assert pragmas['synchronous'] == 1  # NORMAL
+    assert pragmas['busy_timeout'] == 5000
+    assert pragmas['temp_store'] == 2  # MEMORY
+    assert pragmas['cache_size'] == -64 * 1024
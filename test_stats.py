@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+仪表板计数测试：借还、批量归还、删除读者和强制删除分类之后，维护的计数与重新统计的结果一致；
+读取仪表板不写数据库，新到期的逾期记录由 advance_overdue_count 累加
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from circulation import lend_book, return_record
+from instrumentation import count_queries
+from models import db, Book, BorrowRecord, Category, LibraryStats, User
+from stats import STATS_ID, advance_overdue_count, get_library_stats, reconcile_library_stats
+
+
+def test_maintained_counters_match_reconcile(app, admin_client, scratch_category, monkeypatch):
+    # 每次读取都统计新到期的记录，与重新统计使用同一时刻的口径
+    monkeypatch.setitem(app.config, 'STATS_OVERDUE_REFRESH', 0)
+    scratch_id, _ = scratch_category
+    with app.app_context():
+        before = reconcile_library_stats()
+
+        category = Category(name='计数测试分类', description='强制删除')
+        users = [User(username=f'计数测试读者{i}', email=f'stats-reader{i}@example.com', full_name='计数测试读者',
+                      password_hash='-') for i in range(2)]
+        db.session.add(category)
+        db.session.add_all(users)
+        db.session.flush()
+        books = [Book(title=f'计数测试之书{i}', author='测试', isbn=isbn, quantity=3, available_quantity=3,
+                      category_id=category.id)
+                 for i, isbn in enumerate(('9787300009100', '9787300009117'))]
+        db.session.add_all(books)
+        db.session.commit()
+        category_id = category.id
+        book_ids = [book.id for book in books]
+        keeper, leaver = [user.id for user in users]
+
+        # 借出，其中一条借出时已经逾期
+        return_record(lend_book(keeper, book_ids[0]))
+        batch = [lend_book(keeper, book_ids[0]).id, lend_book(keeper, book_ids[1], loan_days=-1).id]
+        lend_book(leaver, book_ids[0], loan_days=-2)
+        lend_book(leaver, book_ids[1])
+
+    # 批量归还（含一条逾期记录），删除仍有在借记录的读者，强制删除有图书的分类
+    response = admin_client.post('/admin/records/batch-return', json={'record_ids': batch})
+    assert response.get_json()['success_count'] == 2
+    admin_client.get(f'/admin/users/delete/{leaver}')
+    admin_client.get(f'/admin/categories/force-delete/{category_id}')
+
+    with app.app_context():
+        assert db.session.get(Category, category_id) is None
+        stats = get_library_stats()
+        assert stats == reconcile_library_stats()
+        # 新增的两本书和留下的一位读者，其余计数回到原值
+        assert stats == dict(before, total_books=before['total_books'] + 2, total_users=before['total_users'] + 1)
+
+        # 清理：图书移回测试分类由夹具删除，剩下的读者和借阅记录直接删除
+        Book.query.filter(Book.id.in_(book_ids)).update({Book.category_id: scratch_id})
+        BorrowRecord.query.filter_by(user_id=keeper).delete()
+        db.session.delete(db.session.get(User, keeper))
+        db.session.commit()
+        assert get_library_stats() == reconcile_library_stats() == dict(before, total_books=before['total_books'] + 2)
+
+
+def rewind_overdue_check(days):
+    """把逾期计数的推进时间退回 days 天前，计数只保留那之前到期的在借记录"""
+    checked_at = datetime.utcnow() - timedelta(days=days)
+    counted = BorrowRecord.query.filter(BorrowRecord.status == 'borrowed', BorrowRecord.due_date < checked_at).count()
+    db.session.execute(update(LibraryStats).where(LibraryStats.id == STATS_ID)
+                       .values(overdue_checked_at=checked_at, overdue_records=counted))
+    db.session.commit()
+    return checked_at, counted
+
+
+def test_reading_stats_does_not_write(app, admin_client, scratch_category, monkeypatch):
+    monkeypatch.setitem(app.config, 'STATS_OVERDUE_REFRESH', 0)
+    category_id, _ = scratch_category
+    with app.app_context():
+        book = Book(title='逾期计数测试之书', author='测试', isbn='9787300009124', quantity=1, available_quantity=1,
+                    category_id=category_id)
+        db.session.add(book)
+        db.session.commit()
+        book_id = book.id
+        record_id = lend_book(User.query.filter_by(username='reader1').one().id, book_id, loan_days=-1).id
+        # 一段时间没有借还：这条一天前到期的记录还不在计数中
+        _, stored = rewind_overdue_check(days=2)
+
+        stats = get_library_stats()
+        overdue = BorrowRecord.query.filter(BorrowRecord.status == 'borrowed',
+                                            BorrowRecord.due_date < datetime.utcnow()).count()
+        assert stats['overdue_records'] == overdue > stored
+
+    with count_queries() as counter:
+        assert admin_client.get('/admin/dashboard').status_code == 200
+        assert admin_client.get('/metrics').status_code == 200
+    assert not [statement for statement in counter.statements
+                if statement.lstrip().upper().startswith(('UPDATE', 'INSERT', 'DELETE'))], counter.statements
+
+    with app.app_context():
+        row = db.session.get(LibraryStats, STATS_ID)
+        assert row.overdue_records == stored
+        assert advance_overdue_count() == overdue - stored
+        db.session.refresh(row)
+        assert row.overdue_records == overdue
+        assert get_library_stats() == stats == reconcile_library_stats()
+
+        # 归还时的计数调整顺带推进逾期计数
+        checked_at, _ = rewind_overdue_check(days=2)
+        return_record(db.session.get(BorrowRecord, record_id))
+        row = db.session.get(LibraryStats, STATS_ID)
+        assert row.overdue_checked_at > checked_at
+        assert row.overdue_records == overdue - 1
+        assert get_library_stats() == reconcile_library_stats()
+
+        BorrowRecord.query.filter_by(book_id=book_id).delete()
+        db.session.commit()
@@ -3,6 +3,9 @@
 """
 VS Code 图书管理系统启动脚本
 解决 VS Code 中无法运行的问题
+
+启动时不连接数据库。首次运行先执行 `flask --app wsgi init-db`（可选 `flask --app wsgi seed`），
+或用 `python vscode_start.py --init` 在启动前执行这两步。
 """
 
 import os
@@ -29,69 +32,24 @@ def main():
         sys.path.insert(0, current_dir)
 
     try:
-        # 导入应用和数据库
-        from app import app
-        from models import db
-
-        print("正在初始化数据库...")
-        with app.app_context():
-            # 创建所有表
-            db.create_all()
-            print("[OK] 数据库表创建成功")
-
-            # 检查是否有管理员
-            from models import Admin
-            if not Admin.query.first():
-                print("正在创建默认管理员...")
-                admin = Admin(
-                    username='admin',
-                    email='admin@library.com'
-                )
-                admin.set_password('admin123')
-                db.session.add(admin)
-                db.session.commit()
-                print("[OK] 默认管理员创建成功 (admin/admin123)")
-
-            # 检查是否有测试用户
-            from models import User
-            if not User.query.filter_by(username='testuser').first():
-                print("正在创建测试用户...")
-                test_user = User(
-                    username='testuser',
-                    email='test@example.com',
-                    full_name='测试用户',
-                    phone='13800138000',
-                    address='测试地址'
-                )
-                test_user.set_password('test123')
-                db.session.add(test_user)
-                db.session.commit()
-                print("[OK] 测试用户创建成功 (testuser/test123)")
-
-            # 检查是否有分类
-            from models import Category
-            if not Category.query.first():
-                print("正在创建默认分类...")
-                default_categories = [
-                    {'name': '文学小说', 'description': '各类文学作品和小说'},
-                    {'name': '科学技术', 'description': '科学、技术、工程类图书'},
-                    {'name': '经济管理', 'description': '经济、管理、商业类图书'},
-                    {'name': '教育学习', 'description': '教材、教辅、学习资料'},
-                    {'name': '艺术设计', 'description': '艺术、设计、创意类图书'}
-                ]
-
-                for cat_data in default_categories:
-                    category = Category(**cat_data)
-                    db.session.add(category)
-
-                db.session.commit()
-                print("✓ 默认分类创建成功")
+        # 只构建应用对象，不连接数据库
+        from app import create_app
+        app = create_app()
+
+        # 加 --init 时先建表、创建默认管理员并写入示例数据；重载器启动的子进程不再重复
+        if '--init' in sys.argv[1:] and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+            from cli import init_database, seed_sample_data
+            print("正在初始化数据库...")
+            with app.app_context():
+                init_database()
+                seed_sample_data()
 
         print("\n" + "=" * 50)
         print("启动信息:")
         print(f"访问地址: http://localhost:5000")
         print(f"管理员账号: admin / admin123")
         print(f"测试用户: testuser / test123")
+        print("首次运行请先执行: flask --app wsgi init-db，或加 --init 启动")
         print("=" * 50)
         print("\n正在启动服务器...")
         print("按 Ctrl+C 停止服务器\n")
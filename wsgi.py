@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WSGI 入口，供 gunicorn 等生产服务器使用：
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+数据库表需事先用 `flask --app wsgi init-db` 创建，这里只构建应用对象，不连接数据库。
+"""
+
+from app import app as application